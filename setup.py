@@ -30,12 +30,14 @@ CLASSIFIERS = [
     "Operating System :: POSIX :: Linux",
     "Programming Language :: Python :: 3.6",
 ]
-INSTALL_REQUIRES = ['zeep', 'lxml', 'python-dateutil', 'PyMySQL', 'requests', 'PyGeodesy', 'SQLAlchemy']
+INSTALL_REQUIRES = ['zeep', 'lxml', 'python-dateutil', 'PyMySQL', 'requests', 'PyGeodesy', 'SQLAlchemy', 'numpy']
 
 SETUP_REQUIRES = ['pytest-runner']
 
 TESTS_REQUIRE = ['pytest', 'pytest-cov', 'mypy', 'Sphinx', 'sqlalchemy-utils']
 
+EXTRAS_REQUIRE = {'fast-json': ['orjson']}
+
 HERE = os.path.abspath(os.path.dirname(__file__))
 
 
@@ -98,11 +100,14 @@ if __name__ == '__main__':
         install_requires=INSTALL_REQUIRES,
         setup_requires=SETUP_REQUIRES,
         tests_require=TESTS_REQUIRE,
+        extras_require=EXTRAS_REQUIRE,
         include_package_data=True,
         entry_points={
             'console_scripts': [
                 'calculations = AviationWeather.__main__:calc',
-                'converter = AviationWeather.__main__:conv'
+                'converter = AviationWeather.__main__:conv',
+                'calculations-batch = AviationWeather.__main__:calc_batch',
+                'calculations-service = AviationWeather.__main__:calc_service',
             ]
         },
     )
@@ -1,5 +1,5 @@
 # coding=utf-8
-from . import calculations, converter
+import importlib
 
 __version__ = '0.1.3'
 
@@ -13,3 +13,14 @@ __email__ = "tweyter@gmail.com"
 
 __license__ = "Proprietary"
 __copyright__ = "Copyright (c) 2018 Thorsten Weyter"
+
+
+# The programs' modules import zeep, SQLAlchemy, numpy and the like, so they are only
+# imported when first used.
+_SUBMODULES = {'calculations', 'converter'}
+
+
+def __getattr__(name: str):
+    if name in _SUBMODULES:
+        return importlib.import_module(f'.{name}', __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,11 +1,21 @@
 import sys
 
-from AviationWeather import calculations, converter
-
 
 def calc():
+    from AviationWeather import calculations
     calculations.main()
 
 
 def conv():
+    from AviationWeather import converter
     converter.main(sys.argv)
+
+
+def calc_batch():
+    from AviationWeather import batch
+    batch.main(sys.argv)
+
+
+def calc_service():
+    from AviationWeather import service
+    service.main(sys.argv)
@@ -0,0 +1,312 @@
+"""
+In-memory snapshots of AirSigmets for route checks.
+
+An AdvisorySnapshot holds a set of AirSigmets, detached from their database session,
+with their validity times, altitude limits and polygons packed into numpy arrays. Each
+polygon also has a bounding cap, a centre and an angular radius, which is used to skip
+AirSigmets nowhere near a route before any route segment is tested against polygon
+edges.
+
+A route intersects an AirSigmet if one of its segments crosses the AirSigmet's boundary,
+or if the route lies inside it. Given the flight's departure and arrival times, each
+segment is only tested against the AirSigmets valid while the aircraft is flying it,
+assuming a constant ground speed along the route. Given the flight's cruise altitude,
+each segment is also only tested against the AirSigmets whose altitude band overlaps the
+altitudes flown on it.
+
+Given a corridor width, AirSigmets that come within that distance of the route count
+too. The bounding caps are widened by the corridor, so only AirSigmets near the route
+have their edges and vertices measured against it.
+
+A snapshot can also have a hazards.HazardGrid of the same AirSigmets attached, in which
+case only the route segments passing through the grid's marked cells are checked.
+"""
+import math
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from pygeodesy.sphericalNvector import LatLon
+from sqlalchemy.orm import Session, subqueryload
+
+from . import geometry
+from .serialization import epoch_seconds
+from .routes import Route, as_route
+from .sql_classes import AirSigmet
+
+
+class AdvisorySnapshot:
+    """
+    AirSigmets and their packed geometry.
+
+    :param airsigs: AirSigmets with their areas loaded.
+    :param generation: The airsigmet ingest generation the AirSigmets were loaded at.
+    :param coverage_start: Epoch time from which the snapshot holds every AirSigmet in
+        effect. Flights departing earlier have to be checked against the database.
+    """
+
+    ARRAYS = (
+        'valid_from', 'valid_to', 'min_altitude_ft', 'max_altitude_ft', 'vertices', 'offsets', 'centers', 'radii',
+    )
+
+    def __init__(
+            self,
+            airsigs: Sequence[AirSigmet],
+            generation: Optional[int] = None,
+            coverage_start: float = -math.inf,
+    ):
+        self.airsigs: List[AirSigmet] = list(airsigs)
+        self.generation = generation
+        self.coverage_start = coverage_start
+        self.grid = None
+        self.valid_from = np.array([
+            epoch_seconds(x.valid_time_from) if x.valid_time_from is not None else -math.inf for x in self.airsigs
+        ], dtype=np.float64)
+        self.valid_to = np.array([
+            epoch_seconds(x.valid_time_to) if x.valid_time_to is not None else math.inf for x in self.airsigs
+        ], dtype=np.float64)
+        self.min_altitude_ft = np.array([
+            x.altitude__min_ft_msl if x.altitude__min_ft_msl is not None else -math.inf for x in self.airsigs
+        ], dtype=np.float64)
+        self.max_altitude_ft = np.array([
+            x.altitude__max_ft_msl if x.altitude__max_ft_msl is not None else math.inf for x in self.airsigs
+        ], dtype=np.float64)
+
+        lats: List[float] = []
+        lons: List[float] = []
+        offsets = [0]
+        for airsig in self.airsigs:
+            for point in airsig.area:
+                if point.latitude is not None and point.longitude is not None:
+                    lats.append(point.latitude)
+                    lons.append(point.longitude)
+            offsets.append(len(lats))
+        self.vertices = geometry.to_unit_vectors(lats, lons).reshape(-1, 3)
+        self.offsets = np.array(offsets, dtype=np.int64)
+
+        self.centers = np.zeros((len(self.airsigs), 3))
+        self.radii = np.full(len(self.airsigs), -1.0)
+        for index in range(len(self.airsigs)):
+            vertices = self.polygon(index)
+            if not len(vertices):
+                continue
+            center = vertices.sum(axis=0)
+            norm = np.linalg.norm(center)
+            if norm < 1e-9:
+                self.centers[index] = vertices[0]
+                self.radii[index] = math.pi
+                continue
+            self.centers[index] = center / norm
+            self.radii[index] = geometry.angular_distance(vertices, self.centers[index]).max()
+
+    def __len__(self) -> int:
+        return len(self.valid_from)
+
+    def polygon(self, index: int) -> np.ndarray:
+        """
+        The polygon vertex unit vectors of an AirSigmet.
+        """
+        return self.vertices[self.offsets[index]:self.offsets[index + 1]]
+
+    def covers(self, departure: float) -> bool:
+        """
+        Whether the snapshot holds every AirSigmet for a flight departing at this time.
+        """
+        return departure >= self.coverage_start
+
+    def active(self, departure: float, arrival: float) -> np.ndarray:
+        """
+        Mask of the AirSigmets valid at any time between departure and arrival.
+        """
+        return (self.valid_to >= departure) & (self.valid_from <= arrival)
+
+    def between(self, departure: float, arrival: float) -> List[AirSigmet]:
+        """
+        The AirSigmets valid at any time between departure and arrival.
+        """
+        return [self.airsigs[i] for i in np.flatnonzero(self.active(departure, arrival))]
+
+    def intersecting(
+            self,
+            route: Route,
+            mask: Optional[np.ndarray] = None,
+            enter: Optional[np.ndarray] = None,
+            leave: Optional[np.ndarray] = None,
+            low: Optional[np.ndarray] = None,
+            high: Optional[np.ndarray] = None,
+            corridor: float = 0.0,
+            segments: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Find the AirSigmets a route passes through, or passes within corridor of.
+
+        :param route: The route.
+        :param mask: Only test the AirSigmets selected by this mask.
+        :param enter: Epoch times the aircraft enters each segment, see Route.segment_windows().
+            If given with leave, a segment is only tested against AirSigmets valid while
+            the aircraft is on it.
+        :param leave: Epoch times the aircraft leaves each segment.
+        :param low: Lowest altitude flown on each segment in feet MSL, see Route.altitude_bands().
+            If given with high, a segment is only tested against AirSigmets whose altitude
+            band overlaps the altitudes flown on it.
+        :param high: Highest altitude flown on each segment in feet MSL.
+        :param corridor: Corridor half width in radians, see geometry.nm_to_radians().
+        :param segments: Only test the route segments selected by this mask.
+        :return: Indexes of the intersected AirSigmets, in snapshot order.
+        """
+        candidates = np.flatnonzero(self.radii >= 0 if mask is None else mask & (self.radii >= 0))
+        if not len(candidates) or not len(route):
+            return np.array([], dtype=np.int64)
+        starts, ends, normals = route.starts, route.ends, route.normals
+        if segments is not None:
+            flown = np.flatnonzero(segments)
+            starts, ends, normals = starts[flown], ends[flown], normals[flown]
+            enter, leave, low, high = (None if x is None else x[flown] for x in (enter, leave, low, high))
+        pairs = None
+        if low is not None and high is not None:
+            pairs = (self.min_altitude_ft[candidates, None] <= high) & (self.max_altitude_ft[candidates, None] >= low)
+        if enter is not None and leave is not None:
+            in_time = (self.valid_to[candidates, None] >= enter) & (self.valid_from[candidates, None] <= leave)
+            pairs = in_time if pairs is None else pairs & in_time
+        if pairs is not None:
+            remaining = pairs.any(axis=1)
+            candidates, pairs = candidates[remaining], pairs[remaining]
+            if not len(candidates):
+                return np.array([], dtype=np.int64)
+        distances = geometry.arc_distance(self.centers[candidates], starts, ends, normals)
+        near = distances <= self.radii[candidates, None] + corridor
+        if pairs is not None:
+            near &= pairs
+        hits = []
+        for index, flown in zip(candidates, near):
+            if not flown.any():
+                continue
+            if self._intersects(index, starts[flown], ends[flown], normals[flown], corridor):
+                hits.append(index)
+        return np.array(hits, dtype=np.int64)
+
+    def _intersects(
+            self,
+            index: int,
+            starts: np.ndarray,
+            ends: np.ndarray,
+            normals: np.ndarray,
+            corridor: float = 0.0,
+    ) -> bool:
+        vertices = self.polygon(index)
+        edge_ends = np.roll(vertices, -1, axis=0)
+        if len(vertices) > 1:
+            if geometry.arcs_cross(starts, ends, vertices, edge_ends, normals).any():
+                return True
+        if len(vertices) >= 3 and self._inside(index, vertices, starts):
+            return True
+        if corridor <= 0:
+            return False
+        return bool((geometry.arcs_distance(starts, ends, vertices, edge_ends, normals) <= corridor).any())
+
+    def _inside(self, index: int, vertices: np.ndarray, starts: np.ndarray) -> bool:
+        # No boundary crossings, so each segment is either wholly inside or wholly outside.
+        polygon, valid = geometry.gnomonic(vertices, self.centers[index])
+        if not valid.all():
+            return False
+        points, in_hemisphere = geometry.gnomonic(starts, self.centers[index])
+        return bool(geometry.points_in_polygon(points[in_hemisphere], polygon).any())
+
+    def find_intersecting(
+            self,
+            route: Union[Route, Sequence[Tuple[LatLon, LatLon]]],
+            departure: Optional[float] = None,
+            arrival: Optional[float] = None,
+            altitude: Union[float, Tuple[np.ndarray, np.ndarray], None] = None,
+            corridor_nm: float = 0.0,
+    ) -> List[AirSigmet]:
+        """
+        The AirSigmets a route passes through, or passes within corridor_nm of.
+
+        :param route: The route, or its segments as returned by calculations.get_flight_route_data.
+        :param departure: If given with arrival, each segment is only checked against the
+            AirSigmets valid while the aircraft is on it.
+        :param arrival: The flight's arrival time.
+        :param altitude: The flight's cruise altitude in feet MSL, or the lowest and highest
+            altitudes flown on each segment. If given, each segment is only checked against
+            the AirSigmets whose altitude band overlaps the altitudes flown on it.
+        :param corridor_nm: Also return the AirSigmets within this many nautical miles of the route.
+        :return: The intersected AirSigmets.
+        """
+        return [self.airsigs[i] for i in self.find_indexes(route, departure, arrival, altitude, corridor_nm)]
+
+    def find_indexes(
+            self,
+            route: Union[Route, Sequence[Tuple[LatLon, LatLon]]],
+            departure: Optional[float] = None,
+            arrival: Optional[float] = None,
+            altitude: Union[float, Tuple[np.ndarray, np.ndarray], None] = None,
+            corridor_nm: float = 0.0,
+    ) -> np.ndarray:
+        """
+        Like find_intersecting(), but returns the indexes of the intersected AirSigmets.
+        """
+        route = as_route(route)
+        mask = enter = leave = low = high = None
+        if departure is not None and arrival is not None:
+            mask = self.active(departure, arrival)
+            enter, leave = route.segment_windows(departure, arrival)
+        if isinstance(altitude, tuple):
+            low, high = altitude
+        elif altitude is not None:
+            low, high = route.altitude_bands(altitude)
+        segments = None
+        if self.grid is not None and corridor_nm <= 0:
+            segments = self.grid.positive_segments(route, low, high)
+            if not segments.any():
+                return np.array([], dtype=np.int64)
+        corridor = geometry.nm_to_radians(max(corridor_nm, 0.0))
+        return self.intersecting(route, mask, enter, leave, low, high, corridor, segments)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """
+        The packed arrays, which are all the route checks need.
+        """
+        return {name: getattr(self, name) for name in self.ARRAYS}
+
+    @classmethod
+    def from_arrays(
+            cls,
+            arrays: Dict[str, np.ndarray],
+            generation: Optional[int] = None,
+            coverage_start: float = -math.inf,
+    ) -> "AdvisorySnapshot":
+        """
+        Rebuild a snapshot from its arrays(), without the AirSigmets themselves.
+
+        The arrays are used as given, so they can be memory mapped. Only find_indexes()
+        and the methods returning masks and indexes can be used.
+        """
+        snapshot = cls.__new__(cls)
+        snapshot.airsigs = []
+        snapshot.generation = generation
+        snapshot.coverage_start = coverage_start
+        snapshot.grid = None
+        for name in cls.ARRAYS:
+            setattr(snapshot, name, arrays[name])
+        return snapshot
+
+
+def load_snapshot(session: Session, coverage_start: float, generation: Optional[int] = None) -> AdvisorySnapshot:
+    """
+    Load every AirSigmet still in effect at or after coverage_start.
+
+    The AirSigmets are detached from the session, so it can be closed once the snapshot
+    is loaded.
+
+    :param session: Database session to load from.
+    :param coverage_start: Epoch time.
+    :param generation: The airsigmet ingest generation being loaded.
+    :return: The snapshot.
+    """
+    airsigs = session.query(AirSigmet).\
+        filter(AirSigmet.valid_time_to >= datetime.utcfromtimestamp(coverage_start)).\
+        options(subqueryload(AirSigmet.area)).\
+        all()
+    session.expunge_all()
+    return AdvisorySnapshot(airsigs, generation, coverage_start)
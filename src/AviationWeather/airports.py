@@ -0,0 +1,284 @@
+"""
+Compiled airport database.
+
+The airport CSV files in the static directory are compiled into a single binary
+index (static/airports.idx) that holds sorted ICAO and IATA keys and float32
+latitude, longitude and elevation arrays. The index is memory mapped the first
+time an airport is looked up, so importing this module costs nothing.
+
+To rebuild the index after updating either CSV file::
+
+    python -m AviationWeather.airports
+"""
+import csv
+import mmap
+import os.path
+import struct
+import sys
+import threading
+import logging
+from array import array
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STATIC_PATH = os.path.join(os.path.dirname(__file__), "static")
+INDEX_PATH = os.path.join(STATIC_PATH, "airports.idx")
+SOURCES = (
+    os.path.join(STATIC_PATH, "airports.csv"),
+    os.path.join(STATIC_PATH, "global_airport_database.csv"),
+)
+
+MAGIC = b"AVWXAPT1"
+HEADER = struct.Struct("<8sIII")
+ICAO_WIDTH = 4
+IATA_WIDTH = 3
+
+
+class Airport(NamedTuple):
+    latitude: float
+    longitude: float
+    elevation_ft: float
+
+
+def _padded(size: int) -> int:
+    return (size + 3) & ~3
+
+
+def read_airports_csv(path: str) -> Iterator[Tuple[str, str, float, float, float]]:
+    """
+    Read the OpenFlights formatted airports.csv file.
+
+    :param path: Path to the csv file.
+    :return: ICAO, IATA, latitude, longitude and elevation for each airport.
+    """
+    with open(path, encoding="utf-8") as file:
+        for line in csv.reader(file, delimiter=',', quotechar='"'):
+            try:
+                yield line[5], line[4], float(line[6]), float(line[7]), float(line[8])
+            except (IndexError, ValueError):
+                continue
+
+
+def read_global_airport_database(path: str) -> Iterator[Tuple[str, str, float, float, float]]:
+    """
+    Read the colon separated global_airport_database.csv file.
+
+    Positions are stored as degrees, minutes, seconds and hemisphere. Airports with
+    an unknown ('U') hemisphere have no usable position and are skipped.
+
+    :param path: Path to the csv file.
+    :return: ICAO, IATA, latitude, longitude and elevation for each airport.
+    """
+    with open(path, encoding="utf-8", errors="replace") as file:
+        for line in file:
+            fields = line.rstrip("\n").split(":")
+            if len(fields) < 14 or fields[8] not in "NS" or fields[12] not in "EW":
+                continue
+            try:
+                lat = int(fields[5]) + int(fields[6]) / 60 + int(fields[7]) / 3600
+                lon = int(fields[9]) + int(fields[10]) / 60 + int(fields[11]) / 3600
+                elevation = float(fields[13])
+            except ValueError:
+                continue
+            if fields[8] == "S":
+                lat = -lat
+            if fields[12] == "W":
+                lon = -lon
+            yield fields[0], fields[1], lat, lon, elevation
+
+
+def compile_index(sources: Tuple[str, ...] = SOURCES) -> bytes:
+    """
+    Compile the airport CSV files into the binary index format.
+
+    Earlier sources take precedence when an identifier appears in more than one file.
+
+    :param sources: airports.csv formatted file first, then global_airport_database.csv formatted files.
+    :return: The binary index.
+    """
+    readers = [read_airports_csv] + [read_global_airport_database] * (len(sources) - 1)
+    lats, lons, elevations = array("f"), array("f"), array("f")
+    icao: Dict[bytes, int] = {}
+    iata: Dict[bytes, int] = {}
+    for reader, source in zip(readers, sources):
+        for icao_code, iata_code, lat, lon, elevation in reader(source):
+            icao_key = icao_code.strip().upper().encode("ascii", "ignore")
+            iata_key = iata_code.strip().upper().encode("ascii", "ignore")
+            new_icao = len(icao_key) == ICAO_WIDTH and icao_key.isalnum() and icao_key not in icao
+            new_iata = len(iata_key) == IATA_WIDTH and iata_key.isalnum() and iata_key not in iata
+            if not (new_icao or new_iata):
+                continue
+            row = len(lats)
+            lats.append(lat)
+            lons.append(lon)
+            elevations.append(elevation)
+            if new_icao:
+                icao[icao_key] = row
+            if new_iata:
+                iata[iata_key] = row
+
+    icao_keys = sorted(icao)
+    iata_keys = sorted(iata)
+    parts = [
+        HEADER.pack(MAGIC, len(lats), len(icao_keys), len(iata_keys)),
+        lats.tobytes(),
+        lons.tobytes(),
+        elevations.tobytes(),
+        b"".join(icao_keys),
+        array("I", [icao[key] for key in icao_keys]).tobytes(),
+    ]
+    iata_bytes = b"".join(iata_keys)
+    parts.append(iata_bytes.ljust(_padded(len(iata_bytes)), b"\0"))
+    parts.append(array("I", [iata[key] for key in iata_keys]).tobytes())
+    return b"".join(parts)
+
+
+class AirportIndex:
+    """
+    Read-only view over a compiled airport index.
+
+    Lookups binary search the sorted fixed-width key tables, so they are O(log n)
+    and never parse the source files.
+    """
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        view = memoryview(buffer)
+        magic, self.rows, self.icao_count, self.iata_count = HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError("Not a compiled airport index.")
+        offset = HEADER.size
+        self.latitude = view[offset:offset + 4 * self.rows].cast("f")
+        offset += 4 * self.rows
+        self.longitude = view[offset:offset + 4 * self.rows].cast("f")
+        offset += 4 * self.rows
+        self.elevation_ft = view[offset:offset + 4 * self.rows].cast("f")
+        offset += 4 * self.rows
+        self._icao_keys = offset
+        offset += ICAO_WIDTH * self.icao_count
+        self._icao_rows = view[offset:offset + 4 * self.icao_count].cast("I")
+        offset += 4 * self.icao_count
+        self._iata_keys = offset
+        offset += _padded(IATA_WIDTH * self.iata_count)
+        self._iata_rows = view[offset:offset + 4 * self.iata_count].cast("I")
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def _search(self, key: bytes, start: int, width: int, count: int) -> int:
+        low, high = 0, count
+        while low < high:
+            mid = (low + high) // 2
+            offset = start + mid * width
+            if self._buffer[offset:offset + width] < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low < count and self._buffer[start + low * width:start + (low + 1) * width] == key:
+            return low
+        return -1
+
+    def row(self, code: str) -> int:
+        """
+        Find the row number of an airport.
+
+        :param code: 4-letter ICAO or 3-letter IATA identifier.
+        :return: Row number, or -1 if the airport is not in the index.
+        """
+        key = code.strip().upper().encode("ascii", "ignore")
+        if len(key) == ICAO_WIDTH:
+            position = self._search(key, self._icao_keys, ICAO_WIDTH, self.icao_count)
+            return self._icao_rows[position] if position >= 0 else -1
+        if len(key) == IATA_WIDTH:
+            position = self._search(key, self._iata_keys, IATA_WIDTH, self.iata_count)
+            return self._iata_rows[position] if position >= 0 else -1
+        return -1
+
+    def get(self, code: str) -> Optional[Airport]:
+        """
+        Look up an airport.
+
+        :param code: 4-letter ICAO or 3-letter IATA identifier.
+        :return: The airport's position and elevation, or None if not found.
+        """
+        row = self.row(code)
+        if row < 0:
+            return None
+        return Airport(self.latitude[row], self.longitude[row], self.elevation_ft[row])
+
+    def icao_codes(self) -> List[str]:
+        """
+        All ICAO identifiers in the index, in sorted order.
+        """
+        start = self._icao_keys
+        return [
+            self._buffer[start + i * ICAO_WIDTH:start + (i + 1) * ICAO_WIDTH].decode("ascii")
+            for i in range(self.icao_count)
+        ]
+
+    def icao_rows(self) -> List[int]:
+        """
+        Row numbers matching icao_codes().
+        """
+        return self._icao_rows.tolist()
+
+
+_INDEX: Optional[AirportIndex] = None
+_INDEX_LOCK = threading.Lock()
+
+
+def load_index(path: str = INDEX_PATH) -> AirportIndex:
+    """
+    Memory map a compiled airport index.
+
+    If the index file does not exist it is compiled from the CSV files and written
+    to disk. If it can't be written, the compiled index is kept in memory instead.
+
+    :param path: Path of the compiled index.
+    :return: The airport index.
+    """
+    if not os.path.exists(path):
+        data = compile_index()
+        try:
+            with open(path, "wb") as file:
+                file.write(data)
+        except OSError:
+            logger.warning("Could not write airport index to %s; using an in-memory copy.", path)
+            return AirportIndex(data)
+    with open(path, "rb") as file:
+        return AirportIndex(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def get_index() -> AirportIndex:
+    """
+    The process wide airport index, loaded on first use.
+    """
+    global _INDEX
+    if _INDEX is None:
+        with _INDEX_LOCK:
+            if _INDEX is None:
+                _INDEX = load_index()
+    return _INDEX
+
+
+def lookup(code: str) -> Optional[Airport]:
+    """
+    Look up an airport by its ICAO or IATA identifier.
+
+    :param code: 4-letter ICAO or 3-letter IATA identifier.
+    :return: The airport's position and elevation, or None if not found.
+    """
+    return get_index().get(code)
+
+
+def main(args: List[str]):
+    path = args[1] if len(args) > 1 else INDEX_PATH
+    data = compile_index()
+    with open(path, "wb") as file:
+        file.write(data)
+    print(f"Wrote {len(AirportIndex(data))} airports to {path}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
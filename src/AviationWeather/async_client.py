@@ -0,0 +1,214 @@
+"""
+Asyncio wrapper around the FlightXML calls used by the calculations module.
+
+The wrapped SOAP client is blocking, so calls run on a thread pool. AsyncFlightAware
+bounds how many calls are in flight at once, spaces them out with a token bucket to
+stay within the FlightAware account's rate limit, and coalesces identical concurrent
+calls so they share one upstream request.
+
+Example::
+
+    async def routes(faflightids):
+        async with AsyncFlightAware.from_config(config) as flightaware:
+            return await flightaware.flight_routes(faflightids)
+"""
+import asyncio
+import configparser
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from . import calculations
+from .routes import Route
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_RATE = 5.0
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter.
+
+    :param rate: Tokens added per second.
+    :param capacity: Maximum tokens held, i.e. the largest burst allowed.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """
+        Wait until a token is available, then take it.
+        """
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+
+class AsyncFlightAware:
+    """
+    Concurrent, rate limited and coalesced FlightXML calls.
+
+    :param client: FlightAware SOAP client, as returned by calculations.get_flightaware_client.
+    :param concurrency: Maximum number of calls in flight at once.
+    :param rate: Maximum calls started per second.
+    :param burst: Maximum calls started back to back. Defaults to the rate.
+    """
+
+    def __init__(
+            self,
+            client,
+            concurrency: int = DEFAULT_CONCURRENCY,
+            rate: float = DEFAULT_RATE,
+            burst: Optional[float] = None,
+    ):
+        self.client = client
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._bucket = TokenBucket(rate, burst)
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self.upstream_calls = 0
+
+    @classmethod
+    def from_config(cls, config: configparser.ConfigParser, client=None) -> "AsyncFlightAware":
+        """
+        Create the wrapper with the limits set in the [flightaware.com] config section.
+
+        :param config: The parsed configuration.
+        :param client: FlightAware SOAP client. The process's shared client is used if not given.
+        """
+        return cls(client if client is not None else calculations.get_flightaware_client(config), **limits(config))
+
+    async def __aenter__(self) -> "AsyncFlightAware":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    async def _call(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        """
+        Run a blocking call, or join an identical call that is already in flight.
+        """
+        future = self._in_flight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+        future = asyncio.get_event_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            async with self._semaphore:
+                await self._bucket.acquire()
+                self.upstream_calls += 1
+                result = await asyncio.get_event_loop().run_in_executor(self._executor, function)
+        except BaseException as error:
+            future.set_exception(error)
+            # Mark the exception as retrieved in case no other caller joined.
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._in_flight[key]
+
+    async def flight_info_status(self, ident: str) -> dict:
+        """
+        FlightInfoStatus for a flight ident.
+        """
+        return await self._call(('FlightInfoStatus', ident), lambda: self.client.service.FlightInfoStatus(ident))
+
+    async def decode_flight_route(self, faflightid: str) -> dict:
+        """
+        DecodeFlightRoute for a faFlightID.
+        """
+        return await self._call(
+            ('DecodeFlightRoute', faflightid), lambda: self.client.service.DecodeFlightRoute(faflightid)
+        )
+
+    async def faflightid(self, ident: str, dep: str, arr: str, epoch: float = 0.0) -> Tuple[str, dict]:
+        """
+        The faFlightID and flight data, as returned by calculations.get_faflightid.
+        """
+        return calculations.choose_flight(await self.flight_info_status(ident), ident, dep, arr, epoch)
+
+    async def flight_route(self, faflightid: str) -> Optional[Route]:
+        """
+        The route for a faFlightID, as returned by calculations.get_flight_route.
+
+        Routes already in the process's route cache are returned without waiting for the
+        rate limit, and don't count as upstream calls.
+        """
+        route = calculations.cached_flight_route(faflightid)
+        if route is not None:
+            return route
+        return await self._call(
+            ('flight_route', faflightid), lambda: calculations.get_flight_route(self.client, faflightid)
+        )
+
+    async def flight_routes(self, faflightids: Iterable[str]) -> Dict[str, Optional[Route]]:
+        """
+        Routes for many flights at once.
+
+        :param faflightids: FlightAware flight IDs.
+        :return: Routes keyed by faFlightID, or None for flights without a route.
+        """
+        faflightids = list(dict.fromkeys(faflightids))
+        routes = await asyncio.gather(*(self.flight_route(x) for x in faflightids))
+        return dict(zip(faflightids, routes))
+
+
+def limits(config: configparser.ConfigParser) -> Dict[str, Any]:
+    """
+    The AsyncFlightAware limits set in the [flightaware.com] config section.
+
+    :param config: The parsed configuration.
+    :return: concurrency, rate and burst keyword arguments.
+    """
+    return {
+        'concurrency': config.getint('flightaware.com', 'max_concurrency', fallback=DEFAULT_CONCURRENCY),
+        'rate': config.getfloat('flightaware.com', 'requests_per_second', fallback=DEFAULT_RATE),
+        'burst': config.getfloat('flightaware.com', 'burst', fallback=None),
+    }
+
+
+def flight_routes(
+        config: configparser.ConfigParser,
+        faflightids: Iterable[str],
+        client=None,
+) -> Dict[str, Optional[Route]]:
+    """
+    Blocking helper that decodes many routes concurrently.
+
+    :param config: The parsed configuration.
+    :param faflightids: FlightAware flight IDs.
+    :param client: FlightAware SOAP client. The process's shared client is used if not given.
+    :return: Routes keyed by faFlightID, or None for flights without a route.
+    """
+    async def run():
+        async with AsyncFlightAware.from_config(config, client) as flightaware:
+            return await flightaware.flight_routes(faflightids)
+
+    loop = asyncio.new_event_loop()
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(run())
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
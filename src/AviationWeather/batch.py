@@ -0,0 +1,358 @@
+"""
+Evaluate weather for many flights in one process.
+
+Every flight in a batch shares one FlightAware client, one database session and one
+in-memory set of AirSigmets, and results are written as JSON lines as soon as each
+flight has been evaluated. Input is one flight per line, either as whitespace or comma
+separated fields or as a JSON list or object::
+
+    airsigmet DAL6404 JFK LAX 1551650700
+    ["taf", "DAL6404", "JFK", "LAX"]
+    {"wx_type": "metar", "flight": "DAL6404", "dep": "JFK", "arr": "LAX"}
+
+Usage::
+
+    calculations-batch [file]
+
+The flights are read from standard input if no file (or '-') is given.
+"""
+import asyncio
+import json
+import sys
+import logging
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+
+from sqlalchemy.orm import Session
+from zeep.exceptions import Fault
+
+from . import async_client, calculations, logging_setup, serialization, streaming
+from .advisories import AdvisorySnapshot
+from .async_client import AsyncFlightAware
+from .caching import LRUCache
+from .parallel import FlightRoute, IntersectionPool, default_workers
+from .settings import load_config
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('wx_type', 'flight', 'dep', 'arr', 'epoch')
+BLOCK_SIZE = 512
+
+
+class FlightRequest(NamedTuple):
+    wx_type: str
+    flight: str
+    dep: str
+    arr: str
+    epoch: float = 0.0
+
+
+def parse_request(line: str) -> FlightRequest:
+    """
+    Parse one line of batch input.
+
+    :param line: Whitespace or comma separated fields, or a JSON list or object.
+    :return: The flight request.
+    """
+    line = line.strip()
+    if line.startswith('{'):
+        data = json.loads(line)
+        fields = [data.get(x) for x in FIELDS if data.get(x) is not None]
+    elif line.startswith('['):
+        fields = json.loads(line)
+    else:
+        fields = line.replace(',', ' ').split()
+    cleaned = calculations.clean_args(['batch'] + [str(x) for x in fields])
+    if cleaned[0] == "":
+        raise ValueError(f'Invalid flight request: {line}')
+    return FlightRequest(*cleaned)
+
+
+def read_requests(lines: Iterable[str]) -> Iterator[FlightRequest]:
+    """
+    Parse batch input, skipping blank lines and comments.
+
+    Lines that can't be parsed are logged and skipped.
+
+    :param lines: Lines of batch input.
+    :return: The flight requests.
+    """
+    for number, line in enumerate(lines, 1):
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        try:
+            yield parse_request(line)
+        except ValueError:
+            logger.error(f'Skipping line {number} of batch input: {line.strip()}')
+
+
+class AirSigmetSet:
+    """
+    AirSigmets loaded once and shared by every flight in a batch.
+
+    The set covers the union of the time windows asked for so far, held as an
+    AdvisorySnapshot. The database is only queried again when a flight falls outside of
+    that window.
+    """
+
+    def __init__(self, session: Session):
+        self.session = session
+        self.departure: Optional[float] = None
+        self.arrival: Optional[float] = None
+        self.snapshot = AdvisorySnapshot([])
+
+    def between(self, departure: float, arrival: float) -> AdvisorySnapshot:
+        """
+        AirSigmets meeting the airsigmets() search criteria for a flight.
+
+        :param departure: The departure time of the flight being checked.
+        :param arrival: The arrival time of the flight being checked.
+        :return: A snapshot covering that flight. It may also hold AirSigmets outside of
+            the flight's time window.
+        """
+        if self.departure is None or departure < self.departure or arrival > self.arrival:
+            self.departure = departure if self.departure is None else min(departure, self.departure)
+            self.arrival = arrival if self.arrival is None else max(arrival, self.arrival)
+            self.snapshot = AdvisorySnapshot(
+                calculations.airsigmets(self.session, arrival=self.arrival, departure=self.departure),
+                calculations.data_generation(self.session, 'airsigmet'),
+                self.departure,
+            )
+        return self.snapshot
+
+
+def evaluate_batch(
+        requests: Iterable[FlightRequest],
+        client,
+        session: Session,
+        cache: Optional[LRUCache] = None,
+        workers: int = 1,
+        corridor_nm: float = calculations.DEFAULT_CORRIDOR_NM,
+        flightaware_limits: Optional[Dict[str, Any]] = None,
+) -> Iterator[dict]:
+    """
+    Evaluate the weather for each flight request.
+
+    FlightInfoStatus is only called once per distinct flight, however many weather
+    types are requested for it, and repeated requests reuse the computed result.
+
+    Requests are read in blocks. The FlightAware calls for every flight in a block are made
+    concurrently, within the flightaware_limits, before the block is evaluated. With more
+    than one worker, the AirSigmets crossed by every airsigmet request in a block are then
+    found by a pool of worker processes before the block's results are written.
+
+    :param requests: The flight requests.
+    :param client: FlightAware SOAP client.
+    :param session: The current database session.
+    :param cache: Results cache shared with other batches. A new one is used if not given.
+    :param workers: Number of processes checking routes against AirSigmets.
+    :param corridor_nm: Also report AirSigmets within this many nautical miles of a route.
+    :param flightaware_limits: AsyncFlightAware concurrency, rate and burst, see
+        async_client.limits(). The defaults are used if not given.
+    :return: One result record per request, in request order.
+    """
+    if cache is None:
+        cache = LRUCache()
+    flights: Dict[Tuple[str, str, str, float], Tuple[str, dict]] = {}
+    airsig_set = AirSigmetSet(session)
+    pool: Optional[IntersectionPool] = None
+    block_size = min(BLOCK_SIZE, cache.maxsize)
+    try:
+        for block in blocks(requests, block_size):
+            prefetch_flights(block, client, flights, flightaware_limits or {})
+            if workers > 1:
+                pool = prefetch_airsigmets(block, client, flights, airsig_set, cache, pool, workers, corridor_nm)
+            for request in block:
+                yield evaluate_request(request, client, session, flights, airsig_set, cache, corridor_nm)
+    finally:
+        if pool is not None:
+            pool.close()
+
+
+def blocks(requests: Iterable[FlightRequest], size: int) -> Iterator[List[FlightRequest]]:
+    requests = iter(requests)
+    while True:
+        block = list(islice(requests, size))
+        if not block:
+            return
+        yield block
+
+
+def evaluate_request(
+        request: FlightRequest,
+        client,
+        session: Session,
+        flights: Dict[Tuple[str, str, str, float], Tuple[str, dict]],
+        airsig_set: AirSigmetSet,
+        cache: LRUCache,
+        corridor_nm: float = calculations.DEFAULT_CORRIDOR_NM,
+) -> dict:
+    record = request._asdict()
+    try:
+        key = (request.flight, request.dep, request.arr, request.epoch)
+        if key not in flights:
+            flights[key] = calculations.get_faflightid(client, *key)
+        faflightid, flight_data = flights[key]
+        if not faflightid:
+            record['error'] = 'Flight not found.'
+            return record
+        record['faFlightID'] = faflightid
+        airsigs = None
+        if request.wx_type == 'airsigmet':
+            airsigs = airsig_set.between(*calculations.flight_window(flight_data))
+        record['result'] = calculations.flight_weather(
+            request.wx_type, faflightid, flight_data, client, session, airsigs, cache=cache, corridor_nm=corridor_nm
+        )
+    except (ValueError, Fault) as error:
+        record['error'] = str(error)
+    return record
+
+
+def prefetch_flights(
+        block: List[FlightRequest],
+        client,
+        flights: Dict[Tuple[str, str, str, float], Tuple[str, dict]],
+        limits: Dict[str, Any],
+):
+    """
+    Look up the flights in a block, and the routes of its airsigmet requests, concurrently.
+
+    Identical calls are made once, and every call is rate limited by an
+    async_client.AsyncFlightAware. Flights are stored in flights and routes in the route
+    cache used by calculations.get_flight_route(). Calls that fail here are left for
+    evaluate_request() to make again and report.
+
+    :param limits: AsyncFlightAware concurrency, rate and burst.
+    """
+    keys = list(dict.fromkeys(
+        (x.flight, x.dep, x.arr, x.epoch) for x in block
+        if (x.flight, x.dep, x.arr, x.epoch) not in flights or x.wx_type == 'airsigmet'
+    ))
+    routes = {(x.flight, x.dep, x.arr, x.epoch) for x in block if x.wx_type == 'airsigmet'}
+    if not keys:
+        return
+
+    async def lookup(flightaware: AsyncFlightAware, key: Tuple[str, str, str, float]):
+        if key not in flights:
+            try:
+                flights[key] = await flightaware.faflightid(*key)
+            except (ValueError, Fault):
+                return
+        faflightid = flights[key][0]
+        if faflightid and key in routes:
+            await flightaware.flight_route(faflightid)
+
+    async def run():
+        async with AsyncFlightAware(client, **limits) as flightaware:
+            await asyncio.gather(*(lookup(flightaware, key) for key in keys))
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+
+def prefetch_airsigmets(
+        block: List[FlightRequest],
+        client,
+        flights: Dict[Tuple[str, str, str, float], Tuple[str, dict]],
+        airsig_set: AirSigmetSet,
+        cache: LRUCache,
+        pool: Optional[IntersectionPool],
+        workers: int,
+        corridor_nm: float = calculations.DEFAULT_CORRIDOR_NM,
+) -> Optional[IntersectionPool]:
+    """
+    Find the AirSigmets crossed by the airsigmet requests in a block, in parallel, and
+    store them in the results cache for evaluate_request() to pick up.
+
+    Requests that fail here are left for evaluate_request() to report.
+
+    :param pool: The pool used for the previous block.
+    :return: The pool, which is started by the first block that needs it.
+    """
+    jobs = []
+    for request in block:
+        if request.wx_type != 'airsigmet':
+            continue
+        key = (request.flight, request.dep, request.arr, request.epoch)
+        try:
+            if key not in flights:
+                flights[key] = calculations.get_faflightid(client, *key)
+        except (ValueError, Fault):
+            continue
+        faflightid, flight_data = flights[key]
+        if not faflightid:
+            continue
+        route = calculations.get_flight_route(client, faflightid)
+        if route is not None:
+            jobs.append((faflightid, flight_data, route, calculations.flight_window(flight_data)))
+    if not jobs:
+        return pool
+    snapshot = airsig_set.between(min(x[3][0] for x in jobs), max(x[3][1] for x in jobs))
+    if snapshot.generation is None:
+        return pool
+    todo = {}
+    for faflightid, flight_data, route, window in jobs:
+        key = calculations.result_key(
+            'airsigmet', faflightid, flight_data, snapshot.generation, corridor_nm=corridor_nm
+        )
+        if key not in todo and cache.get(key) is None:
+            altitude = calculations.flight_altitude(flight_data)
+            todo[key] = FlightRoute(route, window[0], window[1], altitude, corridor_nm)
+    if not todo:
+        return pool
+    if pool is None:
+        pool = IntersectionPool(snapshot, workers)
+    else:
+        # Widening the AirSigmet window gives a new snapshot, which the running workers are sent.
+        pool.update(snapshot)
+    for key, result in zip(todo, pool.find_intersecting(todo.values())):
+        cache.set(key, result)
+    return pool
+
+
+def write_results(
+        records: Iterable[dict],
+        out: TextIO = sys.stdout,
+        timestamps: str = serialization.EPOCH,
+        backend: Optional[str] = None,
+) -> int:
+    """
+    Write result records as JSON lines, flushing after each one.
+
+    :param records: Result records.
+    :param out: Output stream.
+    :param timestamps: Write times as 'epoch' seconds or 'iso' strings.
+    :param backend: JSON encoder, 'json' or 'orjson'. Defaults to orjson when it is installed.
+    :return: The number of records written.
+    """
+    return streaming.write_records(records, out, timestamps=timestamps, backend=backend)
+
+
+def main(args: List[str]):
+    """
+    Evaluate a batch of flights and stream the results to stdout.
+
+    """
+    config = load_config()
+    logging_setup.setup(config)
+    client = calculations.get_flightaware_client(config)
+    session = calculations.get_db_session(config)
+    options = serialization.output_options(config)
+    cache = calculations.result_cache(config)
+    workers = config.getint('batch', 'workers', fallback=1) or default_workers()
+    corridor_nm = calculations.airsigmet_corridor(config)
+    limits = async_client.limits(config)
+    if len(args) < 2 or args[1] == '-':
+        results = evaluate_batch(read_requests(sys.stdin), client, session, cache, workers, corridor_nm, limits)
+        write_results(results, **options)
+        return
+    with open(args[1]) as file:
+        results = evaluate_batch(read_requests(file), client, session, cache, workers, corridor_nm, limits)
+        write_results(results, **options)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
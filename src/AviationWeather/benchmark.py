@@ -0,0 +1,341 @@
+"""
+Benchmarks for route and AirSigmet intersection.
+
+Each case checks one route against a synthetic set of AirSigmets with every engine:
+
+* find_intersection: the original pygeodesy check of one route segment against one
+  AirSigmet. It is far too slow to run on every pair of the larger cases, so it is timed
+  on a sample of segment and AirSigmet pairs.
+* find_intersecting_airsigs: calculations.find_intersecting_airsigs with a list of
+  AirSigmets, as used by the calculations command. This includes packing the AirSigmets.
+* snapshot: a prebuilt AdvisorySnapshot, as used by calculations-service and
+  calculations-batch.
+* parallel: an IntersectionPool checking a bank of copies of the route, when --workers
+  is more than 1.
+
+The synthetic routes are great circles between real airports with waypoints every 50nm,
+nudged sideways like airway fixes: short-haul (KBOS-KLGA), transcon (KJFK-KLAX), oceanic
+(KJFK-EGLL) and antimeridian-crossing (KSFO-RJAA). Recorded routes can be added with
+--routes, from a JSON file of DecodeFlightRoute responses keyed by route name.
+
+AirSigmets are scattered within 600nm of the route, with radii between 20nm and 250nm.
+Everything is seeded, so every run checks the same geometry.
+
+Results are written as JSON sorted by case, so two runs can be diffed, or compared with
+--compare. Timings are per call: p50 and p99 in milliseconds, and the number of
+segment and AirSigmet pairs checked per second.
+
+Usage::
+
+    python -m AviationWeather.benchmark [--quick] [--repeat N] [--workers N] [--routes FILE] [output.json]
+    python -m AviationWeather.benchmark --compare before.json after.json
+"""
+import json
+import math
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from . import __version__, calculations, geometry
+from .advisories import AdvisorySnapshot
+from .parallel import FlightRoute, IntersectionPool
+from .routes import Route
+from .sql_classes import AirSigmet, Points
+
+ENGINES = ('find_intersection', 'find_intersecting_airsigs', 'snapshot', 'parallel')
+AIRPORTS = {
+    'KBOS': (42.3656, -71.0096),
+    'KLGA': (40.7769, -73.8740),
+    'KJFK': (40.6413, -73.7781),
+    'KLAX': (33.9416, -118.4085),
+    'EGLL': (51.4700, -0.4543),
+    'KSFO': (37.6213, -122.3790),
+    'RJAA': (35.7720, 140.3929),
+}
+SYNTHETIC_ROUTES = {
+    'short-haul': ('KBOS', 'KLGA'),
+    'transcon': ('KJFK', 'KLAX'),
+    'oceanic': ('KJFK', 'EGLL'),
+    'antimeridian': ('KSFO', 'RJAA'),
+}
+POLYGON_COUNTS = (10, 100, 1000)
+VERTEX_COUNTS = (4, 20, 200)
+QUICK_POLYGON_COUNTS = (10, 100)
+QUICK_VERTEX_COUNTS = (4, 20)
+WAYPOINT_SPACING_NM = 50.0
+SCATTER_NM = 600.0
+RADIUS_NM = (20.0, 250.0)
+DEPARTURE = 1551650400  # 2019-03-03T22:00:00
+FLIGHT_SECONDS = 6 * 3600
+DEFAULT_REPEAT = 20
+LEGACY_PAIRS = 200
+LEGACY_SECONDS = 2.0
+PARALLEL_ROUTES = 256
+SEED = 20190303
+
+
+def synthetic_route(start: str, end: str, rng: np.random.RandomState) -> Route:
+    """
+    A great circle route between two airports, with waypoints every WAYPOINT_SPACING_NM
+    moved up to 10nm sideways.
+    """
+    a, b = geometry.to_unit_vectors(*zip(AIRPORTS[start], AIRPORTS[end]))
+    angle = float(geometry.angular_distance(a, b))
+    steps = max(1, int(math.ceil(geometry.radians_to_nm(angle) / WAYPOINT_SPACING_NM)))
+    fractions = np.linspace(0.0, 1.0, steps + 1)[:, None]
+    vectors = (np.sin((1 - fractions) * angle) * a + np.sin(fractions * angle) * b) / math.sin(angle)
+    normal = np.cross(a, b) / np.linalg.norm(np.cross(a, b))
+    offsets = rng.uniform(-1, 1, steps + 1) * geometry.nm_to_radians(10.0)
+    offsets[[0, -1]] = 0.0
+    vectors = vectors + offsets[:, None] * normal
+    vectors /= np.linalg.norm(vectors, axis=-1)[:, None]
+    lats, lons = geometry.to_latlons(vectors)
+    return Route(lats, lons)
+
+
+def load_routes(path: str) -> Dict[str, Route]:
+    """
+    Recorded routes from a JSON file of DecodeFlightRoute responses keyed by name.
+    """
+    with open(path) as file:
+        recorded = json.load(file)
+    return {f'recorded:{name}': Route.from_waypoints(data['data']) for name, data in recorded.items()}
+
+
+def synthetic_airsigmets(route: Route, count: int, vertices: int, rng: np.random.RandomState) -> List[AirSigmet]:
+    """
+    AirSigmets scattered around a route, valid for the whole flight.
+
+    Each polygon is a circle with vertices evenly spaced around it, at jittered distances
+    from its centre.
+    """
+    valid_from = datetime.utcfromtimestamp(DEPARTURE - 3600)
+    valid_to = datetime.utcfromtimestamp(DEPARTURE + FLIGHT_SECONDS + 3600)
+    segments = rng.randint(0, len(route), count)
+    fractions = rng.uniform(0, 1, count)[:, None]
+    centers = route.starts[segments] * (1 - fractions) + route.ends[segments] * fractions
+    centers /= np.linalg.norm(centers, axis=-1)[:, None]
+    sideways = np.cross(route.normals[segments], centers)
+    shift = geometry.nm_to_radians(rng.uniform(-SCATTER_NM, SCATTER_NM, count))[:, None]
+    centers = np.cos(shift) * centers + np.sin(shift) * route.normals[segments]
+    radii = geometry.nm_to_radians(rng.uniform(*RADIUS_NM, count))
+    bearings = np.linspace(0, 2 * math.pi, vertices, endpoint=False)
+    airsigs = []
+    for center, east, radius in zip(centers, sideways, radii):
+        north = np.cross(center, east)
+        distances = radius * rng.uniform(0.7, 1.0, vertices)
+        directions = np.cos(bearings)[:, None] * north + np.sin(bearings)[:, None] * east
+        points = np.cos(distances)[:, None] * center + np.sin(distances)[:, None] * directions
+        lats, lons = geometry.to_latlons(points)
+        airsigs.append(AirSigmet(
+            valid_time_from=valid_from,
+            valid_time_to=valid_to,
+            area=[Points(latitude=float(lat), longitude=float(lon)) for lat, lon in zip(lats, lons)],
+        ))
+    return airsigs
+
+
+def time_calls(call: Callable[[], object], repeat: int) -> List[float]:
+    """
+    Time repeated calls, after one untimed warm up call.
+    """
+    call()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def summarize(timings: List[float], pairs: int) -> dict:
+    return {
+        'p50_ms': round(float(np.percentile(timings, 50)) * 1000, 4),
+        'p99_ms': round(float(np.percentile(timings, 99)) * 1000, 4),
+        'pairs_per_sec': int(pairs / max(float(np.mean(timings)), 1e-12)),
+    }
+
+
+def run_case(
+        name: str,
+        route: Route,
+        airsigs: List[AirSigmet],
+        engines: Iterable[str],
+        repeat: int,
+        rng: np.random.RandomState,
+        pool: Optional[IntersectionPool] = None,
+) -> List[dict]:
+    """
+    Time every engine on one route and AirSigmet set.
+
+    :return: One result per engine.
+    """
+    segments = route.segments()
+    pairs = len(segments) * len(airsigs)
+    arrival = DEPARTURE + FLIGHT_SECONDS
+    case = {
+        'route': name,
+        'segments': len(segments),
+        'polygons': len(airsigs),
+        'vertices': len(airsigs[0].area) if airsigs else 0,
+    }
+    results = []
+    for engine in engines:
+        if engine == 'find_intersection':
+            samples = [
+                (segments[i], airsigs[j])
+                for i, j in zip(rng.randint(0, len(segments), LEGACY_PAIRS), rng.randint(0, len(airsigs), LEGACY_PAIRS))
+            ]
+            timings = []
+            deadline = time.perf_counter() + LEGACY_SECONDS
+            for segment, airsig in samples:
+                timings.extend(time_calls(lambda: calculations.find_intersection(segment[0], segment[1], airsig), 1))
+                if time.perf_counter() > deadline:
+                    break
+            results.append(dict(case, engine=engine, hits=None, **summarize(timings, 1)))
+            continue
+        if engine == 'find_intersecting_airsigs':
+            def call():
+                return calculations.find_intersecting_airsigs(airsigs, route, DEPARTURE, arrival)
+            count = pairs
+        elif engine == 'snapshot':
+            snapshot = AdvisorySnapshot(airsigs)
+
+            def call():
+                return snapshot.find_intersecting(route, DEPARTURE, arrival)
+            count = pairs
+        elif engine == 'parallel':
+            if pool is None:
+                continue
+            flights = [FlightRoute(route, DEPARTURE, arrival)] * PARALLEL_ROUTES
+
+            def call():
+                return pool.find_intersecting(flights)[0]
+            count = pairs * PARALLEL_ROUTES
+        else:
+            raise ValueError(f"engine must be one of {', '.join(ENGINES)}, not {engine}")
+        hits = len(call())
+        timings = time_calls(call, max(1, repeat // 4) if engine == 'parallel' else repeat)
+        results.append(dict(case, engine=engine, hits=hits, **summarize(timings, count)))
+    return results
+
+
+def run(
+        routes: Optional[Dict[str, Route]] = None,
+        polygon_counts: Iterable[int] = POLYGON_COUNTS,
+        vertex_counts: Iterable[int] = VERTEX_COUNTS,
+        engines: Iterable[str] = ENGINES,
+        repeat: int = DEFAULT_REPEAT,
+        workers: int = 1,
+) -> dict:
+    """
+    Run the benchmarks.
+
+    :param routes: Extra routes, such as recorded ones, keyed by name.
+    :param polygon_counts: AirSigmet set sizes.
+    :param vertex_counts: Vertices per AirSigmet.
+    :param engines: Engines to time, see ENGINES.
+    :param repeat: Number of timed calls per case.
+    :param workers: Processes used by the parallel engine. It is skipped if 1.
+    :return: Machine details and one result per case and engine.
+    """
+    rng = np.random.RandomState(SEED)
+    all_routes = {name: synthetic_route(start, end, rng) for name, (start, end) in SYNTHETIC_ROUTES.items()}
+    all_routes.update(routes or {})
+    engines = list(engines)
+    results = []
+    for index, (name, route) in enumerate(all_routes.items()):
+        for count in polygon_counts:
+            for vertices in vertex_counts:
+                # Each case has its own seed, so its AirSigmets don't depend on the other cases.
+                rng = np.random.RandomState([SEED, index, count, vertices])
+                airsigs = synthetic_airsigmets(route, count, vertices, rng)
+                pool = None
+                if 'parallel' in engines and workers > 1:
+                    pool = IntersectionPool(AdvisorySnapshot(airsigs), workers)
+                try:
+                    results.extend(run_case(name, route, airsigs, engines, repeat, rng, pool))
+                finally:
+                    if pool is not None:
+                        pool.close()
+    results.sort(key=lambda x: (x['route'], x['polygons'], x['vertices'], x['engine']))
+    return {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'version': __version__,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'workers': workers,
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare(before: dict, after: dict) -> List[str]:
+    """
+    Compare the throughput of two benchmark runs.
+
+    :return: One line per case found in both runs, with the change in pairs per second.
+    """
+    def key(result: dict) -> Tuple:
+        return result['route'], result['polygons'], result['vertices'], result['engine']
+
+    previous = {key(x): x for x in before['results']}
+    lines = []
+    for result in after['results']:
+        old = previous.get(key(result))
+        if old is None or not old['pairs_per_sec']:
+            continue
+        ratio = result['pairs_per_sec'] / old['pairs_per_sec']
+        lines.append(
+            f"{result['route']:>16} {result['polygons']:>5} x {result['vertices']:<4} {result['engine']:<26}"
+            f" {old['pairs_per_sec']:>12} -> {result['pairs_per_sec']:>12} pairs/s ({ratio:.2f}x)"
+        )
+    return lines
+
+
+def main(args: List[str]):
+    args = args[1:]
+    if args[:1] == ['--compare'] and len(args) == 3:
+        with open(args[1]) as before, open(args[2]) as after:
+            print('\n'.join(compare(json.load(before), json.load(after))))
+        return
+    options = {'workers': 1}
+    routes = {}
+    output = None
+    try:
+        while args:
+            arg = args.pop(0)
+            if arg == '--quick':
+                options.update(polygon_counts=QUICK_POLYGON_COUNTS, vertex_counts=QUICK_VERTEX_COUNTS, repeat=5)
+            elif arg == '--repeat':
+                options['repeat'] = int(args.pop(0))
+            elif arg == '--workers':
+                options['workers'] = int(args.pop(0)) or os.cpu_count() or 1
+            elif arg == '--routes':
+                routes.update(load_routes(args.pop(0)))
+            elif arg.startswith('--'):
+                raise ValueError(f'Unknown option: {arg}')
+            else:
+                output = arg
+    except (IndexError, ValueError) as error:
+        print(error or 'Missing option value.')
+        print(__doc__)
+        return
+    report = run(routes, **options)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if output is None:
+        print(text)
+        return
+    with open(output, 'w') as file:
+        file.write(text + '\n')
+
+
+if __name__ == "__main__":
+    main(sys.argv)
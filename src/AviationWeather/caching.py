@@ -0,0 +1,275 @@
+"""
+Caches for slow or billed lookups.
+
+TTLCache keeps recently used entries in an in-process LRU and, optionally, in an
+on-disk SQLite store shared by every process on the machine. CachingClient wraps the
+FlightAware SOAP client so that FlightInfoStatus and DecodeFlightRoute responses are
+served from a TTLCache.
+"""
+import json
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from contextlib import closing
+from datetime import datetime, timezone
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+
+from zeep.helpers import serialize_object
+
+_MISSING = object()
+
+DEFAULT_MAXSIZE = 1024
+
+
+class LRUCache:
+    """
+    Thread safe least-recently-used cache with per-entry expiry times.
+
+    :param maxsize: Maximum number of entries kept.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            value, expires = entry
+            if expires < time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: float = float('inf')):
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class DiskCache:
+    """
+    SQLite backed store of bytes values with expiry times.
+
+    A connection is opened for each operation, so one instance can be shared by
+    several threads.
+
+    :param path: Path of the SQLite database file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires REAL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        """
+        Look up a value.
+
+        :param key: Cache key.
+        :return: The stored bytes and their expiry time, or None if missing or expired.
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return row[0], row[1]
+
+    def set(self, key: str, value: bytes, ttl: float):
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl),
+            )
+
+    def purge(self):
+        """
+        Delete expired entries.
+        """
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM cache WHERE expires < ?", (time.time(),))
+
+
+class TTLCache:
+    """
+    In-process LRU in front of an optional on-disk store.
+
+    :param maxsize: Maximum number of entries kept in memory.
+    :param path: Path of the on-disk store, or None to only cache in memory.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE, path: Optional[str] = None):
+        self.memory = LRUCache(maxsize)
+        self.disk = DiskCache(path) if path else None
+
+    def get(self, key: str, decode: Callable[[bytes], Any]) -> Any:
+        """
+        Look up a value.
+
+        :param key: Cache key.
+        :param decode: Converts the stored bytes back into a value on a disk hit.
+        :return: The cached value, or None.
+        """
+        value = self.memory.get(key)
+        if value is not None or self.disk is None:
+            return value
+        stored = self.disk.get(key)
+        if stored is None:
+            return None
+        data, expires = stored
+        value = decode(data)
+        # The memory copy expires with the one on disk.
+        self.memory.set(key, value, expires - time.time())
+        return value
+
+    def set(self, key: str, value: Any, ttl: float, encode: Callable[[Any], bytes]):
+        """
+        Store a value.
+
+        :param key: Cache key.
+        :param value: The value.
+        :param ttl: Seconds until the value expires.
+        :param encode: Converts the value into bytes for the on-disk store.
+        """
+        self.memory.set(key, value, ttl)
+        if self.disk is not None:
+            self.disk.set(key, encode(value), ttl)
+
+
+def departure_ttl(departure_epoch: float, now: Optional[float] = None) -> float:
+    """
+    How long FlightAware data for a flight can be cached.
+
+    Schedules far in the future rarely change, while flights close to departure or
+    in the air get new estimates often.
+
+    :param departure_epoch: The flight's filed departure time.
+    :param now: The current time, defaults to time.time().
+    :return: Time to live in seconds.
+    """
+    until_departure = departure_epoch - (time.time() if now is None else now)
+    if until_departure < 3600:
+        return 120
+    if until_departure < 6 * 3600:
+        return 600
+    if until_departure < 24 * 3600:
+        return 1800
+    return 3600
+
+
+def encode_flight_info(flight_info: dict) -> bytes:
+    return json.dumps(flight_info, default=str).encode('utf-8')
+
+
+def decode_flight_info(data: bytes) -> dict:
+    return json.loads(data.decode('utf-8'))
+
+
+def encode_route(route: dict) -> bytes:
+    coordinates = array('d')
+    for waypoint in route['data']:
+        coordinates.append(waypoint['latitude'])
+        coordinates.append(waypoint['longitude'])
+    return coordinates.tobytes()
+
+
+def decode_route(data: bytes) -> dict:
+    coordinates = array('d')
+    coordinates.frombytes(data)
+    return {'data': [
+        {'latitude': lat, 'longitude': lon} for lat, lon in zip(coordinates[::2], coordinates[1::2])
+    ]}
+
+
+class CachingService:
+    """
+    Stand-in for a zeep client's service proxy that caches the FlightXML calls used
+    by the calculations module.
+    """
+
+    def __init__(self, service, cache: TTLCache):
+        self._service = service
+        self._cache = cache
+        self._departures = LRUCache()
+
+    def __getattr__(self, name: str):
+        return getattr(self._service, name)
+
+    def FlightInfoStatus(self, ident: str, *args, **kwargs) -> dict:
+        """
+        Cached by flight ident and UTC date. The TTL is set by the next departure in the response.
+        """
+        if args or kwargs:
+            return self._service.FlightInfoStatus(ident, *args, **kwargs)
+        key = f"FlightInfoStatus:{ident}:{datetime.now(timezone.utc).date().isoformat()}"
+        flight_info = self._cache.get(key, decode_flight_info)
+        if flight_info is not None:
+            self._remember_departures(flight_info)
+            return flight_info
+        flight_info = serialize_object(self._service.FlightInfoStatus(ident), dict)
+        now = time.time()
+        upcoming = [x for x in self._remember_departures(flight_info) if x >= now - 3600]
+        ttl = departure_ttl(min(upcoming) if upcoming else now, now)
+        self._cache.set(key, flight_info, ttl, encode_flight_info)
+        return flight_info
+
+    def _remember_departures(self, flight_info: dict) -> List[float]:
+        # Kept for DecodeFlightRoute, whether or not the FlightInfoStatus response was cached.
+        departures = []
+        for flight in flight_info.get('flights') or []:
+            departure = (flight.get('filed_departure_time') or {}).get('epoch')
+            if departure:
+                self._departures.set(flight.get('faFlightID'), departure)
+                departures.append(departure)
+        return departures
+
+    def DecodeFlightRoute(self, faflightid: str) -> dict:
+        """
+        Cached by faFlightID, with the TTL set by the flight's departure time if it was
+        seen in an earlier FlightInfoStatus response. Only the waypoint coordinates are kept.
+        """
+        key = f"DecodeFlightRoute:{faflightid}"
+        route = self._cache.get(key, decode_route)
+        if route is not None:
+            return route
+        route = decode_route(encode_route(self._service.DecodeFlightRoute(faflightid)))
+        # Routes can be refiled until departure. Unknown flights get the shortest TTL.
+        self._cache.set(key, route, departure_ttl(self._departures.get(faflightid, 0)), encode_route)
+        return route
+
+
+class CachingClient:
+    """
+    Wraps a zeep client so FlightInfoStatus and DecodeFlightRoute are cached.
+
+    :param client: The zeep client.
+    :param cache: The cache to use.
+    """
+
+    def __init__(self, client, cache: TTLCache):
+        self.client = client
+        self.cache = cache
+        self.service = CachingService(client.service, cache)
+
+    def __getattr__(self, name: str):
+        return getattr(self.client, name)
@@ -6,45 +6,51 @@ estimated arrival time.
 Cross reference route segments with AirSigmet area to see if they cross.
 If so, return the full AirSigmet data.
 """
-import csv
 import configparser
 import json
-import sys
 import os.path
+import sys
+import threading
 from datetime import datetime
 import logging
-from typing import List, Tuple
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
 
 from pygeodesy.sphericalNvector import intersection, LatLon
-from pygeodesy.dms import parseDMS
-from sqlalchemy import create_engine
+from sqlalchemy import and_, create_engine, func, literal, or_, select, union_all
+from sqlalchemy.engine import Engine
 from sqlalchemy.engine.url import URL
-from sqlalchemy.orm import sessionmaker, subqueryload, Session
-from sqlalchemy.exc import ArgumentError, OperationalError
+from sqlalchemy.orm import joinedload, selectinload, sessionmaker, subqueryload, Query, Session
+from sqlalchemy.exc import ArgumentError, OperationalError, ProgrammingError
 from requests import Session as RequestSession
 from requests.auth import HTTPBasicAuth
 from zeep import Client
+from zeep.cache import SqliteCache
 from zeep.transports import Transport
 from zeep.exceptions import Fault
 
-from .sql_classes import Base, AirSigmet, Taf, Metar
-from . import logging_setup
+from .sql_classes import Base, AirSigmet, Forecast, Generation, Taf, Metar
+from . import airports, logging_setup, metrics, profiling, serialization, streaming
+from .advisories import AdvisorySnapshot
+from .routes import Route
+from .caching import DEFAULT_MAXSIZE, CachingClient, LRUCache, TTLCache
+from .settings import cache_dir, load_config
 
-logging_setup.setup()
 logger = logging.getLogger(__name__)
-AIRPORT_DATA = {}
-
-# Load airport information
-with open(
-        os.path.join(
-            os.path.dirname(__file__),
-            "static",
-            "airports.csv",
-        )
-) as file:
-    csvdata = csv.reader(file, delimiter=',', quotechar='"')
-    for line in csvdata:
-        AIRPORT_DATA[line[5]] = tuple(line)
+
+FLIGHTXML_WSDL = 'https://flightxml.flightaware.com/soap/FlightXML3/wsdl'
+WSDL_CACHE_FILE = 'wsdl.sqlite'
+WSDL_CACHE_TIMEOUT = 7 * 24 * 3600
+
+RESPONSE_CACHE_FILE = 'flightaware.sqlite'
+
+# Routes can be amended before departure, so built routes are only reused for a while.
+ROUTE_CACHE_TTL = 15 * 60
+
+DEFAULT_CORRIDOR_NM = 0.0
+
+_CLIENT: Optional[CachingClient] = None
+_CLIENT_LOCK = threading.Lock()
+_ROUTES = LRUCache()
 
 
 def test_equality(latlon1: LatLon, latlon2: LatLon) -> bool:
@@ -62,22 +68,23 @@ def test_equality(latlon1: LatLon, latlon2: LatLon) -> bool:
 
 def airport_latlon(airport: str) -> LatLon:
     """
-    Find the latitude and longitude of an airport given that airport's 4-letter ICAO identifier.
+    Find the latitude and longitude of an airport given that airport's 4-letter ICAO
+    or 3-letter IATA identifier.
 
-    :param airport:  Airport's 4-letter ICAO identifier.
+    :param airport:  Airport's 4-letter ICAO or 3-letter IATA identifier.
     :return: LatLon object containing the airports latitude and longitude.
     """
-    db_listing = AIRPORT_DATA.get(airport)
-    lat = db_listing[6]
-    long = db_listing[7]
-    return LatLon(parseDMS(lat, sep=':'), parseDMS(long, sep=':'))
+    db_listing = airports.lookup(airport)
+    if db_listing is None:
+        raise ValueError(f'Unknown airport: {airport}')
+    return LatLon(db_listing.latitude, db_listing.longitude)
 
 
-def get_db_session(config: configparser.ConfigParser) -> Session:
+def get_engine(config: configparser.ConfigParser) -> Engine:
     """
-    Open a database session.
+    Create the database engine (and its connection pool).
 
-    :return: Returns the database session.
+    :return: Returns the database engine.
     """
     # url = URL('mysql+pymysql', 'root', 'scuzzlebutt', 'localhost', '3306', 'weatherV2')
     url = URL(
@@ -89,11 +96,20 @@ def get_db_session(config: configparser.ConfigParser) -> Session:
         config['sqlalchemy']['database'],
     )
     try:
-        engine = create_engine(url)
+        engine = create_engine(url, pool_pre_ping=True)
     except ArgumentError:
         logger.exception('Badly formed URL. Please check your config file.')
         raise
-    session_maker = sessionmaker(bind=engine)
+    return engine
+
+
+def get_db_session(config: configparser.ConfigParser) -> Session:
+    """
+    Open a database session.
+
+    :return: Returns the database session.
+    """
+    session_maker = sessionmaker(bind=get_engine(config))
     session = session_maker()
     try:
         session.execute('SELECT 1')
@@ -113,6 +129,14 @@ def tafs(
     """
     Query Taf data from the database.
 
+    Both airports are looked up in a single query. When several Tafs are valid at the
+    requested time, the one issued most recently is used. Forecasts are loaded in the same
+    query, and their sky, turbulence and icing conditions with one query each, as joining
+    all three would return a row for every combination of them.
+
+    The lookup uses the row_number() window function, which needs MySQL 8.0 or later (or
+    SQLite 3.25 or later).
+
     :param session: The current database session.
     :param dep_apt: Departure airport.
     :param dep_time: Departure time.
@@ -120,55 +144,169 @@ def tafs(
     :param arr_time: Arrival time.
     :return: Both departure and arrival Taf SQL objects.
     """
-    dt = datetime.utcfromtimestamp(dep_time)
-    at = datetime.utcfromtimestamp(arr_time)
-    departure_taf: List[Taf] = session.query(Taf).\
-        filter(Taf.station_id == dep_apt).\
-        filter(Taf.valid_time_from <= dt).\
-        filter(Taf.valid_time_to >= dt).all()
-    arrival_taf: List[Taf] = session.query(Taf). \
-        filter(Taf.station_id == arr_apt). \
-        filter(Taf.valid_time_from <= at). \
-        filter(Taf.valid_time_to >= at).all()
-    if not departure_taf or not arrival_taf:
+    def latest(role: int, station_id: str, epoch: float):
+        moment = datetime.utcfromtimestamp(epoch)
+        return select([
+            Taf.id.label('id'),
+            literal(role).label('role'),
+            func.row_number().over(order_by=(Taf.issue_time.desc(), Taf.id.desc())).label('rank'),
+        ]).where(and_(
+            Taf.station_id == station_id,
+            Taf.valid_time_from <= moment,
+            Taf.valid_time_to >= moment,
+        ))
+
+    ranked = union_all(latest(0, dep_apt, dep_time), latest(1, arr_apt, arr_time)).alias('ranked')
+    forecast = joinedload(Taf.forecast)
+    rows = session.query(Taf, ranked.c.role).\
+        join(ranked, Taf.id == ranked.c.id).\
+        filter(ranked.c.rank == 1).\
+        options(
+            forecast.selectinload(Forecast.sky_condition),
+            forecast.selectinload(Forecast.turbulence_condition),
+            forecast.selectinload(Forecast.icing_condition),
+        ).all()
+    found = {role: taf for taf, role in rows}
+    if len(found) < 2:
         raise ValueError('No taf found within time range.')
-    return [departure_taf[0], arrival_taf[0]]
+    return [found[0], found[1]]
+
+
+def metar_query(
+        session: Session,
+        dep_apt: str,
+        arr_apt: str,
+        limit: Optional[int] = None,
+        since: Optional[float] = None,
+) -> Query:
+    """
+    Build the query for metars(), without loading options.
+
+    :param session: The current database session.
+    :param dep_apt: Departure airport
+    :param arr_apt: Arrival airport
+    :param limit: Only select the newest limit Metars for each airport.
+    :param since: Only select Metars observed at or after this epoch time.
+    :return: Query for both airports' Metars, newest first.
+    """
+    conditions = [Metar.station_id.in_({dep_apt, arr_apt})]
+    if since is not None:
+        conditions.append(Metar.observation_time >= datetime.utcfromtimestamp(since))
+    query = session.query(Metar)
+    if limit is not None:
+        ranked = select([
+            Metar.id.label('id'),
+            func.row_number().over(
+                partition_by=Metar.station_id,
+                order_by=(Metar.observation_time.desc(), Metar.id.desc()),
+            ).label('rank'),
+        ]).where(and_(*conditions)).alias('ranked')
+        query = query.join(ranked, Metar.id == ranked.c.id).filter(ranked.c.rank <= limit)
+    else:
+        query = query.filter(*conditions)
+    return query.order_by(Metar.observation_time.desc(), Metar.id.desc())
 
 
 def metars(
-        session: Session, dep_apt: str, arr_apt: str
+        session: Session,
+        dep_apt: str,
+        arr_apt: str,
+        limit: Optional[int] = None,
+        since: Optional[float] = None,
 ) -> Tuple[List[Metar], List[Metar]]:
     """
     Query Metar data from the database.
 
+    Both airports are looked up in a single query. Metars are returned newest first.
+
     :param session: The current database session.
     :param dep_apt: Departure airport
     :param arr_apt: Arrival airport
+    :param limit: Only return the newest limit Metars for each airport. Use 1 for the latest only.
+    :param since: Only return Metars observed at or after this epoch time.
     :return: Both departure and arrival Metar SQL objects.
     """
-    departure_metars = session.query(Metar).\
-        filter(Metar.station_id == dep_apt).\
-        options(subqueryload(Metar.sky_condition)).all()
-    arrival_metars = session.query(Metar). \
-        filter(Metar.station_id == arr_apt). \
-        options(subqueryload(Metar.sky_condition)).all()
+    results = metar_query(session, dep_apt, arr_apt, limit, since).\
+        options(joinedload(Metar.sky_condition)).all()
+    departure_metars = [x for x in results if x.station_id == dep_apt]
+    arrival_metars = [x for x in results if x.station_id == arr_apt]
     return departure_metars, arrival_metars
 
 
-def airsigmets(session: Session, arrival: float, departure: float) -> List[AirSigmet]:
+def airsigmet_query(
+        session: Session,
+        arrival: float,
+        departure: float,
+        hazards: Optional[Iterable[str]] = None,
+        severities: Optional[Iterable[str]] = None,
+        min_altitude_ft: Optional[int] = None,
+        max_altitude_ft: Optional[int] = None,
+) -> Query:
+    """
+    Build the query for airsigmets(), without loading options. The arguments are the same.
+    """
+    query = session.query(AirSigmet).\
+        filter(AirSigmet.valid_time_to >= datetime.utcfromtimestamp(departure)).\
+        filter(AirSigmet.valid_time_from <= datetime.utcfromtimestamp(arrival))
+    if hazards is not None:
+        query = query.filter(AirSigmet.hazard__type.in_(list(hazards)))
+    if severities is not None:
+        query = query.filter(AirSigmet.hazard__severity.in_(list(severities)))
+    if max_altitude_ft is not None:
+        query = query.filter(or_(
+            AirSigmet.altitude__min_ft_msl.is_(None), AirSigmet.altitude__min_ft_msl <= max_altitude_ft
+        ))
+    if min_altitude_ft is not None:
+        query = query.filter(or_(
+            AirSigmet.altitude__max_ft_msl.is_(None), AirSigmet.altitude__max_ft_msl >= min_altitude_ft
+        ))
+    return query
+
+
+def airsigmets(
+        session: Session,
+        arrival: float,
+        departure: float,
+        hazards: Optional[Iterable[str]] = None,
+        severities: Optional[Iterable[str]] = None,
+        min_altitude_ft: Optional[int] = None,
+        max_altitude_ft: Optional[int] = None,
+) -> List[AirSigmet]:
     """
     Query AirSigmet data from the database.
 
+    An AirSigmet is selected if it is valid at any time between departure and arrival.
+    AirSigmets without an altitude limit are treated as extending from the surface up
+    without bound.
+
     :param session: The current database session.
     :param arrival: The arrival time of the flight being checked.
     :param departure: The departure time of the flight being checked.
+    :param hazards: Only select these hazard types (ie. TURB, ICE, CONVECTIVE).
+    :param severities: Only select these hazard severities (ie. MOD, SEV).
+    :param min_altitude_ft: Only select AirSigmets reaching down to this altitude (feet MSL) or lower.
+    :param max_altitude_ft: Only select AirSigmets reaching up to this altitude (feet MSL) or higher.
     :return: All AirSigmets that meet the search criteria.
     """
-    airsigs = session.query(AirSigmet).\
-        filter(AirSigmet.valid_time_from >= datetime.utcfromtimestamp(departure)).\
-        filter(AirSigmet.valid_time_to <= datetime.utcfromtimestamp(arrival)).\
-        options(subqueryload(AirSigmet.area)).all()
-    return airsigs
+    query = airsigmet_query(
+        session, arrival, departure, hazards, severities, min_altitude_ft, max_altitude_ft
+    )
+    return query.options(subqueryload(AirSigmet.area)).all()
+
+
+def airsigmet_in_window(airsig: AirSigmet, arrival: float, departure: float) -> bool:
+    """
+    Check an already loaded AirSigmet against the same time criteria used by airsigmets().
+
+    :param airsig: The AirSigmet in question.
+    :param arrival: The arrival time of the flight being checked.
+    :param departure: The departure time of the flight being checked.
+    :return: True if the AirSigmet is valid at any time during the flight.
+    """
+    return (
+        airsig.valid_time_to >= datetime.utcfromtimestamp(departure)
+        and airsig.valid_time_from <= datetime.utcfromtimestamp(arrival)
+    )
 
 
 def airsigmet_points(airsig: AirSigmet) -> List[Tuple[LatLon, LatLon]]:
@@ -213,39 +351,99 @@ def find_intersection(start1: LatLon, end1: LatLon, airsig: AirSigmet) -> List[L
     return []
 
 
-def find_intersecting_airsigs(airsigs: List[AirSigmet], route: List[Tuple[LatLon, LatLon]]) -> List[AirSigmet]:
+def find_intersecting_airsigs(
+        airsigs: Union[List[AirSigmet], AdvisorySnapshot],
+        route: Union[Route, List[Tuple[LatLon, LatLon]]],
+        departure: Optional[float] = None,
+        arrival: Optional[float] = None,
+        altitude: Optional[float] = None,
+        corridor_nm: float = DEFAULT_CORRIDOR_NM,
+) -> List[AirSigmet]:
     """
     Determine which airsigmets are intersected by the flight route.
 
-    :param airsigs:
-    :param route:
-    :return:
+    A route intersects an airsigmet if it crosses the airsigmet's boundary or lies inside it,
+    or, given a corridor, comes within corridor_nm of it.
+
+    :param airsigs: Candidate AirSigmets, or a snapshot of them.
+    :param route: The route from get_flight_route, or its segments as returned by get_flight_route_data.
+    :param departure: If given with arrival, each route segment is only checked against the
+        AirSigmets valid while the aircraft is on it.
+    :param arrival: The flight's arrival time.
+    :param altitude: The flight's cruise altitude in feet MSL. If given, each route segment
+        is only checked against the AirSigmets whose altitude band it can reach.
+    :param corridor_nm: Half width of the route corridor in nautical miles, see airsigmet_corridor().
+    :return: The intersected AirSigmets.
     """
-    intersects = []
-    for airsig in airsigs:
-        for segment in route:
-            result = find_intersection(segment[0], segment[1], airsig)
-            if result:
-                intersects.append(airsig)
-                break
-    return intersects
+    with profiling.span('geometry.find_intersecting_airsigs'):
+        if not isinstance(airsigs, AdvisorySnapshot):
+            airsigs = AdvisorySnapshot(airsigs)
+        return airsigs.find_intersecting(route, departure, arrival, altitude, corridor_nm)
 
 
-def get_flightaware_client(config: configparser):
+def get_flightaware_client(config: configparser.ConfigParser) -> CachingClient:
     """
     Set up the SOAP client for FlightAware.com
 
-    :param config:
-    :return:
+    The WSDL and the schemas it imports are cached on disk, and the client is created
+    once and reused for the rest of the process.
+
+    :param config: FlightAware username, api key and optional WSDL url.
+    :return: The SOAP client.
+    """
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = create_flightaware_client(config)
+        return _CLIENT
+
+
+def create_flightaware_client(config: configparser.ConfigParser) -> CachingClient:
+    """
+    Create a new SOAP client for FlightAware.com, using the on-disk WSDL cache.
+
+    FlightInfoStatus and DecodeFlightRoute responses are cached in memory and on disk.
+
+    :param config: FlightAware username, api key and optional WSDL url.
+    :return: The SOAP client.
     """
     username = config["flightaware.com"]["username"]
     apiKey = config["flightaware.com"]["api_key"]
-    wsdlFile = 'https://flightxml.flightaware.com/soap/FlightXML3/wsdl'
+    wsdlFile = config.get("flightaware.com", "wsdl", fallback=FLIGHTXML_WSDL)
+    cache = SqliteCache(
+        path=wsdl_cache_path(config),
+        timeout=config.getint("flightaware.com", "wsdl_cache_timeout", fallback=WSDL_CACHE_TIMEOUT),
+    )
 
     session = RequestSession()
     session.auth = HTTPBasicAuth(username, apiKey)
-    client = Client(wsdlFile, transport=Transport(session=session))
-    return client
+    with metrics.timer('flightaware.wsdl_load'), profiling.span('flightaware.wsdl_load'):
+        client = Client(wsdlFile, transport=Transport(session=session, cache=cache))
+    response_cache = TTLCache(
+        config.getint("flightaware.com", "response_cache_size", fallback=DEFAULT_MAXSIZE),
+        os.path.join(cache_dir(config), RESPONSE_CACHE_FILE),
+    )
+    return CachingClient(client, response_cache)
+
+
+def wsdl_cache_path(config: configparser.ConfigParser) -> str:
+    return os.path.join(cache_dir(config), WSDL_CACHE_FILE)
+
+
+def refresh_wsdl_cache(config: configparser.ConfigParser) -> CachingClient:
+    """
+    Discard the cached WSDL, then download it again and replace the process's client.
+
+    :param config: FlightAware username, api key and optional WSDL url.
+    :return: The new SOAP client.
+    """
+    global _CLIENT
+    path = wsdl_cache_path(config)
+    with _CLIENT_LOCK:
+        if os.path.exists(path):
+            os.remove(path)
+        _CLIENT = create_flightaware_client(config)
+        return _CLIENT
 
 
 def get_flightinfostatus(
@@ -286,9 +484,20 @@ def get_faflightid(client: Client, flt_ident: str, dep_apt: str, arr_apt: str, d
     :param departure_epoch: Optional departure time in POSIX Epoch format.
     :return: FaFlightID for the flight.
     """
-    flight_list = client.service.FlightInfoStatus(flt_ident)
+    with profiling.span('flightaware.flight_info_status'):
+        flight_list = client.service.FlightInfoStatus(flt_ident)
+    return choose_flight(flight_list, flt_ident, dep_apt, arr_apt, departure_epoch)
 
-    first_choice = client.service.FlightInfoStatus
+
+def choose_flight(flight_list, flt_ident: str, dep_apt: str, arr_apt: str, departure_epoch: float = 0.0)\
+        -> Tuple[str, dict]:
+    """
+    Pick the flight in question out of a FlightInfoStatus response.
+
+    :param flight_list: The FlightInfoStatus response.
+    :return: FaFlightID for the flight, and its data, as returned by get_faflightid().
+    """
+    first_choice = None
 
     for flight in flight_list['flights']:
         if (
@@ -304,7 +513,9 @@ def get_faflightid(client: Client, flt_ident: str, dep_apt: str, arr_apt: str, d
                     continue
             else:
                 return flight['faFlightID'], flight
-    return getattr(first_choice, 'faFlightID', ''), first_choice
+    if first_choice is None:
+        return '', {}
+    return first_choice['faFlightID'], first_choice
 
 
 def get_flight_route_data(client, flight_id) -> list:
@@ -330,6 +541,40 @@ def get_flight_route_data(client, flight_id) -> list:
     return segments
 
 
+def cached_flight_route(flight_id: str, cache: Optional[LRUCache] = None) -> Optional[Route]:
+    """
+    The route get_flight_route() would return without calling FlightAware, if it has one.
+    """
+    return (_ROUTES if cache is None else cache).get(flight_id)
+
+
+def get_flight_route(client, flight_id: str, cache: Optional[LRUCache] = None) -> Optional[Route]:
+    """
+    Get the flight route, packed for the weather checks.
+
+    :param client: FlightAware SOAP client.
+    :param flight_id: FlightAware's flight ID.
+    :param cache: Routes already built, keyed by flight ID. Defaults to a cache shared by
+        the whole process.
+    :return: The route, or None if FlightAware has no route for the flight.
+    """
+    cache = _ROUTES if cache is None else cache
+    route = cache.get(flight_id)
+    if route is not None:
+        return route
+    try:
+        with profiling.span('flightaware.decode_flight_route'):
+            data = client.service.DecodeFlightRoute(flight_id)
+    except Fault:
+        logger.error(f'Could not find route data for flight_id: {flight_id}')
+        return None
+    route = Route.from_waypoints(data['data'])
+    if not route:
+        return None
+    cache.set(flight_id, route, ROUTE_CACHE_TTL)
+    return route
+
+
 def load_route():
     with open("DecodeFlightRoute.json") as f:
         route = json.load(f)
@@ -347,77 +592,412 @@ class Encoder(json.JSONEncoder):
     """
     def default(self, obj):
         if isinstance(obj, Base):
-            return obj.__json__()
+            return serialization.to_dict(obj)
         elif isinstance(obj, datetime):
-            return obj.timestamp()
+            return serialization.epoch_seconds(obj)
         return json.JSONEncoder.default(self, obj)
 
 
-def output(wx_data: List):
-    out_data = []
-    for item in wx_data:
-        out_data.append(json.dumps(item, cls=Encoder))
-    raw_json = json.dumps(wx_data, cls=Encoder)
-    return raw_json
+def output(wx_data: Union[dict, List], timestamps: str = serialization.EPOCH, backend: Optional[str] = None) -> str:
+    """
+    Serialize weather data to JSON.
+
+    :param wx_data: The result of flight_weather().
+    :param timestamps: Write times as 'epoch' seconds or 'iso' strings.
+    :param backend: JSON encoder, 'json' or 'orjson'. Defaults to orjson when it is installed.
+    :return: The JSON document.
+    """
+    return serialization.dumps(wx_data, timestamps, backend)
 
 
-def metar_output(departure_metar, arrival_metar):
+def metar_output(departure_metar, arrival_metar, timestamps: str = serialization.EPOCH) -> str:
     formatted = {
         'departure': departure_metar,
         'arrival': arrival_metar,
     }
-    raw_json = json.dumps(formatted, cls=Encoder)
-    return raw_json
+    return serialization.dumps(formatted, timestamps)
 
 
-def main():
-    wx_type, flt_num, dep_apt, arr_apt, departure_epoch = clean_args(sys.argv)
-    if wx_type == "":
-        return
-    config = configparser.ConfigParser()
-    config.read(
-        os.path.join(
-            os.path.dirname(__file__),
-            "config.ini",
-        )
-    )
+def flight_window(flight_data: dict) -> Tuple[float, float]:
+    """
+    The times a flight is expected to be in the air.
 
-    client = get_flightaware_client(config)
-    faflightid, flight_data = get_faflightid(client, flt_num, dep_apt, arr_apt, departure_epoch)
+    :param flight_data: The flight's FlightInfoStatus data.
+    :return: The filed departure time, and the estimated arrival time if FlightAware has
+        one, otherwise the filed arrival time, in POSIX Epoch format.
+    """
+    departure = flight_data['filed_departure_time']['epoch']
+    arrival = flight_data['filed_arrival_time']['epoch']
+    try:
+        estimated = flight_data['estimated_arrival_time']['epoch']
+    except (KeyError, TypeError):
+        estimated = None
+    if estimated and estimated >= departure:
+        arrival = estimated
+    return departure, arrival
 
-    if faflightid == "":
-        return
 
+def flight_altitude(flight_data: dict) -> Optional[float]:
+    """
+    The flight's filed cruise altitude.
+
+    :param flight_data: The flight's FlightInfoStatus data.
+    :return: The altitude in feet MSL, or None if no altitude was filed.
+    """
+    try:
+        filed = flight_data['filed_altitude']
+    except KeyError:
+        return None
+    # FlightAware reports altitudes in hundreds of feet.
+    return filed * 100.0 if filed else None
+
+
+def data_generation(session: Session, wx_type: str) -> Optional[int]:
+    """
+    The number of times data of a weather type has been ingested by the converter.
+
+    :param session: The current database session.
+    :param wx_type: metar, taf, or airsigmet.
+    :return: The generation, or None if the database has no generation table yet.
+    """
+    try:
+        generation = session.query(Generation.generation).filter(Generation.wx_type == wx_type).scalar()
+    except (OperationalError, ProgrammingError):
+        session.rollback()
+        return None
+    return generation or 0
+
+
+def result_cache(config: configparser.ConfigParser) -> LRUCache:
+    """
+    Create a cache for flight_weather() results, sized by [cache] result_cache_size.
+
+    :param config: The parsed configuration.
+    """
+    return LRUCache(config.getint('cache', 'result_cache_size', fallback=DEFAULT_MAXSIZE))
+
+
+def airsigmet_corridor(config: configparser.ConfigParser) -> float:
+    """
+    The route corridor half width in nautical miles, set with [airsigmet] corridor_nm.
+
+    AirSigmets within the corridor are reported along with those the route crosses.
+
+    :param config: The parsed configuration.
+    """
+    return config.getfloat('airsigmet', 'corridor_nm', fallback=DEFAULT_CORRIDOR_NM)
+
+
+def result_key(
+        wx_type: str,
+        faflightid: str,
+        flight_data: dict,
+        generation: int,
+        limit: Optional[int] = None,
+        since: Optional[float] = None,
+        corridor_nm: float = DEFAULT_CORRIDOR_NM,
+) -> tuple:
+    """
+    The result cache key used by flight_weather().
+
+    :param generation: The weather type's ingest generation, see data_generation().
+    """
+    departure, arrival = flight_window(flight_data)
+    altitude = flight_altitude(flight_data)
+    return wx_type, faflightid, generation, departure, arrival, altitude, limit, since, corridor_nm
+
+
+def result_generation(
+        wx_type: str,
+        session: Session,
+        airsigs: Union[List[AirSigmet], AdvisorySnapshot, None] = None,
+) -> Optional[int]:
+    """
+    The ingest generation a flight_weather() result is computed from, for result_key().
+
+    :param airsigs: The AirSigmets passed to flight_weather(). A snapshot's own generation is used.
+    """
+    if isinstance(airsigs, AdvisorySnapshot) and airsigs.generation is not None:
+        return airsigs.generation
+    return data_generation(session, wx_type)
+
+
+def flight_weather(
+        wx_type: str,
+        faflightid: str,
+        flight_data: dict,
+        client,
+        session: Session,
+        airsigs: Union[List[AirSigmet], AdvisorySnapshot, None] = None,
+        limit: Optional[int] = None,
+        since: Optional[float] = None,
+        cache: Optional[LRUCache] = None,
+        corridor_nm: float = DEFAULT_CORRIDOR_NM,
+) -> Union[dict, List, None]:
+    """
+    Look up the requested weather for a flight.
+
+    :param wx_type: metar, taf, or airsigmet.
+    :param faflightid: FlightAware's flight ID.
+    :param flight_data: The flight's FlightInfoStatus data.
+    :param client: FlightAware SOAP client.
+    :param session: The current database session.
+    :param airsigs: Candidate AirSigmets already loaded by the caller, or a snapshot of
+        them. If not given, or the snapshot doesn't cover the flight's departure time, they
+        are queried from the database.
+    :param limit: For metar, the number of Metars to return for each airport.
+    :param since: For metar, only return Metars observed at or after this epoch time.
+    :param cache: Results cache, see result_cache(). Results are reused until the converter
+        ingests new data of the same weather type.
+    :param corridor_nm: For airsigmet, also return the AirSigmets within this many nautical
+        miles of the route.
+    :return: Weather data ready for JSON serialization, or None if the flight route
+        could not be found.
+    """
+    key = None
+    if cache is not None:
+        generation = result_generation(wx_type, session, airsigs)
+        if generation is not None:
+            key = result_key(wx_type, faflightid, flight_data, generation, limit, since, corridor_nm)
+            result = cache.get(key)
+            if result is not None:
+                return result
+    result = _flight_weather(wx_type, faflightid, flight_data, client, session, airsigs, limit, since, corridor_nm)
+    if key is not None and result is not None:
+        cache.set(key, result)
+    return result
+
+
+def _flight_weather(
+        wx_type: str,
+        faflightid: str,
+        flight_data: dict,
+        client,
+        session: Session,
+        airsigs: Union[List[AirSigmet], AdvisorySnapshot, None],
+        limit: Optional[int],
+        since: Optional[float],
+        corridor_nm: float,
+) -> Union[dict, List, None]:
     dep = flight_data['origin']['code']
     arr = flight_data['destination']['code']
-    session = get_db_session(config)
 
     if wx_type == 'metar':
-        metar_data = metars(session, dep, arr)
-        print(metar_output(*metar_data))
-        return
+        with profiling.span('db.metars'):
+            departure_metars, arrival_metars = metars(session, dep, arr, limit, since)
+        return {'departure': departure_metars, 'arrival': arrival_metars}
 
     departure_epoch = flight_data["filed_departure_time"]['epoch']
     arrival_epoch = flight_data['filed_arrival_time']['epoch']
 
     if wx_type == 'airsigmet':
-        route = get_flight_route_data(client, faflightid)
-        if not route:
-            return
-        airsigs = airsigmets(session, departure_epoch, arrival_epoch)
-        intersecting_airsigs = find_intersecting_airsigs(airsigs, route)
-        result = output(intersecting_airsigs)
-    
+        route = get_flight_route(client, faflightid)
+        if route is None:
+            return None
+        departure_epoch, arrival_epoch = flight_window(flight_data)
+        if airsigs is None or (isinstance(airsigs, AdvisorySnapshot) and not airsigs.covers(departure_epoch)):
+            with profiling.span('db.airsigmets'):
+                airsigs = airsigmets(session, arrival=arrival_epoch, departure=departure_epoch)
+        altitude = flight_altitude(flight_data)
+        return find_intersecting_airsigs(airsigs, route, departure_epoch, arrival_epoch, altitude, corridor_nm)
     elif wx_type == 'taf':
-        try:
-            taf_data = tafs(session, dep, departure_epoch, arr, arrival_epoch)
-        except ValueError():
-            print('No tafs found within time range.')
+        with profiling.span('db.tafs'):
+            return tafs(session, dep, departure_epoch, arr, arrival_epoch)
+    raise ValueError("Must be one of airsigmet, metar, or taf.")
+
+
+def iter_flight_weather(
+        wx_type: str,
+        faflightid: str,
+        flight_data: dict,
+        client,
+        session: Session,
+        limit: Optional[int] = None,
+        since: Optional[float] = None,
+        chunk_size: int = streaming.DEFAULT_CHUNK_SIZE,
+        corridor_nm: float = DEFAULT_CORRIDOR_NM,
+) -> Optional[Iterator[Base]]:
+    """
+    Look up the requested weather for a flight, one record at a time.
+
+    Metars and AirSigmets are read from the database chunk_size rows at a time, so
+    results of any size can be written out without holding them all in memory. Metars
+    for both airports are mixed, newest first, and can be told apart by station_id.
+    AirSigmets come in id order.
+
+    :param wx_type: metar, taf, or airsigmet.
+    :param faflightid: FlightAware's flight ID.
+    :param flight_data: The flight's FlightInfoStatus data.
+    :param client: FlightAware SOAP client.
+    :param session: The current database session.
+    :param limit: For metar, the number of Metars to return for each airport.
+    :param since: For metar, only return Metars observed at or after this epoch time.
+    :param chunk_size: Number of rows fetched from the database at a time.
+    :param corridor_nm: For airsigmet, also return the AirSigmets within this many nautical
+        miles of the route.
+    :return: The Metar, Taf or AirSigmet records, or None if the flight route could not be found.
+    """
+    dep = flight_data['origin']['code']
+    arr = flight_data['destination']['code']
+
+    if wx_type == 'metar':
+        query = metar_query(session, dep, arr, limit, since).options(selectinload(Metar.sky_condition))
+        return streaming.iter_query(query, chunk_size, key=(Metar.observation_time, Metar.id), descending=True)
+
+    departure_epoch = flight_data["filed_departure_time"]['epoch']
+    arrival_epoch = flight_data['filed_arrival_time']['epoch']
+
+    if wx_type == 'airsigmet':
+        route = get_flight_route(client, faflightid)
+        if route is None:
+            return None
+        departure_epoch, arrival_epoch = flight_window(flight_data)
+        altitude = flight_altitude(flight_data)
+        query = airsigmet_query(session, arrival=arrival_epoch, departure=departure_epoch).\
+            options(selectinload(AirSigmet.area))
+        # Each chunk is checked against the route as one snapshot.
+        return (
+            airsig
+            for chunk in streaming.iter_chunks(query, chunk_size, key=AirSigmet.id)
+            for airsig in find_intersecting_airsigs(chunk, route, departure_epoch, arrival_epoch, altitude, corridor_nm)
+        )
+    elif wx_type == 'taf':
+        return iter(tafs(session, dep, departure_epoch, arr, arrival_epoch))
+    raise ValueError("Must be one of airsigmet, metar, or taf.")
+
+
+def main():
+    logging_setup.setup()
+    try:
+        args, modes = profiling.profile_option(sys.argv)
+    except ValueError as error:
+        print(error)
+        return
+    with profiling.profiled('calculations', modes):
+        run(args)
+
+
+def run(args: List[str]):
+    """
+    Run the calculations command.
+
+    :param args: Command line arguments, without --profile.
+    """
+    if args[1:] == ['refresh-wsdl']:
+        refresh_wsdl_cache(load_config())
+        return
+    try:
+        args, limit, since = metar_options(args)
+    except ValueError as error:
+        print(error)
+        return
+    args, stream = stream_option(args)
+    wx_type, flt_num, dep_apt, arr_apt, departure_epoch = clean_args(args)
+    if wx_type == "":
+        return
+    with profiling.span('config'):
+        config = load_config()
+
+    with profiling.span('flightaware.client'):
+        client = get_flightaware_client(config)
+    faflightid, flight_data = get_faflightid(client, flt_num, dep_apt, arr_apt, departure_epoch)
+
+    if faflightid == "":
+        return
+
+    with profiling.span('db.connect'):
+        session = get_db_session(config)
+    try:
+        if stream:
+            records = iter_flight_weather(
+                wx_type, faflightid, flight_data, client, session, limit, since,
+                corridor_nm=airsigmet_corridor(config),
+            )
+            if records is not None:
+                with profiling.span('output'):
+                    streaming.write_records(
+                        records, sys.stdout, stream == streaming.ARRAY, **serialization.output_options(config)
+                    )
             return
-        result = output(taf_data)
-    else:
-        raise ValueError("Must be one of airsigmet, metar, or taf.")
-    print(result)
+        with profiling.span('weather'):
+            result = flight_weather(
+                wx_type, faflightid, flight_data, client, session, limit=limit, since=since,
+                corridor_nm=airsigmet_corridor(config),
+            )
+    except ValueError:
+        if wx_type != 'taf':
+            raise
+        print('No tafs found within time range.')
+        return
+    if result is None:
+        return
+    with profiling.span('output'):
+        text = output(result, **serialization.output_options(config))
+    print(text)
+
+
+def history_limit(value: str) -> int:
+    """
+    Parse the number of Metars to return for each airport.
+
+    :param value: The --last option or last query parameter.
+    :return: The limit.
+    :raises ValueError: If value is not a positive integer.
+    """
+    limit = int(value)
+    if limit < 1:
+        raise ValueError(f'The number of Metars must be positive, not {limit}.')
+    return limit
+
+
+def metar_options(args: List[str]) -> Tuple[List[str], Optional[int], Optional[float]]:
+    """
+    Remove the metar history options from the command line arguments.
+
+    --latest returns only the newest Metar for each airport, --last N the newest N, and
+    --since EPOCH those observed at or after the given time.
+
+    :param args: Command line arguments.
+    :return: The remaining arguments, the per airport limit, and the since time.
+    """
+    remaining = []
+    limit = None
+    since = None
+    arguments = iter(args)
+    for arg in arguments:
+        try:
+            if arg == '--latest':
+                limit = 1
+            elif arg == '--last':
+                limit = history_limit(next(arguments))
+            elif arg == '--since':
+                since = float(next(arguments))
+            else:
+                remaining.append(arg)
+        except (StopIteration, ValueError):
+            raise ValueError(f'{arg} must be followed by a positive number.')
+    return remaining, limit, since
+
+
+def stream_option(args: List[str]) -> Tuple[List[str], Optional[str]]:
+    """
+    Remove the streaming options from the command line arguments.
+
+    --stream writes one JSON record per line as results are read from the database, and
+    --stream-array writes them as a single JSON array.
+
+    :param args: Command line arguments.
+    :return: The remaining arguments, and streaming.LINES, streaming.ARRAY or None.
+    """
+    options = {'--stream': streaming.LINES, '--stream-array': streaming.ARRAY}
+    stream = None
+    remaining = []
+    for arg in args:
+        if arg in options:
+            stream = options[arg]
+        else:
+            remaining.append(arg)
+    return remaining, stream
 
 
 def clean_args(args: list) -> Tuple[str, str, str, str, float]:
@@ -4,7 +4,6 @@ then stores the data in an SQL database for future retrieval.
 
 """
 import configparser
-import os.path
 from typing import List, Union
 import gzip
 import sys
@@ -14,19 +13,20 @@ import warnings
 
 from lxml import etree
 from lxml.etree import Element
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import MetaData
 from sqlalchemy.engine.url import URL
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.exc import OperationalError
-import requests
 
-from .sql_classes import AirSigmet, Taf, Metar
+from .sql_classes import AirSigmet, Generation, Taf, Metar
 from .xml_classes import AirSigmetXML2, PointsXML2, TafXML, ForecastXML, SkyConditionXML
 from .xml_classes import TurbulenceConditionXML, IcingConditionXML
 from .xml_classes import MetarXML, MetarSkyConditionXML
-from . import logging_setup
+from . import logging_setup, profiling
+from .settings import load_config
 
-logging_setup.setup()
 logger = logging.getLogger(__name__)
 
 
@@ -46,6 +46,8 @@ def get_data(weather_type: str) -> bytes:
         url = base_url + "metars.cache.xml.gz"
     else:
         raise ValueError('Requested weather type must be either "airsigmet", "taf", or "metar".')
+    # requests is only needed to download, so it isn't imported with the module.
+    import requests
     req = requests.get(url)
     return req.content
 
@@ -243,6 +245,26 @@ def delete_old_data(weather_type: str, dbsession: Session) -> None:
     to_delete.delete()
 
 
+def bump_generation(weather_type: str, dbsession: Session) -> int:
+    """
+    Record a successful ingest of a weather type, and commit.
+
+    Cached results computed from the older data are no longer used once the generation changes.
+
+    :param weather_type: metar, taf, or airsigmet
+    :param dbsession: The current database session.
+    :return: The new generation number.
+    """
+    now = datetime.datetime.utcnow()
+    updated = dbsession.query(Generation).\
+        filter(Generation.wx_type == weather_type).\
+        update({Generation.generation: Generation.generation + 1, Generation.updated: now}, synchronize_session=False)
+    if not updated:
+        dbsession.add(Generation(wx_type=weather_type, generation=1, updated=now))
+    dbsession.commit()
+    return dbsession.query(Generation.generation).filter(Generation.wx_type == weather_type).scalar()
+
+
 def get_db_session(config: configparser.ConfigParser) -> Session:
     """
     Open a database session.
@@ -271,6 +293,25 @@ def get_db_session(config: configparser.ConfigParser) -> Session:
     return session
 
 
+def create_indexes(engine: Engine, metadata: MetaData):
+    """
+    Create indexes that were added to the models after their tables were created.
+
+    :param engine: The database engine.
+    :param metadata: The models' metadata.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                logger.info(f"Creating index {index.name} on {table.name}")
+                index.create(engine)
+
+
 def to_db(maps: List[Union[AirSigmet, Taf, Metar]], session: Session):
     """
     Commit the data to the database.
@@ -283,6 +324,7 @@ def to_db(maps: List[Union[AirSigmet, Taf, Metar]], session: Session):
     engine = session.bind.engine
     base_object = maps[0]
     base_object.metadata.create_all(engine)
+    create_indexes(engine, base_object.metadata)
 
     # Add mappings and commit to the database.
     session.add_all(maps)
@@ -293,6 +335,22 @@ def main(args):
     """
     Download raw XML data, process it, then store the processed data into the database.
 
+    """
+    logging_setup.setup()
+    try:
+        args, modes = profiling.profile_option(args)
+    except ValueError as error:
+        print(error)
+        return
+    with profiling.profiled('converter', modes):
+        run(args)
+
+
+def run(args: List[str]):
+    """
+    Run the converter command.
+
+    :param args: Command line arguments, without --profile.
     """
     wx_types = {'airsigmet', 'taf', 'metar'}
     if len(args) < 2:
@@ -304,30 +362,43 @@ def main(args):
         logger.error(msg)
         raise ValueError('You must include an argument stating which weather type {} you wish to store.'.format(wx_types))
     weather_type = args[1]
-    config = configparser.ConfigParser()
-    config.read(
-        os.path.join(
-            os.path.dirname(__file__),
-            "config.ini",
-        )
-    )
-    xml_bytes = get_data(weather_type)
-    raw_xml = bytes_to_xml(xml_bytes)
-    if weather_type == 'airsigmet':
-        mapd = convert_airsigmets(raw_xml)
-    elif weather_type == 'taf':
-        mapd = convert_tafs(raw_xml)
-    elif weather_type == 'metar':
-        mapd = convert_metars(raw_xml)
-    else:
-        return
+    config = load_config()
+    with profiling.span('download'):
+        xml_bytes = get_data(weather_type)
+    with profiling.span('parse'):
+        raw_xml = bytes_to_xml(xml_bytes)
+    with profiling.span('convert'):
+        if weather_type == 'airsigmet':
+            mapd = convert_airsigmets(raw_xml)
+        elif weather_type == 'taf':
+            mapd = convert_tafs(raw_xml)
+        elif weather_type == 'metar':
+            mapd = convert_metars(raw_xml)
+        else:
+            return
     try:
-        db_session = get_db_session(config)
+        with profiling.span('db.connect'):
+            db_session = get_db_session(config)
     except OperationalError:
         logger.exception('Database could not be accessed.')
         return
-    to_db(mapd, db_session)
-    delete_old_data(weather_type, db_session)
+    with profiling.span('db.write'):
+        to_db(mapd, db_session)
+    with profiling.span('db.delete_old_data'):
+        delete_old_data(weather_type, db_session)
+    with profiling.span('db.bump_generation'):
+        generation = bump_generation(weather_type, db_session)
+    if weather_type == 'airsigmet':
+        # Imported here, as numpy is only needed by airsigmet, metar and taf ingests.
+        from . import hazards
+        if hazards.grid_enabled(config):
+            with profiling.span('hazards.update_hazard_grid'):
+                hazards.update_hazard_grid(config, db_session, generation)
+    if weather_type in ('metar', 'taf'):
+        # The station index needs numpy, like the hazard grid.
+        from . import spatial
+        with profiling.span('spatial.update_station_index'):
+            spatial.update_station_index(config, mapd, db_session)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,198 @@
+"""
+Vectorized spherical geometry.
+
+Positions are handled as arrays of unit vectors (n-vectors), so that distances and
+great circle tests over many points and arcs reduce to numpy dot and cross products.
+"""
+from typing import Optional
+
+import numpy as np
+
+EARTH_RADIUS_NM = 3440.065
+
+
+def to_unit_vectors(lats, lons) -> np.ndarray:
+    """
+    Convert latitudes and longitudes into unit vectors.
+
+    :param lats: Latitudes in degrees.
+    :param lons: Longitudes in degrees.
+    :return: Array of shape (n, 3).
+    """
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lon = np.radians(np.asarray(lons, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)), axis=-1)
+
+
+def to_latlons(vectors: np.ndarray):
+    """
+    Convert unit vectors back into latitudes and longitudes.
+
+    :param vectors: Array of shape (n, 3).
+    :return: Latitudes and longitudes in degrees.
+    """
+    x, y, z = vectors[..., 0], vectors[..., 1], vectors[..., 2]
+    return np.degrees(np.arctan2(z, np.hypot(x, y))), np.degrees(np.arctan2(y, x))
+
+
+def nm_to_radians(distance_nm: float) -> float:
+    return distance_nm / EARTH_RADIUS_NM
+
+
+def radians_to_nm(angle):
+    return angle * EARTH_RADIUS_NM
+
+
+def angular_distance(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Great circle angle between unit vectors, broadcasting over leading dimensions.
+
+    :param a: Unit vectors.
+    :param b: Unit vectors.
+    :return: Angles in radians.
+    """
+    return np.arctan2(np.linalg.norm(np.cross(a, b), axis=-1), np.sum(a * b, axis=-1))
+
+
+def arc_distance(
+        points: np.ndarray,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        normals: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Distance from each point to each minor great circle arc.
+
+    If a point's projection onto the arc's great circle falls between the arc's end
+    points, the distance is the cross-track distance. Otherwise it is the distance
+    to the nearer end point.
+
+    :param points: Unit vectors of shape (n, 3).
+    :param starts: Arc start unit vectors of shape (s, 3).
+    :param ends: Arc end unit vectors of shape (s, 3).
+    :param normals: The arcs' unit normals, if already known. Zero for zero length arcs.
+    :return: Angles in radians, of shape (n, s).
+    """
+    if normals is None:
+        normals = np.cross(starts, ends)
+        lengths = np.linalg.norm(normals, axis=-1)
+        degenerate = lengths < 1e-12
+        normals = normals / np.where(degenerate, 1.0, lengths)[:, None]
+    else:
+        degenerate = np.linalg.norm(normals, axis=-1) < 0.5
+
+    p = points[:, None, :]
+    cross_track = np.abs(np.arcsin(np.clip(points @ normals.T, -1.0, 1.0)))
+    after_start = np.einsum("nsk,sk->ns", np.cross(starts[None, :, :], p), normals) >= 0
+    before_end = np.einsum("nsk,sk->ns", np.cross(p, ends[None, :, :]), normals) >= 0
+    to_ends = np.minimum(angular_distance(p, starts[None, :, :]), angular_distance(p, ends[None, :, :]))
+    within = after_start & before_end & ~degenerate[None, :]
+    return np.where(within, cross_track, to_ends)
+
+
+def arcs_cross(
+        a_starts: np.ndarray,
+        a_ends: np.ndarray,
+        b_starts: np.ndarray,
+        b_ends: np.ndarray,
+        a_normals: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Test every pair of minor great circle arcs for crossings.
+
+    Two arcs cross when each one's end points lie on opposite sides of the other's great
+    circle, and the arcs are on the same side of the globe. Touching counts as crossing.
+    Zero length arcs never cross anything.
+
+    :param a_starts: Start unit vectors of the first arcs, of shape (a, 3).
+    :param a_ends: End unit vectors of the first arcs, of shape (a, 3).
+    :param b_starts: Start unit vectors of the second arcs, of shape (b, 3).
+    :param b_ends: End unit vectors of the second arcs, of shape (b, 3).
+    :param a_normals: Normals of the first arcs, if already known. Zero for zero length arcs.
+    :return: Boolean array of shape (a, b).
+    """
+    if a_normals is None:
+        a_normals = np.cross(a_starts, a_ends)
+    b_normals = np.cross(b_starts, b_ends)
+    a_valid = np.linalg.norm(a_normals, axis=-1) > 1e-12
+    b_valid = np.linalg.norm(b_normals, axis=-1) > 1e-12
+    b_sides = (a_normals @ b_starts.T) * (a_normals @ b_ends.T)
+    a_sides = (a_starts @ b_normals.T) * (a_ends @ b_normals.T)
+    same_side = (a_starts + a_ends) @ (b_starts + b_ends).T > 0
+    return (b_sides <= 0) & (a_sides <= 0) & same_side & a_valid[:, None] & b_valid[None, :]
+
+
+def arcs_distance(
+        a_starts: np.ndarray,
+        a_ends: np.ndarray,
+        b_starts: np.ndarray,
+        b_ends: np.ndarray,
+        a_normals: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Distance between every pair of minor great circle arcs.
+
+    Crossing arcs are zero apart. Otherwise the closest points of two arcs include an end
+    point of one of them, so the distance is the least distance from an end point of
+    either arc to the other arc.
+
+    :param a_starts: Start unit vectors of the first arcs, of shape (a, 3).
+    :param a_ends: End unit vectors of the first arcs, of shape (a, 3).
+    :param b_starts: Start unit vectors of the second arcs, of shape (b, 3).
+    :param b_ends: End unit vectors of the second arcs, of shape (b, 3).
+    :param a_normals: Normals of the first arcs, if already known. Zero for zero length arcs.
+    :return: Angles in radians, of shape (a, b).
+    """
+    distances = np.minimum.reduce([
+        arc_distance(b_starts, a_starts, a_ends, a_normals).T,
+        arc_distance(b_ends, a_starts, a_ends, a_normals).T,
+        arc_distance(a_starts, b_starts, b_ends),
+        arc_distance(a_ends, b_starts, b_ends),
+    ])
+    # arcs_cross() counts arcs on the same great circle as touching. If they overlap, an
+    # end point of one lies on the other, so the end point distances are right for them.
+    normals = np.cross(a_starts, a_ends) if a_normals is None else a_normals
+    normals = normals / np.maximum(np.linalg.norm(normals, axis=-1), 1e-12)[:, None]
+    collinear = (np.abs(normals @ b_starts.T) < 1e-12) & (np.abs(normals @ b_ends.T) < 1e-12)
+    crossing = arcs_cross(a_starts, a_ends, b_starts, b_ends, a_normals) & ~collinear
+    return np.where(crossing, 0.0, distances)
+
+
+def gnomonic(points: np.ndarray, center: np.ndarray):
+    """
+    Gnomonic projection onto the plane tangent to the sphere at center.
+
+    Great circles project to straight lines, so planar polygon tests are exact for
+    polygons with great circle edges. Only points in the hemisphere around center can be
+    projected.
+
+    :param points: Unit vectors of shape (n, 3).
+    :param center: Unit vector of the tangent point.
+    :return: Plane coordinates of shape (n, 2), and a mask of the points that could be projected.
+    """
+    pole = np.array([0.0, 0.0, 1.0]) if abs(center[2]) < 0.9 else np.array([1.0, 0.0, 0.0])
+    east = np.cross(pole, center)
+    east /= np.linalg.norm(east)
+    north = np.cross(center, east)
+    heights = points @ center
+    valid = heights > 1e-9
+    scale = 1.0 / np.where(valid, heights, 1.0)
+    return np.stack((points @ east * scale, points @ north * scale), axis=-1), valid
+
+
+def points_in_polygon(points: np.ndarray, polygon: np.ndarray) -> np.ndarray:
+    """
+    Even-odd test of planar points against a planar polygon.
+
+    :param points: Coordinates of shape (n, 2).
+    :param polygon: Vertex coordinates of shape (k, 2). The polygon is closed automatically.
+    :return: Boolean array of shape (n,).
+    """
+    x, y = points[:, 0, None], points[:, 1, None]
+    x0, y0 = polygon[:, 0], polygon[:, 1]
+    x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+    straddles = (y0 > y) != (y1 > y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossing_x = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+    return np.count_nonzero(straddles & (x < crossing_x), axis=1) % 2 == 1
@@ -0,0 +1,351 @@
+"""
+Rasterized AirSigmet hazard grid.
+
+After each airsigmet ingest, the converter can rasterize every active AirSigmet onto a
+latitude/longitude grid (0.1 degrees by default), with one bitmask per hazard type and
+altitude band. The grid is saved in the cache directory as a .npy file of packed bits,
+which the service memory maps, with a small JSON header beside it.
+
+A snapshot with a grid attached checks routes in two steps. Each route segment is
+sampled through the grid, every half a cell, and only the segments passing through a
+marked cell of an altitude band they fly in are checked against the AirSigmets' polygons.
+A route that touches no marked cell is clear without any polygon math at all.
+
+Each AirSigmet marks the cells holding its vertices, edges and interior, and one more
+cell all round, so a route can't slip between samples past a marked cell. Near the poles
+a grid cell is narrower than the sampling step, so there the grid is only approximate.
+
+Configuration, in the [hazard_grid] section of config.ini::
+
+    enabled = true
+    resolution = 0.1
+    altitude_bands = 10000, 18000, 30000
+"""
+import configparser
+import json
+import math
+import os
+import time
+import logging
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from . import geometry
+from .routes import Route
+from .settings import cache_dir
+
+logger = logging.getLogger(__name__)
+
+GRID_FILE = 'hazards.npy'
+HEADER_FILE = 'hazards.json'
+DEFAULT_RESOLUTION = 0.1
+DEFAULT_ALTITUDE_BANDS = (10000.0, 18000.0, 30000.0)
+UNKNOWN_HAZARD = 'UNKNOWN'
+
+
+class HazardGrid:
+    """
+    Bitmasks of the grid cells near AirSigmets, by hazard type and altitude band.
+
+    :param bits: Packed bits of shape (layers, rows, ceil(columns / 8)). Layer
+        h * len(bands) + b holds hazard h in altitude band b.
+    :param resolution: Cell size in degrees.
+    :param hazards: Hazard type names.
+    :param band_edges: Altitudes in feet MSL separating the altitude bands. The first band
+        is everything below the first edge, and the last everything above the last edge.
+    :param generation: The airsigmet ingest generation the grid was built from.
+    """
+
+    def __init__(
+            self,
+            bits: np.ndarray,
+            resolution: float,
+            hazards: Sequence[str],
+            band_edges: Sequence[float],
+            generation: Optional[int] = None,
+    ):
+        self.bits = bits
+        self.resolution = resolution
+        self.hazards = list(hazards)
+        self.band_edges = np.asarray(band_edges, dtype=np.float64)
+        self.generation = generation
+        self.rows = int(round(180 / resolution))
+        self.columns = int(round(360 / resolution))
+
+    @property
+    def bands(self) -> int:
+        return len(self.band_edges) + 1
+
+    @classmethod
+    def empty(
+            cls,
+            resolution: float = DEFAULT_RESOLUTION,
+            hazards: Sequence[str] = (),
+            band_edges: Sequence[float] = DEFAULT_ALTITUDE_BANDS,
+            generation: Optional[int] = None,
+    ) -> "HazardGrid":
+        rows = int(round(180 / resolution))
+        columns = int(round(360 / resolution))
+        bits = np.zeros((len(hazards) * (len(band_edges) + 1), rows, (columns + 7) // 8), dtype=np.uint8)
+        return cls(bits, resolution, hazards, band_edges, generation)
+
+    @classmethod
+    def build(
+            cls,
+            snapshot,
+            resolution: float = DEFAULT_RESOLUTION,
+            band_edges: Sequence[float] = DEFAULT_ALTITUDE_BANDS,
+    ) -> "HazardGrid":
+        """
+        Rasterize the AirSigmets in a snapshot.
+
+        :param snapshot: An AdvisorySnapshot holding the AirSigmets.
+        :param resolution: Cell size in degrees.
+        :param band_edges: Altitudes in feet MSL separating the altitude bands.
+        :return: The grid, at the snapshot's generation.
+        """
+        types = [x.hazard__type or UNKNOWN_HAZARD for x in snapshot.airsigs]
+        grid = cls.empty(resolution, sorted(set(types)), band_edges, snapshot.generation)
+        hazard_index = {name: i for i, name in enumerate(grid.hazards)}
+        lows = np.concatenate(([-math.inf], grid.band_edges))
+        highs = np.concatenate((grid.band_edges, [math.inf]))
+        for index, hazard in enumerate(types):
+            if snapshot.radii[index] < 0:
+                continue
+            rows, columns = grid._cells(snapshot.polygon(index), snapshot.centers[index], snapshot.radii[index])
+            in_band = (lows <= snapshot.max_altitude_ft[index]) & (highs >= snapshot.min_altitude_ft[index])
+            for band in np.flatnonzero(in_band):
+                layer = hazard_index[hazard] * grid.bands + band
+                np.bitwise_or.at(grid.bits[layer], (rows, columns >> 3), (128 >> (columns & 7)).astype(np.uint8))
+        return grid
+
+    def _row_column(self, lats: np.ndarray, lons: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        rows = np.clip(np.floor((lats + 90) / self.resolution).astype(np.int64), 0, self.rows - 1)
+        columns = np.floor((lons + 180) / self.resolution).astype(np.int64)
+        return rows, columns
+
+    def _cells(self, vertices: np.ndarray, center: np.ndarray, radius: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The cells near one polygon, as row and column index arrays.
+        """
+        step = math.radians(self.resolution) / 2
+        edges = sample_arcs(vertices, np.roll(vertices, -1, axis=0), step)[0]
+        lats, lons = geometry.to_latlons(edges.reshape(-1, 3))
+        center_lat, center_lon = (float(x[0]) for x in geometry.to_latlons(center[None, :]))
+        # Longitudes relative to the polygon's centre, so polygons crossing the antimeridian
+        # stay in one piece.
+        relative = (lons - center_lon + 180) % 360 - 180
+        row_min, col_min = self._row_column(lats.min(), center_lon + relative.min())
+        row_max, col_max = self._row_column(lats.max(), center_lon + relative.max())
+        if abs(center_lat) + math.degrees(radius) >= 90:
+            # Polygons around a pole cover every longitude.
+            row_min = 0 if center_lat < 0 else row_min
+            row_max = self.rows - 1 if center_lat > 0 else row_max
+            col_min, col_max = self._row_column(0.0, np.array([center_lon - 180, center_lon + 180]))[1]
+        # One spare cell all round, for the dilation.
+        row_min, col_min = int(row_min) - 1, int(col_min) - 1
+        row_max, col_max = int(row_max) + 1, int(col_max) + 1
+        cells = np.zeros((row_max - row_min + 1, col_max - col_min + 1), dtype=bool)
+
+        rows, columns = self._row_column(lats, center_lon + relative)
+        cells[rows - row_min, columns - col_min] = True
+        polygon, valid = geometry.gnomonic(vertices, center)
+        if len(vertices) >= 3 and valid.all():
+            grid_rows, grid_columns = np.mgrid[row_min:row_max + 1, col_min:col_max + 1]
+            centers = geometry.to_unit_vectors(
+                np.clip((grid_rows + 0.5) * self.resolution - 90, -90, 90).ravel(),
+                ((grid_columns + 0.5) * self.resolution - 180).ravel(),
+            )
+            points, in_hemisphere = geometry.gnomonic(centers, center)
+            inside = np.zeros(len(centers), dtype=bool)
+            inside[in_hemisphere] = geometry.points_in_polygon(points[in_hemisphere], polygon)
+            cells |= inside.reshape(cells.shape)
+        elif len(vertices) >= 3:
+            cells[:] = True
+
+        dilated = cells.copy()
+        dilated[1:] |= cells[:-1]
+        dilated[:-1] |= cells[1:]
+        grown = dilated.copy()
+        grown[:, 1:] |= dilated[:, :-1]
+        grown[:, :-1] |= dilated[:, 1:]
+        rows, columns = np.nonzero(grown)
+        rows = rows + row_min
+        keep = (rows >= 0) & (rows < self.rows)
+        return rows[keep], (columns[keep] + col_min) % self.columns
+
+    def layers(self, hazards: Optional[Set[str]] = None) -> np.ndarray:
+        """
+        Mask of the layers holding the given hazard types, or every layer.
+        """
+        wanted = np.array([hazards is None or x in hazards for x in self.hazards], dtype=bool)
+        return np.repeat(wanted, self.bands)
+
+    def sample(self, route: Route) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Look up the grid every half a cell along a route.
+
+        :param route: The route.
+        :return: The segment of each sample, of shape (n,), and the bits of every layer at
+            each sample, of shape (n, layers).
+        """
+        points, segments = sample_arcs(route.starts, route.ends, math.radians(self.resolution) / 2)
+        lats, lons = geometry.to_latlons(points)
+        rows, columns = self._row_column(lats, lons)
+        columns %= self.columns
+        bits = (self.bits[:, rows, columns >> 3] >> (7 - (columns & 7)).astype(np.uint8)) & 1
+        return segments, bits.T.astype(bool)
+
+    def positive_segments(
+            self,
+            route: Route,
+            low: Optional[np.ndarray] = None,
+            high: Optional[np.ndarray] = None,
+            hazards: Optional[Set[str]] = None,
+    ) -> np.ndarray:
+        """
+        Find the route segments passing through a marked cell.
+
+        :param route: The route.
+        :param low: Lowest altitude flown on each segment in feet MSL, see Route.altitude_bands().
+            If given with high, only the altitude bands flown on each segment are looked at.
+        :param high: Highest altitude flown on each segment in feet MSL.
+        :param hazards: Only look at these hazard types.
+        :return: Boolean mask of shape (segments,).
+        """
+        if not len(route) or not len(self.hazards):
+            return np.zeros(len(route), dtype=bool)
+        segments, bits = self.sample(route)
+        selected = np.broadcast_to(self.layers(hazards), (len(route), len(self.hazards) * self.bands))
+        if low is not None and high is not None:
+            lows = np.concatenate(([-math.inf], self.band_edges))
+            highs = np.concatenate((self.band_edges, [math.inf]))
+            in_band = (lows[None, :] <= high[:, None]) & (highs[None, :] >= low[:, None])
+            selected = selected & np.tile(in_band, (1, len(self.hazards)))
+        hits = (bits & selected[segments]).any(axis=1)
+        return np.bincount(segments[hits], minlength=len(route)) > 0
+
+    def hazards_along(self, route: Route) -> List[str]:
+        """
+        The hazard types marked anywhere along a route, in any altitude band.
+        """
+        if not len(route) or not len(self.hazards):
+            return []
+        found = self.sample(route)[1].any(axis=0).reshape(len(self.hazards), self.bands).any(axis=1)
+        return [name for name, hit in zip(self.hazards, found) if hit]
+
+    def header(self) -> dict:
+        return {
+            'resolution': self.resolution,
+            'hazards': self.hazards,
+            'band_edges': self.band_edges.tolist(),
+            'generation': self.generation,
+            'shape': list(self.bits.shape),
+        }
+
+    def save(self, directory: str):
+        """
+        Write the grid into a directory, replacing any earlier grid.
+
+        The files are written under temporary names and renamed into place, the header
+        last, so readers never load half a grid.
+        """
+        grid_path = os.path.join(directory, GRID_FILE)
+        header_path = os.path.join(directory, HEADER_FILE)
+        with open(grid_path + '.tmp', 'wb') as file:
+            np.save(file, self.bits)
+        with open(header_path + '.tmp', 'w') as file:
+            json.dump(self.header(), file)
+        os.replace(grid_path + '.tmp', grid_path)
+        os.replace(header_path + '.tmp', header_path)
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["HazardGrid"]:
+        """
+        Memory map a saved grid.
+
+        :param directory: The directory it was saved in.
+        :return: The grid, or None if there isn't one.
+        """
+        try:
+            with open(os.path.join(directory, HEADER_FILE)) as file:
+                header = json.load(file)
+            bits = np.load(os.path.join(directory, GRID_FILE), mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        if list(bits.shape) != header['shape']:
+            return None
+        return cls(bits, header['resolution'], header['hazards'], header['band_edges'], header['generation'])
+
+
+def sample_arcs(starts: np.ndarray, ends: np.ndarray, step: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Points along minor great circle arcs, no more than step apart, including both ends.
+
+    :param starts: Arc start unit vectors of shape (s, 3).
+    :param ends: Arc end unit vectors of shape (s, 3).
+    :param step: Largest angle between samples, in radians.
+    :return: Sample unit vectors of shape (n, 3), and the arc of each sample, of shape (n,).
+    """
+    lengths = geometry.angular_distance(starts, ends).reshape(-1)
+    counts = np.ceil(lengths / step).astype(np.int64) + 1
+    arcs = np.repeat(np.arange(len(starts)), counts)
+    first = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    fractions = ((np.arange(len(arcs)) - first[arcs]) / np.maximum(counts[arcs] - 1, 1))[:, None]
+    # Linear interpolation, pushed back onto the sphere, with fractions adjusted so the
+    # samples are evenly spaced along the arc.
+    angles = lengths[arcs, None]
+    sines = np.sin(angles)
+    safe = np.where(sines > 1e-12, sines, 1.0)
+    a = np.where(sines > 1e-12, np.sin((1 - fractions) * angles) / safe, 1 - fractions)
+    b = np.where(sines > 1e-12, np.sin(fractions * angles) / safe, fractions)
+    points = a * starts[arcs] + b * ends[arcs]
+    points /= np.maximum(np.linalg.norm(points, axis=-1), 1e-12)[:, None]
+    return points, arcs
+
+
+def grid_enabled(config: configparser.ConfigParser) -> bool:
+    return config.getboolean('hazard_grid', 'enabled', fallback=False)
+
+
+def grid_options(config: configparser.ConfigParser) -> Dict[str, object]:
+    """
+    The [hazard_grid] resolution and altitude_bands settings, as HazardGrid.build() arguments.
+    """
+    bands = config.get('hazard_grid', 'altitude_bands', fallback='')
+    return {
+        'resolution': config.getfloat('hazard_grid', 'resolution', fallback=DEFAULT_RESOLUTION),
+        'band_edges': [float(x) for x in bands.split(',') if x.strip()] if bands else DEFAULT_ALTITUDE_BANDS,
+    }
+
+
+def update_hazard_grid(config: configparser.ConfigParser, session: Session, generation: Optional[int]) -> HazardGrid:
+    """
+    Rasterize every stored AirSigmet and save the grid in the cache directory.
+
+    :param config: The parsed configuration.
+    :param session: Database session to load the AirSigmets from. They are detached from it.
+    :param generation: The airsigmet ingest generation just stored.
+    :return: The new grid.
+    """
+    from .advisories import load_snapshot
+    started = time.perf_counter()
+    # Every stored AirSigmet, so the grid covers the service's lookback window too.
+    snapshot = load_snapshot(session, 0.0, generation)
+    grid = HazardGrid.build(snapshot, **grid_options(config))
+    grid.save(cache_dir(config))
+    logger.info(
+        f'Rasterized {len(snapshot)} AirSigmets at generation {generation} in {time.perf_counter() - started:.3f}s'
+    )
+    return grid
+
+
+def load_hazard_grid(config: configparser.ConfigParser) -> Optional[HazardGrid]:
+    """
+    Memory map the grid saved by the converter, if the grid is enabled and has been built.
+    """
+    if not grid_enabled(config):
+        return None
+    return HazardGrid.load(cache_dir(config))
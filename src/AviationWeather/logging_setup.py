@@ -1,50 +1,112 @@
 # coding=utf-8
+"""
+Logging configuration for the command line programs.
+
+Logging is configured once, by each program's main(), rather than when modules are
+imported. Log records are put on a queue by a QueueHandler on the root logger, and a
+QueueListener thread formats them and writes them to the real handlers, so a request
+thread never waits on a log file.
+"""
+import atexit
 import configparser
 import os
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+from .settings import load_config
+
+LOG_FORMAT = "[%(asctime)s][%(levelname)s] %(name)s %(filename)s:%(funcName)s:%(lineno)d | %(message)s\n"
+
+_QUEUE_HANDLER: Optional[QueueHandler] = None
+_LISTENER: Optional[QueueListener] = None
+
+
+def parse_levels(value: str) -> Dict[str, int]:
+    """
+    Parse per-logger levels, such as "AviationWeather.calculations:DEBUG, zeep:WARNING".
+
+    :param value: Comma separated logger:level pairs.
+    :return: Levels keyed by logger name.
+    """
+    levels = {}
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        name, _, level = item.rpartition(':')
+        number = logging.getLevelName(level.strip().upper())
+        if not name.strip() or not isinstance(number, int):
+            raise ValueError(f'Logging levels must be logger:level pairs, not {item.strip()}')
+        levels[name.strip()] = number
+    return levels
 
 
-def configure_logging(*handlers: logging.Handler):
+def configure_logging(*handlers: logging.Handler, levels: Optional[Dict[str, int]] = None) -> QueueListener:
     """
     Set up logging for each type of logging handler.
 
     Handler types will vary with the environment and whether we are using Sentry.io
-    or not.
+    or not. The handlers are fed from a queue by a background thread, and replace those
+    of any earlier call.
 
     :param handlers: the various logging.Handler objects
+    :param levels: Levels of individual loggers, keyed by logger name.
+    :return: The listener writing to the handlers.
     """
-    log_format = "[%(asctime)s][%(levelname)s] %(name)s %(filename)s:%(funcName)s:%(lineno)d | %(message)s\n"
-    root_logger = logging.getLogger()
+    global _QUEUE_HANDLER, _LISTENER
+    shutdown()
     for handler in handlers:
         if isinstance(handler, logging.FileHandler):
-            formatter = logging.Formatter(log_format)
-            handler.setFormatter(formatter)
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
             handler.setLevel(logging.ERROR)
-            root_logger.addHandler(handler)
         elif isinstance(handler, logging.StreamHandler):
-            formatter = logging.Formatter(log_format)
-            handler.setFormatter(formatter)
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
             handler.setLevel(logging.DEBUG)
-            root_logger.addHandler(handler)
+    for name, level in (levels or {}).items():
+        logging.getLogger(name).setLevel(level)
 
-    root_logger.propagate = False
-    return
+    records = queue.Queue(-1)
+    _QUEUE_HANDLER = QueueHandler(records)
+    _LISTENER = QueueListener(records, *handlers, respect_handler_level=True)
+    logging.getLogger().addHandler(_QUEUE_HANDLER)
+    _LISTENER.start()
+    return _LISTENER
 
 
-def setup():
-    config = configparser.ConfigParser()
-    config.read(
-        os.path.join(
-            os.path.dirname(__file__),
-            "config.ini",
-        )
+def shutdown():
+    """
+    Write out any queued log records, and remove the handlers added by configure_logging().
+    """
+    global _QUEUE_HANDLER, _LISTENER
+    if _LISTENER is not None:
+        _LISTENER.stop()
+        for handler in _LISTENER.handlers:
+            handler.close()
+        _LISTENER = None
+    if _QUEUE_HANDLER is not None:
+        logging.getLogger().removeHandler(_QUEUE_HANDLER)
+        _QUEUE_HANDLER = None
+
+
+def setup(config: Optional[configparser.ConfigParser] = None) -> QueueListener:
+    """
+    Configure logging from the [logging] section of config.ini, unless it is already configured.
+
+    :param config: The parsed configuration. Read from config.ini if not given.
+    :return: The listener writing log records.
+    """
+    if _LISTENER is not None:
+        return _LISTENER
+    if config is None:
+        config = load_config()
+    levels = parse_levels(config.get('logging', 'levels', fallback=''))
+    if config.get('logging', 'environment', fallback='development') == 'development':
+        return configure_logging(logging.StreamHandler(), levels=levels)
+    os.makedirs(config['logging']['logpath'], exist_ok=True)
+    return configure_logging(
+        logging.FileHandler(os.path.join(config['logging']['logpath'], 'errors.log')), levels=levels
     )
 
-    if config['logging']['environment'] == 'development':
-        configure_logging(logging.StreamHandler())
-    else:
-        if not os.path.exists(config['logging']['logpath']):
-            os.mkdir(config['logging']['logpath'])
-        configure_logging(
-            logging.FileHandler(os.path.join(config['logging']['logpath'], 'errors.log'))
-        )
+
+atexit.register(shutdown)
@@ -0,0 +1,100 @@
+"""
+In-process timing metrics.
+
+Timings are aggregated per name (count, total, last and max seconds, and a histogram
+over fixed latency buckets) so recording them costs the same however long the process
+runs. Percentiles are estimated from the histogram. The service exposes the current
+values at /metrics.
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+# Upper bounds in seconds of the latency buckets. Slower timings go in a last, unbounded bucket.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PERCENTILES = (50, 90, 99)
+
+_LOCK = threading.Lock()
+_TIMINGS: Dict[str, Dict[str, float]] = {}
+_HISTOGRAMS: Dict[str, List[int]] = {}
+
+
+def record(name: str, seconds: float):
+    """
+    Record one timing.
+
+    :param name: Name of the timed operation.
+    :param seconds: How long the operation took.
+    """
+    bucket = bisect.bisect_left(BUCKETS, seconds)
+    with _LOCK:
+        timing = _TIMINGS.get(name)
+        if timing is None:
+            _TIMINGS[name] = {'count': 1, 'total': seconds, 'last': seconds, 'max': seconds}
+            _HISTOGRAMS[name] = [0] * (len(BUCKETS) + 1)
+            _HISTOGRAMS[name][bucket] = 1
+            return
+        timing['count'] += 1
+        timing['total'] += seconds
+        timing['last'] = seconds
+        timing['max'] = max(timing['max'], seconds)
+        _HISTOGRAMS[name][bucket] += 1
+
+
+@contextmanager
+def timer(name: str) -> Iterator[None]:
+    """
+    Time the enclosed block and record it under the given name.
+
+    :param name: Name of the timed operation.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def percentile(counts: List[int], percent: float, maximum: float) -> float:
+    """
+    Estimate a percentile from histogram counts.
+
+    :param counts: Timings in each of BUCKETS, then in the unbounded bucket.
+    :param percent: The percentile, such as 99.
+    :param maximum: The longest timing recorded, which bounds the estimate.
+    :return: The upper bound of the bucket holding the percentile, in seconds.
+    """
+    rank = max(1, math.ceil(sum(counts) * percent / 100))
+    seen = 0
+    for bound, count in zip(BUCKETS, counts):
+        seen += count
+        if seen >= rank:
+            return min(bound, maximum)
+    return maximum
+
+
+def snapshot() -> Dict[str, Dict[str, object]]:
+    """
+    Copy of the current timings, with p50, p90 and p99 estimates and the histogram.
+
+    The histogram maps each bucket's upper bound in seconds, or '+Inf', to the number of
+    timings in that bucket.
+    """
+    with _LOCK:
+        result = {}
+        for name, timing in _TIMINGS.items():
+            counts = _HISTOGRAMS[name]
+            result[name] = dict(timing)
+            for percent in PERCENTILES:
+                result[name][f'p{percent}'] = percentile(counts, percent, timing['max'])
+            result[name]['buckets'] = dict(zip([str(x) for x in BUCKETS] + ['+Inf'], counts))
+        return result
+
+
+def reset():
+    with _LOCK:
+        _TIMINGS.clear()
+        _HISTOGRAMS.clear()
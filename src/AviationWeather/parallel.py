@@ -0,0 +1,178 @@
+"""
+Multi-process route intersection for large batches.
+
+Checking a whole bank of flights against a new set of AirSigmets is CPU bound.
+IntersectionPool spreads the routes over a pool of worker processes:
+
+* The AirSigmets' packed arrays are written once to .npy files in a temporary directory,
+  and each worker memory maps them. The AirSigmets themselves never leave the parent
+  process, so nothing but routes and result indexes is pickled, and every worker shares
+  the same pages of geometry.
+* Routes are sent in chunks, and pickle as their waypoints only.
+* Chunks are handed out as workers become free, and results are put back in input order,
+  so the output doesn't depend on the number of workers or on scheduling.
+
+Workers are started with the spawn method, so they don't inherit the parent's database
+connections or threads. Starting them is slow, so a pool is kept when the AirSigmets
+change: update() writes the new arrays to a new directory, which is sent with each chunk,
+and each worker maps them in place of the old ones when it next sees that directory.
+
+Example::
+
+    with IntersectionPool(snapshot, workers=32) as pool:
+        results = pool.find_intersecting(FlightRoute(route, departure, arrival) for route, ... in flights)
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+import logging
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .advisories import AdvisorySnapshot
+from .routes import Route
+from .sql_classes import AirSigmet
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 64
+
+_SNAPSHOT: Optional[AdvisorySnapshot] = None
+_DIRECTORY: Optional[str] = None
+
+
+class FlightRoute(NamedTuple):
+    """
+    A route to check, and the arguments for AdvisorySnapshot.find_intersecting().
+    """
+    route: Route
+    departure: Optional[float] = None
+    arrival: Optional[float] = None
+    altitude: Optional[float] = None
+    corridor_nm: float = 0.0
+
+
+def _init_worker(directory: str):
+    global _SNAPSHOT, _DIRECTORY
+    arrays = {
+        name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in AdvisorySnapshot.ARRAYS
+    }
+    _SNAPSHOT = AdvisorySnapshot.from_arrays(arrays)
+    _DIRECTORY = directory
+
+
+def _find_indexes(task: Tuple[str, List[FlightRoute]]) -> List[np.ndarray]:
+    directory, flights = task
+    if directory != _DIRECTORY:
+        _init_worker(directory)
+    return [_SNAPSHOT.find_indexes(*flight) for flight in flights]
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+class IntersectionPool:
+    """
+    Worker processes checking routes against one AdvisorySnapshot.
+
+    :param snapshot: The AirSigmets to check routes against.
+    :param workers: Number of worker processes. Defaults to the number of CPUs. With one
+        worker, routes are checked in this process.
+    :param chunk_size: Number of routes sent to a worker at a time.
+    """
+
+    def __init__(self, snapshot: AdvisorySnapshot, workers: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.snapshot = snapshot
+        self.workers = workers or default_workers()
+        self.chunk_size = chunk_size
+        self._root: Optional[str] = None
+        self._directory: Optional[str] = None
+        self._version = 0
+        self._pool = None
+        if self.workers > 1:
+            self._root = tempfile.mkdtemp(prefix='airsigmets-')
+            self._write(snapshot)
+            context = multiprocessing.get_context('spawn')
+            self._pool = context.Pool(self.workers, _init_worker, (self._directory,))
+            logger.debug(f'Started {self.workers} workers for {len(snapshot)} AirSigmets')
+
+    def _write(self, snapshot: AdvisorySnapshot):
+        directory = os.path.join(self._root, str(self._version))
+        os.mkdir(directory)
+        for name, array in snapshot.arrays().items():
+            np.save(os.path.join(directory, f'{name}.npy'), array)
+        self._directory = directory
+        self._version += 1
+
+    def update(self, snapshot: AdvisorySnapshot):
+        """
+        Check later routes against a new snapshot, keeping the worker processes.
+
+        :param snapshot: The new AirSigmets.
+        """
+        if snapshot is self.snapshot:
+            return
+        self.snapshot = snapshot
+        if self._pool is None:
+            return
+        previous = self._directory
+        self._write(snapshot)
+        # No chunks are in flight between calls, and workers map the new arrays on their next chunk.
+        shutil.rmtree(previous, ignore_errors=True)
+        logger.debug(f'Sent {len(snapshot)} AirSigmets to {self.workers} workers')
+
+    def __enter__(self) -> "IntersectionPool":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def find_intersecting(self, flights: Iterable[FlightRoute]) -> List[List[AirSigmet]]:
+        """
+        Find the AirSigmets each route passes through.
+
+        :param flights: The routes to check.
+        :return: The intersected AirSigmets of each route, in the same order as the routes.
+        """
+        flights = list(flights)
+        if self._pool is None:
+            indexes = [self.snapshot.find_indexes(*flight) for flight in flights]
+        else:
+            chunks = [
+                (self._directory, flights[i:i + self.chunk_size]) for i in range(0, len(flights), self.chunk_size)
+            ]
+            indexes = [found for chunk in self._pool.imap(_find_indexes, chunks) for found in chunk]
+        return [[self.snapshot.airsigs[i] for i in found] for found in indexes]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        if self._root is not None:
+            shutil.rmtree(self._root, ignore_errors=True)
+            self._root = None
+            self._directory = None
+
+
+def find_intersecting_many(
+        airsigs: Union[Sequence[AirSigmet], AdvisorySnapshot],
+        flights: Iterable[FlightRoute],
+        workers: Optional[int] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> List[List[AirSigmet]]:
+    """
+    Find the AirSigmets each of many routes passes through, using several processes.
+
+    :param airsigs: Candidate AirSigmets, or a snapshot of them.
+    :param flights: The routes to check.
+    :param workers: Number of worker processes. Defaults to the number of CPUs.
+    :param chunk_size: Number of routes sent to a worker at a time.
+    :return: The intersected AirSigmets of each route, in the same order as the routes.
+    """
+    snapshot = airsigs if isinstance(airsigs, AdvisorySnapshot) else AdvisorySnapshot(airsigs)
+    with IntersectionPool(snapshot, workers, chunk_size) as pool:
+        return pool.find_intersecting(flights)
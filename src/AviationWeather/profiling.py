@@ -0,0 +1,213 @@
+"""
+Opt-in profiling and tracing for the command line tools.
+
+The stages of a command (loading the WSDL, FlightAware calls, database queries,
+geometry, output) are wrapped in named spans. Spans do nothing unless profiling was
+turned on for the invocation, with the --profile option::
+
+    calculations --profile airsigmet DAL124 JFK LAX
+    calculations --profile=spans,cprofile,trace airsigmet DAL124 JFK LAX
+    converter --profile=trace metar
+
+or with the AVIATIONWEATHER_PROFILE environment variable, set to the same modes::
+
+    AVIATIONWEATHER_PROFILE=trace calculations airsigmet DAL124 JFK LAX
+
+Modes:
+
+* spans: print the time spent in each span to stderr when the command ends.
+* cprofile: run the command under cProfile and write its stats to a .pstats file, which
+  can be read with pstats or snakeviz.
+* trace: write the spans as a Chrome trace JSON file, which can be opened in
+  chrome://tracing or https://ui.perfetto.dev.
+
+--profile on its own means spans. Files are written to AVIATIONWEATHER_PROFILE_DIR, or
+the current directory, and are named after the command, the time and the process id.
+"""
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, FrozenSet, Iterator, List, Optional, Tuple
+
+PROFILE_ENV = 'AVIATIONWEATHER_PROFILE'
+PROFILE_DIR_ENV = 'AVIATIONWEATHER_PROFILE_DIR'
+SPANS = 'spans'
+CPROFILE = 'cprofile'
+TRACE = 'trace'
+MODES = (SPANS, CPROFILE, TRACE)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('recorder', 'name', 'started')
+
+    def __init__(self, recorder: "Recorder", name: str):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.recorder.events.append((self.name, self.started, time.perf_counter(), threading.get_ident()))
+        return False
+
+
+class Recorder:
+    """
+    The spans recorded during one invocation, as (name, start, end, thread id).
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.events: List[Tuple[str, float, float, int]] = []
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Count and total milliseconds of each span name, in the order they were first entered.
+        """
+        totals: Dict[str, Dict[str, float]] = {}
+        for name, start, end, _ in sorted(self.events, key=lambda x: x[1]):
+            total = totals.setdefault(name, {'count': 0, 'total_ms': 0.0})
+            total['count'] += 1
+            total['total_ms'] += (end - start) * 1e3
+        return totals
+
+    def chrome_trace(self) -> dict:
+        """
+        The spans in the Chrome trace event format.
+        """
+        pid = os.getpid()
+        return {
+            'traceEvents': [
+                {
+                    'name': name,
+                    'ph': 'X',
+                    'ts': (start - self.started) * 1e6,
+                    'dur': (end - start) * 1e6,
+                    'pid': pid,
+                    'tid': tid,
+                }
+                for name, start, end, tid in self.events
+            ],
+            'displayTimeUnit': 'ms',
+        }
+
+
+_RECORDER: Optional[Recorder] = None
+
+
+def span(name: str):
+    """
+    Time the enclosed block as a named span, if profiling is on.
+
+    :param name: Name of the stage, such as flightaware.decode_flight_route.
+    """
+    recorder = _RECORDER
+    if recorder is None:
+        return _NULL_SPAN
+    return _Span(recorder, name)
+
+
+def enabled() -> bool:
+    return _RECORDER is not None
+
+
+def parse_modes(value: str) -> FrozenSet[str]:
+    """
+    Parse a comma separated list of profiling modes.
+
+    :param value: Modes such as 'spans,trace'. 1, true, yes and on mean spans.
+    :return: The modes.
+    """
+    modes = set()
+    for mode in value.lower().split(','):
+        mode = mode.strip()
+        if mode in ('', '0', 'false', 'no', 'off'):
+            continue
+        if mode in ('1', 'true', 'yes', 'on'):
+            mode = SPANS
+        if mode not in MODES:
+            raise ValueError(f"Profiling modes must be {', '.join(MODES)}, not {mode}.")
+        modes.add(mode)
+    return frozenset(modes)
+
+
+def profile_option(args: List[str]) -> Tuple[List[str], FrozenSet[str]]:
+    """
+    Remove the --profile option from the command line arguments.
+
+    Without the option, the modes are read from the AVIATIONWEATHER_PROFILE environment variable.
+
+    :param args: Command line arguments.
+    :return: The remaining arguments, and the profiling modes, which are empty if profiling is off.
+    """
+    remaining = []
+    value = os.environ.get(PROFILE_ENV, '')
+    for arg in args:
+        if arg == '--profile':
+            value = SPANS
+        elif arg.startswith('--profile='):
+            value = arg[len('--profile='):]
+        else:
+            remaining.append(arg)
+    return remaining, parse_modes(value)
+
+
+def output_path(command: str, extension: str) -> str:
+    directory = os.environ.get(PROFILE_DIR_ENV) or os.getcwd()
+    return os.path.join(directory, f"{command}-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}{extension}")
+
+
+@contextmanager
+def profiled(command: str, modes: FrozenSet[str]) -> Iterator[Optional[Recorder]]:
+    """
+    Profile the enclosed block, which runs one command.
+
+    :param command: Name of the command, used in file names.
+    :param modes: Profiling modes, see profile_option(). Nothing is done if empty.
+    :return: The span recorder, or None if profiling is off.
+    """
+    global _RECORDER
+    if not modes:
+        yield None
+        return
+    recorder = Recorder()
+    profiler = cProfile.Profile() if CPROFILE in modes else None
+    _RECORDER = recorder
+    if profiler is not None:
+        profiler.enable()
+    try:
+        with span(command):
+            yield recorder
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        _RECORDER = None
+        if SPANS in modes:
+            for name, total in recorder.summary().items():
+                print(f"{name:<40} {total['count']:>6} {total['total_ms']:>12.3f} ms", file=sys.stderr)
+        if profiler is not None:
+            path = output_path(command, '.pstats')
+            profiler.dump_stats(path)
+            print(f'Wrote profile to {path}', file=sys.stderr)
+        if TRACE in modes:
+            path = output_path(command, '.trace.json')
+            with open(path, 'w') as file:
+                json.dump(recorder.chrome_trace(), file)
+            print(f'Wrote trace to {path}', file=sys.stderr)
@@ -0,0 +1,190 @@
+"""
+Flight routes packed into arrays.
+
+A Route is built once per flight from FlightAware's decoded route, and holds everything
+the weather checks need about it: waypoint latitudes, longitudes and unit vectors, the
+unit normal of each segment's great circle, each segment's bounding box, and the distance
+flown to each waypoint. The segment time windows and altitude bands used to prune
+AirSigmets are derived from the distances.
+
+Routes are pickled as their waypoints only, and to_bytes() packs the waypoints the same
+way the FlightAware response cache does.
+"""
+from array import array
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pygeodesy.sphericalNvector import LatLon
+
+from . import geometry
+
+CLIMB_NM_PER_1000_FT = 3.0
+
+
+class Route:
+    """
+    A flight route.
+
+    :param lats: Waypoint latitudes in degrees.
+    :param lons: Waypoint longitudes in degrees.
+    """
+
+    def __init__(self, lats: Iterable[float], lons: Iterable[float]):
+        self.lats = np.asarray(lats, dtype=np.float64).reshape(-1)
+        self.lons = np.asarray(lons, dtype=np.float64).reshape(-1)
+        if len(self.lats) != len(self.lons):
+            raise ValueError('A route needs as many longitudes as latitudes.')
+        self.vectors = geometry.to_unit_vectors(self.lats, self.lons).reshape(-1, 3)
+        self.starts = self.vectors[:-1]
+        self.ends = self.vectors[1:]
+        normals = np.cross(self.starts, self.ends)
+        norms = np.linalg.norm(normals, axis=-1)
+        self.normals = np.where(norms[:, None] > 1e-12, normals / np.maximum(norms, 1e-12)[:, None], 0.0)
+        self.lengths = geometry.angular_distance(self.starts, self.ends)
+        self.cumulative = np.concatenate(([0.0], np.cumsum(self.lengths)))
+        self.bboxes = self._bboxes()
+
+    @classmethod
+    def from_segments(cls, segments: Sequence[Tuple[LatLon, LatLon]]) -> "Route":
+        """
+        Build a route from segments, as returned by calculations.get_flight_route_data.
+        """
+        if not segments:
+            return cls([], [])
+        points = [segments[0][0]] + [x[1] for x in segments]
+        return cls([x.lat for x in points], [x.lon for x in points])
+
+    @classmethod
+    def from_waypoints(cls, waypoints: Iterable[dict]) -> "Route":
+        """
+        Build a route from DecodeFlightRoute waypoints.
+        """
+        waypoints = list(waypoints)
+        return cls([x['latitude'] for x in waypoints], [x['longitude'] for x in waypoints])
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Route":
+        coordinates = array('d')
+        coordinates.frombytes(data)
+        return cls(coordinates[::2], coordinates[1::2])
+
+    def to_bytes(self) -> bytes:
+        return np.stack((self.lats, self.lons), axis=-1).tobytes()
+
+    def __reduce__(self):
+        return type(self), (self.lats, self.lons)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __iter__(self) -> Iterator[Tuple[LatLon, LatLon]]:
+        return iter(self.segments())
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Route):
+            return NotImplemented
+        return np.array_equal(self.lats, other.lats) and np.array_equal(self.lons, other.lons)
+
+    def __repr__(self):
+        return f"Route({len(self.lats)} waypoints, {self.distance_nm:.0f}nm)"
+
+    @property
+    def distance_nm(self) -> float:
+        return float(geometry.radians_to_nm(self.cumulative[-1]))
+
+    def segments(self) -> List[Tuple[LatLon, LatLon]]:
+        """
+        The route as (start, end) LatLon pairs, in the form returned by
+        calculations.get_flight_route_data.
+        """
+        points = [LatLon(lat, lon) for lat, lon in zip(self.lats, self.lons)]
+        return list(zip(points, points[1:]))
+
+    def _bboxes(self) -> np.ndarray:
+        lat_min = np.minimum(self.lats[:-1], self.lats[1:])
+        lat_max = np.maximum(self.lats[:-1], self.lats[1:])
+        # A great circle arc reaches its highest and lowest latitudes at the points where
+        # it is heading due east or west, which can lie between its end points.
+        pole = np.array([0.0, 0.0, 1.0])
+        vertex = pole - self.normals * (self.normals @ pole)[:, None]
+        norms = np.linalg.norm(vertex, axis=-1)
+        vertex = vertex / np.where(norms > 1e-12, norms, 1.0)[:, None]
+        for sign in (1.0, -1.0):
+            point = sign * vertex
+            within = (
+                (norms > 1e-12)
+                & (np.einsum('sk,sk->s', np.cross(self.starts, point), self.normals) > 0)
+                & (np.einsum('sk,sk->s', np.cross(point, self.ends), self.normals) > 0)
+            )
+            lat = np.degrees(np.arcsin(np.clip(point[:, 2], -1.0, 1.0)))
+            lat_max = np.where(within & (sign > 0), np.maximum(lat_max, lat), lat_max)
+            lat_min = np.where(within & (sign < 0), np.minimum(lat_min, lat), lat_min)
+        lon_min = np.minimum(self.lons[:-1], self.lons[1:])
+        lon_max = np.maximum(self.lons[:-1], self.lons[1:])
+        # Segments crossing the antimeridian get every longitude.
+        wraps = lon_max - lon_min > 180
+        lon_min = np.where(wraps, -180.0, lon_min)
+        lon_max = np.where(wraps, 180.0, lon_max)
+        return np.stack((lat_min, lat_max, lon_min, lon_max), axis=-1)
+
+    def segment_windows(self, departure: float, arrival: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Estimate when the aircraft enters and leaves each segment.
+
+        Time is shared out between the segments in proportion to their length.
+
+        :param departure: Departure epoch time.
+        :param arrival: Arrival epoch time.
+        :return: Entry and exit epoch times, each of shape (n,).
+        """
+        total = self.cumulative[-1]
+        if total <= 0:
+            return np.full(len(self), float(departure)), np.full(len(self), float(arrival))
+        times = departure + (arrival - departure) * self.cumulative / total
+        return times[:-1], times[1:]
+
+    def altitude_bands(
+            self,
+            cruise_ft: float,
+            climb_nm_per_1000_ft: float = CLIMB_NM_PER_1000_FT,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Estimate the lowest and highest altitudes flown on each segment.
+
+        The aircraft climbs from sea level at the start of the route to cruise_ft, and
+        descends back to sea level at the end of it, covering climb_nm_per_1000_ft nautical
+        miles for every 1000 feet climbed or descended.
+
+        :param cruise_ft: Cruise altitude in feet MSL.
+        :param climb_nm_per_1000_ft: Climb and descent gradient.
+        :return: Lowest and highest altitudes in feet MSL, each of shape (n,).
+        """
+        cumulative = geometry.radians_to_nm(self.cumulative)
+        total = cumulative[-1]
+        feet_per_nm = 1000.0 / climb_nm_per_1000_ft
+
+        def altitude(distance):
+            return np.minimum(cruise_ft, np.minimum(distance, total - distance) * feet_per_nm)
+
+        start, end = cumulative[:-1], cumulative[1:]
+        # The profile only changes slope at the top of climb, the top of descent, or halfway
+        # along a route too short to reach cruise.
+        breaks = [
+            np.clip(x, start, end)
+            for x in (cruise_ft / feet_per_nm, total - cruise_ft / feet_per_nm, total / 2)
+        ]
+        low = np.minimum(altitude(start), altitude(end))
+        high = np.maximum.reduce([altitude(start), altitude(end)] + [altitude(x) for x in breaks])
+        return low, high
+
+
+def as_route(route) -> Optional[Route]:
+    """
+    Accept either a Route or a list of segments.
+
+    :param route: A Route, route segments, or None.
+    :return: The Route, or None.
+    """
+    if route is None or isinstance(route, Route):
+        return route
+    return Route.from_segments(route)
@@ -0,0 +1,166 @@
+"""
+JSON serialization of weather results.
+
+Each model class gets a serializer compiled once from its mapped columns and
+relationships, rather than walking every object's __dict__. Loaded columns are written
+in table order, child rows (AirSigmet areas, Metar sky conditions, Taf forecasts and
+their conditions) are nested under their relationship name, and the back references to
+parent rows, ids and foreign keys are left out.
+
+Timestamps are written as POSIX epoch seconds (the default) or as ISO 8601 strings.
+Naive datetimes are UTC, which is how the converter stores them.
+
+If orjson is installed it is used to encode the result, otherwise the standard library
+json module is used. Both produce the same compact JSON.
+"""
+import configparser
+import json
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import DateTime, inspect
+
+from .sql_classes import Base
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+EPOCH = 'epoch'
+ISO = 'iso'
+BACKENDS = ('json', 'orjson')
+
+
+def epoch_seconds(value: datetime) -> float:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def iso_format(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat()
+
+
+TIMESTAMPS: Dict[str, Callable[[datetime], Any]] = {
+    EPOCH: epoch_seconds,
+    ISO: iso_format,
+}
+
+
+class ModelSerializer:
+    """
+    Converts instances of one model class into plain dictionaries.
+
+    :param model: The mapped model class.
+    """
+
+    def __init__(self, model: type):
+        mapper = inspect(model)
+        exclude = {'id', 'parent_id'} | set(getattr(model, '__json_exclude__', ()))
+        self.columns: List[Tuple[str, bool]] = [
+            (attr.key, isinstance(attr.columns[0].type, DateTime))
+            for attr in mapper.column_attrs if attr.key not in exclude
+        ]
+        self.children: List[Tuple[str, bool]] = [
+            (relationship.key, relationship.uselist)
+            for relationship in mapper.relationships if relationship.key not in exclude
+        ]
+
+    def __call__(self, obj: Base, timestamp: Callable[[datetime], Any]) -> dict:
+        loaded = obj.__dict__
+        result = {}
+        for key, is_datetime in self.columns:
+            if key in loaded:
+                value = loaded[key]
+                if is_datetime and value is not None:
+                    value = timestamp(value)
+                result[key] = value
+        for key, uselist in self.children:
+            value = getattr(obj, key)
+            if uselist:
+                result[key] = [to_dict(child, timestamp) for child in value]
+            else:
+                result[key] = None if value is None else to_dict(value, timestamp)
+        return result
+
+
+_SERIALIZERS: Dict[type, ModelSerializer] = {}
+
+
+def to_dict(obj: Base, timestamp: Callable[[datetime], Any] = epoch_seconds) -> dict:
+    """
+    Convert a model instance and its children into a plain dictionary.
+
+    :param obj: The model instance.
+    :param timestamp: Converts datetimes, ie. epoch_seconds or iso_format.
+    :return: The instance's data.
+    """
+    serializer = _SERIALIZERS.get(type(obj))
+    if serializer is None:
+        serializer = _SERIALIZERS[type(obj)] = ModelSerializer(type(obj))
+    return serializer(obj, timestamp)
+
+
+def serialize(data: Any, timestamps: str = EPOCH) -> Any:
+    """
+    Convert weather results into JSON compatible types.
+
+    :param data: Models, datetimes, or lists, tuples and dictionaries of them.
+    :param timestamps: 'epoch' or 'iso'.
+    :return: The data as plain lists, dictionaries and values.
+    """
+    return _serialize(data, TIMESTAMPS[timestamps])
+
+
+def _serialize(data: Any, timestamp: Callable[[datetime], Any]) -> Any:
+    if isinstance(data, Base):
+        return to_dict(data, timestamp)
+    if isinstance(data, (list, tuple)):
+        return [_serialize(x, timestamp) for x in data]
+    if isinstance(data, dict):
+        return {key: _serialize(value, timestamp) for key, value in data.items()}
+    if isinstance(data, datetime):
+        return timestamp(data)
+    return data
+
+
+def default_backend() -> str:
+    return 'orjson' if orjson is not None else 'json'
+
+
+def dumps(data: Any, timestamps: str = EPOCH, backend: Optional[str] = None) -> str:
+    """
+    Serialize weather results to JSON.
+
+    :param data: Models, datetimes, or lists, tuples and dictionaries of them.
+    :param timestamps: 'epoch' or 'iso'.
+    :param backend: 'json' or 'orjson'. Defaults to orjson when it is installed.
+    :return: The JSON document.
+    """
+    if timestamps not in TIMESTAMPS:
+        raise ValueError(f"timestamps must be one of {', '.join(TIMESTAMPS)}, not {timestamps}")
+    backend = backend or default_backend()
+    plain = serialize(data, timestamps)
+    if backend == 'orjson':
+        if orjson is None:
+            raise ValueError('The orjson backend requires the orjson package.')
+        return orjson.dumps(plain).decode('utf-8')
+    if backend == 'json':
+        return json.dumps(plain, separators=(',', ':'))
+    raise ValueError(f"backend must be one of {', '.join(BACKENDS)}, not {backend}")
+
+
+def output_options(config: configparser.ConfigParser) -> dict:
+    """
+    Serialization options from the [output] config section.
+
+    :param config: The parsed configuration.
+    :return: Keyword arguments for dumps().
+    """
+    return {
+        'timestamps': config.get('output', 'timestamps', fallback=EPOCH),
+        'backend': config.get('output', 'json_backend', fallback=None),
+    }
@@ -0,0 +1,370 @@
+"""
+Long-running HTTP service for the calculations queries.
+
+The service keeps everything that is expensive to set up warm between requests: the
+FlightAware SOAP client (with its parsed WSDL), the database connection pool, the
+airport index, and a snapshot of the active AirSigmets.
+
+Endpoints::
+
+    GET /metar?flight=DAL124&dep=JFK&arr=LAX[&epoch=1551650700][&latest=1|&last=3][&since=1551600000]
+    GET /taf?flight=DAL124&dep=JFK&arr=LAX[&epoch=1551650700]
+    GET /airsigmet?flight=DAL124&dep=JFK&arr=LAX[&epoch=1551650700][&corridor=20]
+    GET /stations?lat=40.64&lon=-73.78[&radius=25|&nearest=3]
+    GET /stations?flight=DAL124&dep=JFK&arr=LAX[&epoch=1551650700][&radius=25]
+    GET /health
+    GET /metrics
+
+Responses are the same JSON documents printed by the calculations command. /stations
+returns the reporting stations within radius nautical miles of a point or of a flight's
+route, or the nearest ones to a point, as station_id and distance_nm pairs nearest first.
+
+Usage::
+
+    calculations-service [host] [port]
+
+The host and port default to the [service] section of config.ini, or localhost:8080.
+"""
+import configparser
+import json
+import os
+import sys
+import threading
+import time
+import logging
+from socketserver import ThreadingMixIn
+from typing import Callable, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs
+from wsgiref.simple_server import WSGIServer, make_server
+
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+from zeep.exceptions import Fault
+
+from . import airports, calculations, hazards, logging_setup, metrics, serialization, spatial
+from .advisories import AdvisorySnapshot, load_snapshot
+from .settings import load_config
+
+logger = logging.getLogger(__name__)
+
+WX_TYPES = ('metar', 'taf', 'airsigmet')
+DEFAULT_HOST = 'localhost'
+DEFAULT_PORT = 8080
+DEFAULT_AIRSIGMET_REFRESH = 60.0
+DEFAULT_STATION_RADIUS_NM = 25.0
+DEFAULT_AIRSIGMET_LOOKBACK = 6 * 3600.0
+
+
+class HTTPError(Exception):
+    def __init__(self, status: str, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class WarmAirSigmets:
+    """
+    A snapshot of the active AirSigmets, shared by every request.
+
+    The snapshot holds every AirSigmet in effect from lookback seconds before it was
+    loaded onwards. It is only reloaded when the converter has ingested new AirSigmets,
+    which is checked every refresh seconds by a background thread (see start()), or
+    during a request if no thread is running. A new snapshot is loaded in its own session
+    and then swapped in, so requests never wait on a reload or see a partial one.
+
+    If grid_loader is given, the hazard grid it returns is attached to the snapshot once
+    the converter has rasterized the same generation of AirSigmets.
+    """
+
+    def __init__(
+            self,
+            session_factory: Callable[[], Session],
+            refresh: float = DEFAULT_AIRSIGMET_REFRESH,
+            lookback: float = DEFAULT_AIRSIGMET_LOOKBACK,
+            grid_loader: Optional[Callable[[], Optional[hazards.HazardGrid]]] = None,
+    ):
+        self.session_factory = session_factory
+        self.refresh = refresh
+        self.lookback = lookback
+        self.grid_loader = grid_loader
+        self._lock = threading.Lock()
+        self._snapshot: Optional[AdvisorySnapshot] = None
+        self._checked = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def snapshot(self) -> AdvisorySnapshot:
+        snapshot = self._snapshot
+        if snapshot is None or (self._thread is None and time.monotonic() - self._checked > self.refresh):
+            self.poll()
+            snapshot = self._snapshot
+        return snapshot
+
+    def poll(self) -> bool:
+        """
+        Reload the snapshot if the AirSigmet generation has changed.
+
+        :return: True if a new snapshot was loaded.
+        """
+        with self._lock:
+            session = self.session_factory()
+            try:
+                generation = calculations.data_generation(session, 'airsigmet')
+                self._checked = time.monotonic()
+                current = self._snapshot
+                if current is not None and generation is not None and generation == current.generation:
+                    if current.grid is None:
+                        self._attach_grid(current)
+                    return False
+                started = time.perf_counter()
+                snapshot = load_snapshot(session, time.time() - self.lookback, generation)
+                self._attach_grid(snapshot)
+                self._snapshot = snapshot
+                logger.info(
+                    f'Loaded {len(snapshot)} AirSigmets at generation {generation} '
+                    f'in {time.perf_counter() - started:.3f}s'
+                )
+                return True
+            finally:
+                session.close()
+
+    def _attach_grid(self, snapshot: AdvisorySnapshot):
+        # The converter rasterizes AirSigmets after storing them, so the grid can lag behind.
+        if self.grid_loader is None or snapshot.generation is None:
+            return
+        grid = self.grid_loader()
+        if grid is not None and grid.generation == snapshot.generation:
+            snapshot.grid = grid
+            logger.info(f'Using the hazard grid for generation {grid.generation}')
+
+    def _run(self):
+        while not self._stop.wait(self.refresh):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception('Error reloading AirSigmets')
+
+    def start(self):
+        """
+        Load the snapshot and keep it up to date from a background thread.
+        """
+        self.poll()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='airsigmet-snapshot', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class QueryService:
+    """
+    WSGI application answering metar, taf and airsigmet queries.
+
+    :param config: The parsed configuration.
+    :param client: FlightAware SOAP client. Created from the config if not given.
+    :param session_factory: Scoped database session factory. Created from the config if not given.
+    """
+
+    def __init__(self, config: configparser.ConfigParser, client=None, session_factory=None):
+        self.config = config
+        self.client = client if client is not None else calculations.get_flightaware_client(config)
+        if session_factory is None:
+            session_factory = scoped_session(sessionmaker(bind=calculations.get_engine(config)))
+        self.sessions = session_factory
+        self.airsigmets = WarmAirSigmets(
+            session_factory.session_factory,
+            config.getfloat('service', 'airsigmet_refresh', fallback=DEFAULT_AIRSIGMET_REFRESH),
+            config.getfloat('service', 'airsigmet_lookback', fallback=DEFAULT_AIRSIGMET_LOOKBACK),
+            (lambda: hazards.load_hazard_grid(config)) if hazards.grid_enabled(config) else None,
+        )
+        self.output_options = serialization.output_options(config)
+        self.corridor_nm = calculations.airsigmet_corridor(config)
+        self.results = calculations.result_cache(config)
+        self._stations: Optional[spatial.SpatialIndex] = None
+        self._stations_mtime: Optional[float] = None
+        self._stations_lock = threading.Lock()
+        airports.get_index()
+
+    def station_index(self) -> spatial.SpatialIndex:
+        """
+        The reporting station index, reloaded when the converter has saved a new one.
+        """
+        path = spatial.station_index_path(self.config)
+        with self._stations_lock:
+            mtime = os.path.getmtime(path) if os.path.exists(path) else None
+            if self._stations is None or mtime != self._stations_mtime:
+                try:
+                    self._stations = spatial.station_index(self.config, self.sessions())
+                finally:
+                    self.sessions.remove()
+                self._stations_mtime = os.path.getmtime(path) if os.path.exists(path) else None
+            return self._stations
+
+    def stations(self, params: dict) -> str:
+        """
+        Answer one reporting station query.
+
+        :param params: Query string parameters.
+        :return: The JSON response body.
+        """
+        try:
+            radius_nm = float(params['radius'][0]) if 'radius' in params else DEFAULT_STATION_RADIUS_NM
+            nearest = int(params['nearest'][0]) if 'nearest' in params else None
+            lat = float(params['lat'][0]) if 'lat' in params else None
+            lon = float(params['lon'][0]) if 'lon' in params else None
+            if radius_nm <= 0 or (nearest is not None and nearest < 1):
+                raise ValueError
+            if lat is not None and not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                raise ValueError
+            if lat is None and not {'flight', 'dep', 'arr'} <= set(params):
+                raise KeyError
+            epoch = float(params.get('epoch', ['0'])[0])
+        except (KeyError, TypeError, ValueError):
+            raise HTTPError(
+                '400 Bad Request',
+                'lat and lon, or flight, dep and arr, are required. radius must be a positive number '
+                'and nearest a positive integer.',
+            )
+        index = self.station_index()
+        if lat is not None and nearest is not None:
+            codes, distances = index.nearest([lat], [lon], nearest)
+            found = list(zip(codes[0], distances[0]))
+        elif lat is not None:
+            found = index.within([lat], [lon], radius_nm)[0]
+        else:
+            flight, dep, arr = params['flight'][0], params['dep'][0], params['arr'][0]
+            try:
+                faflightid, _ = calculations.get_faflightid(self.client, flight, dep, arr, epoch)
+            except Fault as error:
+                raise HTTPError('502 Bad Gateway', f'FlightAware error: {error}')
+            if not faflightid:
+                raise HTTPError('404 Not Found', 'Flight not found.')
+            route = calculations.get_flight_route(self.client, faflightid)
+            if route is None:
+                raise HTTPError('404 Not Found', 'No route found for flight.')
+            found = index.near_route(route.lats, route.lons, radius_nm)
+        return json.dumps([{'station_id': str(code), 'distance_nm': float(nm)} for code, nm in found])
+
+    def query(self, wx_type: str, params: dict) -> str:
+        """
+        Answer one weather query.
+
+        :param wx_type: metar, taf, or airsigmet.
+        :param params: Query string parameters.
+        :return: The JSON response body.
+        """
+        try:
+            flight = params['flight'][0]
+            dep = params['dep'][0]
+            arr = params['arr'][0]
+            epoch = float(params.get('epoch', ['0'])[0])
+            limit = calculations.history_limit(params['last'][0]) if 'last' in params else None
+            since = float(params['since'][0]) if 'since' in params else None
+            corridor_nm = float(params['corridor'][0]) if 'corridor' in params else self.corridor_nm
+        except (KeyError, ValueError):
+            raise HTTPError(
+                '400 Bad Request',
+                'flight, dep and arr are required, last must be a positive integer, '
+                'and epoch, since and corridor must be numbers.',
+            )
+        if params.get('latest', ['0'])[0] not in ('', '0', 'false'):
+            limit = 1
+        try:
+            faflightid, flight_data = calculations.get_faflightid(self.client, flight, dep, arr, epoch)
+        except Fault as error:
+            raise HTTPError('502 Bad Gateway', f'FlightAware error: {error}')
+        if not faflightid:
+            raise HTTPError('404 Not Found', 'Flight not found.')
+        airsigs = self.airsigmets.snapshot() if wx_type == 'airsigmet' else None
+        session = self.sessions()
+        try:
+            # Results are cached as JSON, as the ORM objects belong to this request's session.
+            key = None
+            generation = calculations.result_generation(wx_type, session, airsigs)
+            if generation is not None:
+                key = calculations.result_key(wx_type, faflightid, flight_data, generation, limit, since, corridor_nm)
+                body = self.results.get(key)
+                if body is not None:
+                    return body
+            result = calculations.flight_weather(
+                wx_type, faflightid, flight_data, self.client, session, airsigs, limit, since,
+                corridor_nm=corridor_nm,
+            )
+            if result is None:
+                raise HTTPError('404 Not Found', 'No route found for flight.')
+            body = calculations.output(result, **self.output_options)
+            if key is not None:
+                self.results.set(key, body)
+            return body
+        except ValueError as error:
+            raise HTTPError('404 Not Found', str(error))
+        finally:
+            self.sessions.remove()
+
+    def __call__(self, environ: dict, start_response) -> Iterable[bytes]:
+        path = environ.get('PATH_INFO', '').strip('/')
+        started = time.perf_counter()
+        status = '200 OK'
+        try:
+            if environ.get('REQUEST_METHOD', 'GET') != 'GET':
+                raise HTTPError('405 Method Not Allowed', 'Only GET is supported.')
+            if path == 'health':
+                body = json.dumps({'status': 'ok'})
+            elif path == 'metrics':
+                body = json.dumps(metrics.snapshot())
+            elif path in WX_TYPES:
+                body = self.query(path, parse_qs(environ.get('QUERY_STRING', '')))
+            elif path == 'stations':
+                body = self.stations(parse_qs(environ.get('QUERY_STRING', '')))
+            else:
+                raise HTTPError('404 Not Found', f'Unknown endpoint: /{path}')
+        except HTTPError as error:
+            status = error.status
+            body = json.dumps({'error': str(error)})
+        except Exception:
+            logger.exception(f'Error answering /{path}')
+            status = '500 Internal Server Error'
+            body = json.dumps({'error': 'Internal server error.'})
+        data = body.encode('utf-8')
+        start_response(status, [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(data))),
+        ])
+        elapsed = time.perf_counter() - started
+        if path in WX_TYPES or path == 'stations':
+            metrics.record(f'service.{path}', elapsed)
+        logger.debug(f'/{path} {status} in {elapsed:.4f}s')
+        return [data]
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+def serve(app: QueryService, host: str, port: int):
+    app.airsigmets.start()
+    try:
+        with make_server(host, port, app, server_class=ThreadingWSGIServer) as server:
+            logger.info(f'Serving calculations on http://{host}:{port}')
+            server.serve_forever()
+    finally:
+        app.airsigmets.stop()
+
+
+def parse_address(args: List[str], config: configparser.ConfigParser) -> Tuple[str, int]:
+    host = args[1] if len(args) > 1 else config.get('service', 'host', fallback=DEFAULT_HOST)
+    port = int(args[2]) if len(args) > 2 else config.getint('service', 'port', fallback=DEFAULT_PORT)
+    return host, port
+
+
+def main(args: List[str]):
+    config = load_config()
+    logging_setup.setup(config)
+    host, port = parse_address(args, config)
+    serve(QueryService(config), host, port)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,35 @@
+# coding=utf-8
+"""
+Configuration helpers shared by the converter and calculations programs.
+"""
+import configparser
+import os.path
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "config.ini")
+
+
+def load_config(path: str = CONFIG_PATH) -> configparser.ConfigParser:
+    """
+    Read the config.ini file.
+
+    :param path: Path of the config file.
+    :return: The parsed configuration.
+    """
+    config = configparser.ConfigParser()
+    config.read(path)
+    return config
+
+
+def cache_dir(config: configparser.ConfigParser) -> str:
+    """
+    Directory for on-disk caches and indexes, created if it does not exist.
+
+    Set with the optional [cache] path setting. Defaults to a 'cache' directory
+    next to the source code.
+
+    :param config: The parsed configuration.
+    :return: Path of the cache directory.
+    """
+    path = config.get('cache', 'path', fallback=os.path.join(os.path.dirname(__file__), 'cache'))
+    os.makedirs(path, exist_ok=True)
+    return path
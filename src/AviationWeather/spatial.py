@@ -0,0 +1,314 @@
+"""
+Nearest-airport and nearest-reporting-station queries.
+
+A SpatialIndex holds station positions as unit vectors sorted by latitude. Queries
+are answered in batches: each chunk of query points only looks at the latitude
+band it can reach, and distances within that band are computed with a single
+matrix product. Nearest neighbour queries start with a narrow band and widen it
+until it is sure to hold every query's neighbours.
+
+The reporting station index is built from the stations stored with the Metar and
+Taf data, saved in the cache directory, and extended by the converter whenever an
+ingest brings in stations it has not seen before. Converters running at the same time
+take turns updating it, under a lock on a file next to the index. calculations-service
+answers station queries from it at /stations.
+"""
+import configparser
+import fcntl
+import os
+import logging
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from . import airports, geometry
+from .settings import cache_dir
+from .sql_classes import Metar, Taf
+
+logger = logging.getLogger(__name__)
+
+STATION_INDEX_FILE = "stations.npz"
+QUERY_CHUNK = 256
+# Degrees of latitude either side of the queries first searched by nearest().
+NEAREST_BAND = 2.0
+
+
+class SpatialIndex:
+    """
+    Batch k-nearest and radius queries over a set of named points.
+    """
+
+    def __init__(self, codes: Iterable[str] = (), lats: Iterable[float] = (), lons: Iterable[float] = ()):
+        self.codes = np.array([], dtype=object)
+        self.lats = np.array([], dtype=np.float64)
+        self.lons = np.array([], dtype=np.float64)
+        self.vectors = np.empty((0, 3))
+        self._rows = {}
+        self.add(codes, lats, lons)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __contains__(self, code: str) -> bool:
+        return code in self._rows
+
+    def add(self, codes: Iterable[str], lats: Iterable[float], lons: Iterable[float]) -> int:
+        """
+        Add new points and move any existing points whose position has changed.
+
+        :param codes: Station or airport identifiers.
+        :param lats: Latitudes in degrees.
+        :param lons: Longitudes in degrees.
+        :return: The number of points added or moved.
+        """
+        new_codes, new_lats, new_lons = [], [], []
+        changed = 0
+        for code, lat, lon in zip(codes, lats, lons):
+            if code is None or lat is None or lon is None:
+                continue
+            row = self._rows.get(code)
+            if row is None:
+                new_codes.append(code)
+                new_lats.append(lat)
+                new_lons.append(lon)
+            elif self.lats[row] != lat or self.lons[row] != lon:
+                self.lats[row] = lat
+                self.lons[row] = lon
+                changed += 1
+        if not new_codes and not changed:
+            return 0
+        codes = np.concatenate((self.codes, np.array(new_codes, dtype=object)))
+        lats = np.concatenate((self.lats, np.array(new_lats, dtype=np.float64)))
+        lons = np.concatenate((self.lons, np.array(new_lons, dtype=np.float64)))
+        order = np.argsort(lats, kind="stable")
+        self.codes, self.lats, self.lons = codes[order], lats[order], lons[order]
+        self.vectors = geometry.to_unit_vectors(self.lats, self.lons)
+        self._rows = {code: row for row, code in enumerate(self.codes)}
+        return len(new_codes) + changed
+
+    def _band(self, lat_min: float, lat_max: float, radius: float) -> slice:
+        margin = np.degrees(radius)
+        start = np.searchsorted(self.lats, lat_min - margin, side="left")
+        stop = np.searchsorted(self.lats, lat_max + margin, side="right")
+        return slice(start, stop)
+
+    def nearest(self, lats, lons, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k nearest points to each query point.
+
+        Each chunk of queries, taken in latitude order, searches a band of latitudes around
+        them that is doubled until the kth nearest point of every query lies within the
+        band's margin. Any point outside the band is at least that far away.
+
+        :param lats: Query latitudes in degrees.
+        :param lons: Query longitudes in degrees.
+        :param k: Number of neighbours to return per query point.
+        :return: Codes and distances in nautical miles, each of shape (len(lats), k),
+            nearest first.
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+        k = min(k, len(self))
+        codes = np.empty((len(lats), k), dtype=object)
+        distances = np.empty((len(lats), k))
+        if k == 0:
+            return codes, distances
+        by_latitude = np.argsort(lats)
+        for start in range(0, len(lats), QUERY_CHUNK):
+            members = by_latitude[start:start + QUERY_CHUNK]
+            chunk = geometry.to_unit_vectors(lats[members], lons[members])
+            radius = np.radians(NEAREST_BAND)
+            while True:
+                band = self._band(lats[members].min(), lats[members].max(), radius)
+                if band.stop - band.start >= k:
+                    rows, angles = self._nearest_rows(chunk, self.vectors[band], k)
+                    if radius >= np.pi or angles[:, -1].max() <= radius:
+                        break
+                radius *= 2
+            codes[members] = self.codes[band.start + rows]
+            distances[members] = geometry.radians_to_nm(angles)
+        return codes, distances
+
+    @staticmethod
+    def _nearest_rows(queries: np.ndarray, vectors: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        # Rows of the k nearest vectors to each query, and their angular distances, nearest first.
+        dots = queries @ vectors.T
+        if k < len(vectors):
+            candidates = np.argpartition(-dots, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.broadcast_to(np.arange(k), (len(queries), k))
+        best = np.take_along_axis(dots, candidates, axis=1)
+        rows = np.take_along_axis(candidates, np.argsort(-best, axis=1), axis=1)
+        return rows, geometry.angular_distance(queries[:, None, :], vectors[rows])
+
+    def within(self, lats, lons, radius_nm: float) -> List[List[Tuple[str, float]]]:
+        """
+        Find all points within a radius of each query point.
+
+        :param lats: Query latitudes in degrees.
+        :param lons: Query longitudes in degrees.
+        :param radius_nm: Search radius in nautical miles.
+        :return: For each query point, (code, distance in nautical miles) pairs sorted by distance.
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+        radius = geometry.nm_to_radians(radius_nm)
+        results: List[List[Tuple[str, float]]] = [[] for _ in range(len(lats))]
+        by_latitude = np.argsort(lats)
+        for start in range(0, len(lats), QUERY_CHUNK):
+            members = by_latitude[start:start + QUERY_CHUNK]
+            band = self._band(lats[members].min(), lats[members].max(), radius)
+            if band.start == band.stop:
+                continue
+            chunk = geometry.to_unit_vectors(lats[members], lons[members])
+            vectors = self.vectors[band]
+            close = (chunk @ vectors.T) >= np.cos(radius)
+            for member, query, row in zip(members, chunk, close):
+                hits = np.flatnonzero(row)
+                angles = geometry.angular_distance(query, vectors[hits])
+                order = np.argsort(angles)
+                results[member] = [
+                    (self.codes[band.start + hits[i]], float(geometry.radians_to_nm(angles[i]))) for i in order
+                ]
+        return results
+
+    def near_route(self, lats, lons, radius_nm: float) -> List[Tuple[str, float]]:
+        """
+        Find all points within a corridor around a route.
+
+        :param lats: Latitudes of the route's waypoints, in degrees.
+        :param lons: Longitudes of the route's waypoints, in degrees.
+        :param radius_nm: Half-width of the corridor in nautical miles.
+        :return: (code, distance from the route in nautical miles) pairs sorted by distance.
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+        if len(lats) < 2:
+            return self.within(lats, lons, radius_nm)[0] if len(lats) else []
+        radius = geometry.nm_to_radians(radius_nm)
+        waypoints = geometry.to_unit_vectors(lats, lons)
+        # A great circle arc can bulge poleward of both of its end points.
+        bulge = max(radius, float(geometry.angular_distance(waypoints[:-1], waypoints[1:]).max()) / 2)
+        band = self._band(lats.min(), lats.max(), bulge + radius)
+        vectors = self.vectors[band]
+        if not len(vectors):
+            return []
+        distances = geometry.arc_distance(vectors, waypoints[:-1], waypoints[1:]).min(axis=1)
+        hits = np.flatnonzero(distances <= radius)
+        hits = hits[np.argsort(distances[hits])]
+        return [(self.codes[band.start + hit], float(geometry.radians_to_nm(distances[hit]))) for hit in hits]
+
+    def save(self, path: str):
+        """
+        Write the index, replacing any earlier one. It is written under a temporary name
+        and renamed into place, so readers never load half an index.
+        """
+        with open(path + '.tmp', 'wb') as file:
+            np.savez(file, codes=self.codes.astype(str), lats=self.lats, lons=self.lons)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path: str) -> "SpatialIndex":
+        with np.load(path) as data:
+            return cls(data["codes"].tolist(), data["lats"], data["lons"])
+
+
+def airport_index() -> SpatialIndex:
+    """
+    Spatial index over every airport with an ICAO identifier in the compiled airport database.
+    """
+    index = airports.get_index()
+    rows = index.icao_rows()
+    return SpatialIndex(
+        index.icao_codes(),
+        [index.latitude[row] for row in rows],
+        [index.longitude[row] for row in rows],
+    )
+
+
+def stations_from_db(session: Session) -> SpatialIndex:
+    """
+    Build a spatial index of the reporting stations stored with the Metar and Taf data.
+
+    :param session: The current database session.
+    :return: Spatial index of reporting stations.
+    """
+    index = SpatialIndex()
+    for model in (Metar, Taf):
+        rows = session.query(model.station_id, model.latitude, model.longitude).distinct().all()
+        index.add([x[0] for x in rows], [x[1] for x in rows], [x[2] for x in rows])
+    return index
+
+
+def station_index_path(config: configparser.ConfigParser) -> str:
+    return os.path.join(cache_dir(config), STATION_INDEX_FILE)
+
+
+@contextmanager
+def _locked(path: str) -> Iterator[None]:
+    # Held while the saved index is read, changed and written, so concurrent converters don't
+    # drop each other's stations.
+    with open(path + '.lock', 'a') as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def station_index(config: configparser.ConfigParser, session: Optional[Session] = None) -> SpatialIndex:
+    """
+    Load the saved reporting station index, building it from the database if it does not exist.
+
+    :param config: The parsed configuration.
+    :param session: Database session used when the index has to be built.
+    :return: Spatial index of reporting stations.
+    """
+    path = station_index_path(config)
+    if os.path.exists(path):
+        return SpatialIndex.load(path)
+    if session is None:
+        return SpatialIndex()
+    with _locked(path):
+        if os.path.exists(path):
+            return SpatialIndex.load(path)
+        index = stations_from_db(session)
+        index.save(path)
+    return index
+
+
+def update_station_index(config: configparser.ConfigParser, reports: Iterable, session: Optional[Session] = None) -> int:
+    """
+    Add any stations in newly ingested reports to the saved reporting station index.
+
+    If there is no saved index yet, it is built from every station in the database.
+
+    :param config: The parsed configuration.
+    :param reports: Metar or Taf objects.
+    :param session: Database session used to build a new index.
+    :return: The number of stations added or moved.
+    """
+    path = station_index_path(config)
+    reports = list(reports)
+    with _locked(path):
+        built = not os.path.exists(path) and session is not None
+        if os.path.exists(path):
+            index = SpatialIndex.load(path)
+        elif built:
+            index = stations_from_db(session)
+        else:
+            index = SpatialIndex()
+        changed = index.add(
+            [x.station_id for x in reports],
+            [x.latitude for x in reports],
+            [x.longitude for x in reports],
+        )
+        if built:
+            changed = len(index)
+        if changed:
+            index.save(path)
+    if changed:
+        logger.info(f'Added or moved {changed} stations in the station index.')
+    return changed
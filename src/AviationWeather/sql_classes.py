@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm.collections import InstrumentedList
@@ -6,32 +6,8 @@ from sqlalchemy.orm.collections import InstrumentedList
 
 class Base(object):
     def __json__(self):
-        json_response = {}
-        if isinstance(self, AirSigmet):
-            for x in getattr(self, 'points', []):
-                x.__json__()
-        elif isinstance(self, Metar):
-            for x in getattr(self, 'sky_condition', []):
-                x.__json__()
-        elif isinstance(self, Taf):
-            for x in getattr(self, 'forecast', []):
-                x.__json__()
-        elif isinstance(self, Forecast):
-            sub_types = ('sky_condition', 'turbulence_condition', 'icing_condition')
-            for sub_type in sub_types:
-                json_response[sub_type] = [x.__json__() for x in getattr(self, sub_type, [])]
-
-        json_exclude = getattr(self, '__json_exclude__', set())
-        json_exclude.add("id")
-        json_exclude.add("parent_id")
-        json_response.update(
-            {key: value for key, value in self.__dict__.items()
-                # Do not serialize 'private' attributes
-                # (SQLAlchemy-internal attributes are among those, too)
-                if not key.startswith('_')
-                and key not in json_exclude}
-        )
-        return json_response
+        from .serialization import to_dict
+        return to_dict(self)
 
 
 Base = declarative_base(cls=Base)
@@ -39,6 +15,7 @@ Base = declarative_base(cls=Base)
 
 class Points(Base):
     __tablename__ = "Points"
+    __json_exclude__ = {'airsigmet'}
 
     id = Column(Integer, primary_key=True)
     parent_id = Column(Integer, ForeignKey('AirSigmet.id'))
@@ -57,6 +34,10 @@ class Points(Base):
 
 class AirSigmet(Base):
     __tablename__ = 'AirSigmet'
+    __table_args__ = (
+        # Expired AirSigmets are skipped by the valid_time_to range of an overlap query.
+        Index('ix_AirSigmet_valid_hazard', 'valid_time_to', 'valid_time_from', 'hazard__type'),
+    )
 
     id = Column(Integer, primary_key=True)
 
@@ -94,6 +75,7 @@ class AirSigmet(Base):
 
 class Forecast(Base):
     __tablename__ = "Forecast"
+    __json_exclude__ = {'taf'}
 
     id = Column(Integer, primary_key=True)
     parent_id = Column(Integer, ForeignKey('Taf.id'))
@@ -145,6 +127,9 @@ class Forecast(Base):
 
 class Taf(Base):
     __tablename__ = "Taf"
+    __table_args__ = (
+        Index('ix_Taf_station_valid_issue', 'station_id', 'valid_time_from', 'valid_time_to', 'issue_time'),
+    )
     
     id = Column(Integer, primary_key=True)
 
@@ -178,6 +163,7 @@ class Taf(Base):
 
 class SkyCondition(Base):
     __tablename__ = "SkyCondition"
+    __json_exclude__ = {'forecast'}
     
     id = Column(Integer, primary_key=True)
     parent_id = Column(Integer, ForeignKey('Forecast.id'))
@@ -197,6 +183,7 @@ class SkyCondition(Base):
 
 class TurbulenceCondition(Base):
     __tablename__ = "TurbulenceCondition"
+    __json_exclude__ = {'forecast'}
     
     id = Column(Integer, primary_key=True)
     parent_id = Column(Integer, ForeignKey('Forecast.id'))
@@ -217,6 +204,7 @@ class TurbulenceCondition(Base):
 
 class IcingCondition(Base):
     __tablename__ = "IcingCondition"
+    __json_exclude__ = {'forecast'}
     
     id = Column(Integer, primary_key=True)
     parent_id = Column(Integer, ForeignKey('Forecast.id'))
@@ -335,8 +323,13 @@ class Metar(Base):
                 )
 
 
+# Newest first, to match metar history queries.
+Index('ix_Metar_station_observation', Metar.station_id, Metar.observation_time.desc())
+
+
 class MetarSkyCondition(Base):
     __tablename__ = "MetarSkyCondition"
+    __json_exclude__ = {'metar'}
 
     id = Column(Integer, primary_key=True)
     parent_id = Column(Integer, ForeignKey('Metar.id'))
@@ -352,3 +345,22 @@ class MetarSkyCondition(Base):
             cloud_base_ft_agl=self.cloud_base_ft_agl,
             cloud_type=self.cloud_type,
         )
+
+
+class Generation(Base):
+    """
+    Counts the ingests of each weather type, so results computed from the data can be
+    cached until new data arrives.
+    """
+    __tablename__ = "Generation"
+
+    wx_type = Column(String(30), primary_key=True)
+    generation = Column(Integer, nullable=False, default=0)
+    updated = Column(DateTime)
+
+    def __repr__(self):
+        return "Generation({wx_type}, {generation}, {updated})".format(
+            wx_type=self.wx_type,
+            generation=self.generation,
+            updated=self.updated,
+        )
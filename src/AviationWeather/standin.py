@@ -0,0 +1,430 @@
+"""
+Local stand-in for the FlightAware FlightXML3 SOAP API.
+
+Serves the subset of the FlightXML3 WSDL used by the calculations module, and
+synthesizes FlightInfoStatus and DecodeFlightRoute responses for any airline flight
+ident (three letters followed by a flight number). The same ident always produces the
+same flights: one a day from yesterday to tomorrow, between two large airports, along
+a great circle route. Each response can be delayed to simulate network latency.
+
+Usage::
+
+    python -m AviationWeather.standin [host] [port] [latency seconds]
+
+Then point the calculations module at it in config.ini::
+
+    [flightaware.com]
+    wsdl = http://localhost:8081/wsdl
+"""
+import math
+import random
+import re
+import sys
+import threading
+import time
+import logging
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import List, Optional, Tuple
+
+import numpy as np
+from lxml import etree
+
+from . import airports, geometry
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = "http://flightxml.flightaware.com/soap/FlightXML3"
+SOAP_ENV = "http://schemas.xmlsoap.org/soap/envelope/"
+DEFAULT_HOST = "localhost"
+DEFAULT_PORT = 8081
+
+# Large airports the synthesized flights fly between.
+HUBS = {
+    "KATL": "ATL", "KBOS": "BOS", "KDEN": "DEN", "KDFW": "DFW", "KDTW": "DTW", "KJFK": "JFK",
+    "KLAX": "LAX", "KMCO": "MCO", "KMIA": "MIA", "KMSP": "MSP", "KORD": "ORD", "KPHX": "PHX",
+    "KSEA": "SEA", "KSFO": "SFO", "KSLC": "SLC", "CYYZ": "YYZ", "CYVR": "YVR", "EGLL": "LHR",
+    "LFPG": "CDG", "EDDF": "FRA", "RJTT": "HND", "PHNL": "HNL", "PANC": "ANC", "NZAA": "AKL",
+}
+IDENT_PATTERN = re.compile(r"^[A-Z]{3}\d{1,4}$")
+WAYPOINT_SPACING_NM = 150
+
+WSDL = """<?xml version="1.0" encoding="UTF-8"?>
+<definitions xmlns="http://schemas.xmlsoap.org/wsdl/"
+             xmlns:soap="http://schemas.xmlsoap.org/wsdl/soap/"
+             xmlns:xsd="http://www.w3.org/2001/XMLSchema"
+             xmlns:tns="{ns}"
+             targetNamespace="{ns}">
+  <types>
+    <xsd:schema targetNamespace="{ns}" elementFormDefault="qualified">
+      <xsd:complexType name="Timestamp">
+        <xsd:sequence>
+          <xsd:element name="epoch" type="xsd:int"/>
+          <xsd:element name="tz" type="xsd:string" minOccurs="0"/>
+          <xsd:element name="date" type="xsd:string" minOccurs="0"/>
+          <xsd:element name="time" type="xsd:string" minOccurs="0"/>
+        </xsd:sequence>
+      </xsd:complexType>
+      <xsd:complexType name="FlightAirportRef">
+        <xsd:sequence>
+          <xsd:element name="code" type="xsd:string"/>
+          <xsd:element name="alternate_ident" type="xsd:string" minOccurs="0"/>
+        </xsd:sequence>
+      </xsd:complexType>
+      <xsd:complexType name="FlightInfoStatusStruct">
+        <xsd:sequence>
+          <xsd:element name="ident" type="xsd:string"/>
+          <xsd:element name="faFlightID" type="xsd:string"/>
+          <xsd:element name="origin" type="tns:FlightAirportRef"/>
+          <xsd:element name="destination" type="tns:FlightAirportRef"/>
+          <xsd:element name="filed_ete" type="xsd:int"/>
+          <xsd:element name="filed_altitude" type="xsd:int" minOccurs="0"/>
+          <xsd:element name="filed_airspeed_kts" type="xsd:int"/>
+          <xsd:element name="distance_filed" type="xsd:int"/>
+          <xsd:element name="filed_departure_time" type="tns:Timestamp"/>
+          <xsd:element name="estimated_departure_time" type="tns:Timestamp"/>
+          <xsd:element name="filed_arrival_time" type="tns:Timestamp"/>
+          <xsd:element name="estimated_arrival_time" type="tns:Timestamp"/>
+          <xsd:element name="status" type="xsd:string"/>
+          <xsd:element name="aircrafttype" type="xsd:string"/>
+        </xsd:sequence>
+      </xsd:complexType>
+      <xsd:complexType name="FlightInfoStatusResult">
+        <xsd:sequence>
+          <xsd:element name="next_offset" type="xsd:int"/>
+          <xsd:element name="flights" type="tns:FlightInfoStatusStruct" minOccurs="0" maxOccurs="unbounded"/>
+        </xsd:sequence>
+      </xsd:complexType>
+      <xsd:complexType name="FlightRouteStruct">
+        <xsd:sequence>
+          <xsd:element name="name" type="xsd:string"/>
+          <xsd:element name="type" type="xsd:string"/>
+          <xsd:element name="latitude" type="xsd:float"/>
+          <xsd:element name="longitude" type="xsd:float"/>
+        </xsd:sequence>
+      </xsd:complexType>
+      <xsd:complexType name="DecodeFlightRouteResult">
+        <xsd:sequence>
+          <xsd:element name="next_offset" type="xsd:int"/>
+          <xsd:element name="data" type="tns:FlightRouteStruct" minOccurs="0" maxOccurs="unbounded"/>
+        </xsd:sequence>
+      </xsd:complexType>
+      <xsd:element name="FlightInfoStatusRequest">
+        <xsd:complexType>
+          <xsd:sequence>
+            <xsd:element name="ident" type="xsd:string"/>
+            <xsd:element name="include_ex_data" type="xsd:boolean" minOccurs="0"/>
+            <xsd:element name="filter" type="xsd:string" minOccurs="0"/>
+            <xsd:element name="howMany" type="xsd:int" minOccurs="0"/>
+            <xsd:element name="offset" type="xsd:int" minOccurs="0"/>
+          </xsd:sequence>
+        </xsd:complexType>
+      </xsd:element>
+      <xsd:element name="FlightInfoStatusResults">
+        <xsd:complexType>
+          <xsd:sequence>
+            <xsd:element name="FlightInfoStatusResult" type="tns:FlightInfoStatusResult"/>
+          </xsd:sequence>
+        </xsd:complexType>
+      </xsd:element>
+      <xsd:element name="DecodeFlightRouteRequest">
+        <xsd:complexType>
+          <xsd:sequence>
+            <xsd:element name="faFlightID" type="xsd:string"/>
+          </xsd:sequence>
+        </xsd:complexType>
+      </xsd:element>
+      <xsd:element name="DecodeFlightRouteResults">
+        <xsd:complexType>
+          <xsd:sequence>
+            <xsd:element name="DecodeFlightRouteResult" type="tns:DecodeFlightRouteResult"/>
+          </xsd:sequence>
+        </xsd:complexType>
+      </xsd:element>
+    </xsd:schema>
+  </types>
+  <message name="FlightInfoStatusRequest">
+    <part name="parameters" element="tns:FlightInfoStatusRequest"/>
+  </message>
+  <message name="FlightInfoStatusResults">
+    <part name="parameters" element="tns:FlightInfoStatusResults"/>
+  </message>
+  <message name="DecodeFlightRouteRequest">
+    <part name="parameters" element="tns:DecodeFlightRouteRequest"/>
+  </message>
+  <message name="DecodeFlightRouteResults">
+    <part name="parameters" element="tns:DecodeFlightRouteResults"/>
+  </message>
+  <portType name="FlightXML3SoapPort">
+    <operation name="FlightInfoStatus">
+      <input message="tns:FlightInfoStatusRequest"/>
+      <output message="tns:FlightInfoStatusResults"/>
+    </operation>
+    <operation name="DecodeFlightRoute">
+      <input message="tns:DecodeFlightRouteRequest"/>
+      <output message="tns:DecodeFlightRouteResults"/>
+    </operation>
+  </portType>
+  <binding name="FlightXML3SoapBinding" type="tns:FlightXML3SoapPort">
+    <soap:binding style="document" transport="http://schemas.xmlsoap.org/soap/http"/>
+    <operation name="FlightInfoStatus">
+      <soap:operation soapAction="{ns}:FlightInfoStatus"/>
+      <input><soap:body use="literal"/></input>
+      <output><soap:body use="literal"/></output>
+    </operation>
+    <operation name="DecodeFlightRoute">
+      <soap:operation soapAction="{ns}:DecodeFlightRoute"/>
+      <input><soap:body use="literal"/></input>
+      <output><soap:body use="literal"/></output>
+    </operation>
+  </binding>
+  <service name="FlightXML3">
+    <port name="FlightXML3Soap" binding="tns:FlightXML3SoapBinding">
+      <soap:address location="{location}"/>
+    </port>
+  </service>
+</definitions>
+"""
+
+
+class Fault(Exception):
+    pass
+
+
+def great_circle(start: airports.Airport, end: airports.Airport, spacing_nm: float) -> Tuple[List[tuple], float]:
+    """
+    Points along the great circle between two airports.
+
+    :param start: Departure airport.
+    :param end: Arrival airport.
+    :param spacing_nm: Largest distance between consecutive points.
+    :return: (latitude, longitude) points including both airports, and the distance in nautical miles.
+    """
+    a, b = geometry.to_unit_vectors([start.latitude, end.latitude], [start.longitude, end.longitude])
+    angle = float(geometry.angular_distance(a, b))
+    steps = max(1, int(math.ceil(geometry.radians_to_nm(angle) / spacing_nm)))
+    fractions = np.linspace(0.0, 1.0, steps + 1)[:, None]
+    if angle < 1e-12:
+        vectors = np.repeat(a[None, :], steps + 1, axis=0)
+    else:
+        vectors = (np.sin((1 - fractions) * angle) * a + np.sin(fractions * angle) * b) / math.sin(angle)
+    lats, lons = geometry.to_latlons(vectors)
+    return list(zip(lats.tolist(), lons.tolist())), geometry.radians_to_nm(angle)
+
+
+def _timestamp(epoch: int) -> dict:
+    moment = datetime.fromtimestamp(epoch, timezone.utc)
+    return {'epoch': epoch, 'tz': 'UTC', 'date': moment.strftime('%m/%d/%Y'), 'time': moment.strftime('%I:%M%p')}
+
+
+class FlightGenerator:
+    """
+    Deterministic synthetic flights.
+
+    :param now: Reference time for the generated schedules. Defaults to the current time.
+    """
+
+    def __init__(self, now: Optional[float] = None):
+        self.now = now
+
+    def flights(self, ident: str) -> List[dict]:
+        """
+        FlightInfoStatus flights for an ident.
+        """
+        if not IDENT_PATTERN.match(ident):
+            raise Fault(f"INVALID argument ident: {ident}")
+        rng = random.Random(ident)
+        origin, destination = rng.sample(sorted(HUBS), 2)
+        index = airports.get_index()
+        _, nm = great_circle(index.get(origin), index.get(destination), WAYPOINT_SPACING_NM)
+        speed = rng.choice((450, 460, 470, 480))
+        ete = int(nm / speed * 3600) + 1800
+        altitude = rng.choice((330, 350, 370, 390))
+        now = datetime.fromtimestamp(self.now if self.now is not None else time.time(), timezone.utc)
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        departure_minute = rng.randrange(6 * 60, 22 * 60, 5)
+        result = []
+        for day in (-1, 0, 1):
+            departure = int((midnight + timedelta(days=day, minutes=departure_minute)).timestamp())
+            delay = rng.choice((0, 0, 0, 300, 900))
+            result.append({
+                'ident': ident,
+                'faFlightID': f"{ident}-{departure}-standin-{day + 1:04d}",
+                'origin': {'code': origin, 'alternate_ident': HUBS[origin]},
+                'destination': {'code': destination, 'alternate_ident': HUBS[destination]},
+                'filed_ete': ete,
+                'filed_altitude': altitude,
+                'filed_airspeed_kts': speed,
+                'distance_filed': int(nm),
+                'filed_departure_time': _timestamp(departure),
+                'estimated_departure_time': _timestamp(departure + delay),
+                'filed_arrival_time': _timestamp(departure + ete),
+                'estimated_arrival_time': _timestamp(departure + ete + delay),
+                'status': 'Scheduled',
+                'aircrafttype': rng.choice(('B738', 'A320', 'B752', 'A321', 'B763')),
+            })
+        return result
+
+    def route(self, faflightid: str) -> List[dict]:
+        """
+        DecodeFlightRoute waypoints for a faFlightID created by flights().
+        """
+        ident = faflightid.split('-')[0]
+        for flight in self.flights(ident) if IDENT_PATTERN.match(ident) else []:
+            if flight['faFlightID'] == faflightid:
+                index = airports.get_index()
+                points, _ = great_circle(
+                    index.get(flight['origin']['code']),
+                    index.get(flight['destination']['code']),
+                    WAYPOINT_SPACING_NM,
+                )
+                names = [flight['origin']['code']] + [
+                    f"WPT{i:02d}" for i in range(1, len(points) - 1)
+                ] + [flight['destination']['code']]
+                return [
+                    {'name': name, 'type': 'Waypoint', 'latitude': lat, 'longitude': lon}
+                    for name, (lat, lon) in zip(names, points)
+                ]
+        raise Fault(f"INVALID argument faFlightID: {faflightid}")
+
+
+def _append(parent: etree._Element, name: str, value):
+    element = etree.SubElement(parent, f"{{{NAMESPACE}}}{name}")
+    if isinstance(value, dict):
+        for key, item in value.items():
+            _append(element, key, item)
+    elif value is not None:
+        element.text = str(value)
+    return element
+
+
+def envelope(body: etree._Element) -> bytes:
+    root = etree.Element(f"{{{SOAP_ENV}}}Envelope", nsmap={'SOAP-ENV': SOAP_ENV, 'fx': NAMESPACE})
+    etree.SubElement(root, f"{{{SOAP_ENV}}}Body").append(body)
+    return etree.tostring(root, xml_declaration=True, encoding='UTF-8')
+
+
+def fault(message: str) -> bytes:
+    element = etree.Element(f"{{{SOAP_ENV}}}Fault")
+    etree.SubElement(element, "faultcode").text = "SOAP-ENV:Client"
+    etree.SubElement(element, "faultstring").text = message
+    return envelope(element)
+
+
+def respond(request: bytes, generator: FlightGenerator) -> bytes:
+    """
+    Answer a SOAP request.
+
+    :param request: The SOAP request envelope.
+    :param generator: Source of the synthetic flights.
+    :return: The SOAP response envelope.
+    """
+    body = etree.fromstring(request).find(f"{{{SOAP_ENV}}}Body")
+    operation = body[0]
+    name = etree.QName(operation).localname
+    if name == 'FlightInfoStatusRequest':
+        flights = generator.flights(operation.findtext(f"{{{NAMESPACE}}}ident", ''))
+        results = etree.Element(f"{{{NAMESPACE}}}FlightInfoStatusResults")
+        result = _append(results, 'FlightInfoStatusResult', {'next_offset': -1})
+        for flight in flights:
+            _append(result, 'flights', flight)
+        return envelope(results)
+    if name == 'DecodeFlightRouteRequest':
+        waypoints = generator.route(operation.findtext(f"{{{NAMESPACE}}}faFlightID", ''))
+        results = etree.Element(f"{{{NAMESPACE}}}DecodeFlightRouteResults")
+        result = _append(results, 'DecodeFlightRouteResult', {'next_offset': -1})
+        for waypoint in waypoints:
+            _append(result, 'data', waypoint)
+        return envelope(results)
+    raise Fault(f"Unsupported operation: {name}")
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    """
+    HTTP server for the stand-in API.
+
+    :param address: (host, port) to listen on. Use port 0 to pick a free port.
+    :param latency: Seconds to wait before answering each SOAP request.
+    :param jitter: Extra random delay of up to this many seconds.
+    :param generator: Source of the synthetic flights.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.0, jitter: float = 0.0, generator: Optional[FlightGenerator] = None):
+        super().__init__(address, StandInHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.generator = generator if generator is not None else FlightGenerator()
+        self.requests_served = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def wsdl_url(self) -> str:
+        return f"{self.url}/wsdl"
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    server: StandInServer
+
+    def _send(self, status: int, body: bytes, content_type: str = 'text/xml; charset=utf-8'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/').lower() != '/wsdl':
+            self._send(404, b'Not found', 'text/plain')
+            return
+        self._send(200, WSDL.format(ns=NAMESPACE, location=f"{self.server.url}/soap").encode('utf-8'))
+
+    def do_POST(self):
+        request = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        delay = self.server.latency + random.uniform(0, self.server.jitter)
+        if delay:
+            time.sleep(delay)
+        with self.server._lock:
+            self.server.requests_served += 1
+        try:
+            self._send(200, respond(request, self.server.generator))
+        except Fault as error:
+            self._send(500, fault(str(error)))
+        except (etree.XMLSyntaxError, IndexError, TypeError):
+            self._send(500, fault('Malformed SOAP request.'))
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def start(host: str = DEFAULT_HOST, port: int = 0, latency: float = 0.0) -> StandInServer:
+    """
+    Start the stand-in server on a background thread.
+
+    :param host: Address to listen on.
+    :param port: Port to listen on. The default of 0 picks a free port.
+    :param latency: Seconds to wait before answering each SOAP request.
+    :return: The running server. Call shutdown() to stop it.
+    """
+    server = StandInServer((host, port), latency=latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(args: List[str]):
+    host = args[1] if len(args) > 1 else DEFAULT_HOST
+    port = int(args[2]) if len(args) > 2 else DEFAULT_PORT
+    latency = float(args[3]) if len(args) > 3 else 0.0
+    server = StandInServer((host, port), latency=latency)
+    print(f"FlightXML3 stand-in serving {server.wsdl_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,186 @@
+"""
+Streaming JSON output for large result sets.
+
+Rows are read from the database a chunk at a time, with one LIMIT query per chunk, and
+each one is written as soon as it is serialized, so memory use does not grow with the
+size of the result.
+Output is either JSON Lines (one JSON document per line) or a single JSON array that is
+written incrementally. Any text stream can be written to, such as sys.stdout or a
+socket's makefile('w').
+"""
+from typing import Any, Iterable, Iterator, List, Optional, Sequence, TextIO, Union
+
+from sqlalchemy import and_, false, or_
+from sqlalchemy.orm import Query
+
+from . import serialization
+
+DEFAULT_CHUNK_SIZE = 500
+LINES = 'lines'
+ARRAY = 'array'
+
+
+def iter_chunks(
+        query: Query,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        key: Union[Any, Sequence[Any], None] = None,
+        descending: bool = False,
+) -> Iterator[List]:
+    """
+    Read a query's results a chunk at a time.
+
+    Each chunk is loaded by its own query, so eager loading works as usual. Child
+    collections should be loaded with selectinload, which adds one query per chunk.
+    Server-side cursors (Query.yield_per) aren't used, as the MySQL drivers can't run the
+    selectinload queries while one is open.
+
+    With a key, chunks are read in key order, each starting after the last key of the one
+    before (keyset pagination). That stays fast however far into the results it gets, and
+    rows added while reading don't shift the later chunks. The key can be several columns,
+    such as (Metar.observation_time, Metar.id), as long as together they are unique. NULLs
+    sort before any value, as in MySQL and SQLite.
+
+    Without a key, chunks are read with LIMIT and OFFSET in the query's own order, which
+    must be a total order. Each chunk then rescans the rows before it, so keep that for
+    small results.
+
+    :param query: The query.
+    :param chunk_size: Number of rows fetched from the database at a time.
+    :param key: A unique column of the queried model, such as its primary key, or a
+        sequence of columns that are unique together.
+    :param descending: Read the results in descending key order.
+    :return: Lists of up to chunk_size results.
+    """
+    if key is None:
+        offset = 0
+        while True:
+            chunk = query.limit(chunk_size).offset(offset).all()
+            offset += chunk_size
+            if chunk:
+                yield chunk
+            if len(chunk) < chunk_size:
+                return
+    columns = list(key) if isinstance(key, (list, tuple)) else [key]
+    ordered = query.order_by(None).order_by(*(x.desc() if descending else x for x in columns))
+    last = None
+    while True:
+        page = ordered if last is None else ordered.filter(_after(columns, last, descending))
+        chunk = page.limit(chunk_size).all()
+        if chunk:
+            last = [getattr(chunk[-1], x.key) for x in columns]
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+
+
+def _after(columns: List[Any], values: List[Any], descending: bool):
+    # Rows that come after values in the key order, with NULLs sorting first.
+    def equal(column, value):
+        return column.is_(None) if value is None else column == value
+
+    def beyond(column, value):
+        if descending:
+            return None if value is None else or_(column < value, column.is_(None))
+        return column.isnot(None) if value is None else column > value
+
+    conditions = []
+    for i, (column, value) in enumerate(zip(columns, values)):
+        condition = beyond(column, value)
+        if condition is not None:
+            conditions.append(and_(*(equal(c, v) for c, v in zip(columns[:i], values[:i])), condition))
+    return or_(*conditions) if conditions else false()
+
+
+def iter_query(
+        query: Query,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        key: Union[Any, Sequence[Any], None] = None,
+        descending: bool = False,
+) -> Iterator:
+    """
+    Iterate over a query's results, reading them a chunk at a time, see iter_chunks().
+
+    :param query: The query.
+    :param chunk_size: Number of rows fetched from the database at a time.
+    :param key: Unique column, or columns, to page by. Results then come in key order.
+    :param descending: Read the results in descending key order.
+    :return: The query's results.
+    """
+    for chunk in iter_chunks(query, chunk_size, key, descending):
+        yield from chunk
+
+
+class JSONWriter:
+    """
+    Writes records to a text stream one at a time.
+
+    :param out: Output stream.
+    :param array: Write a JSON array instead of JSON Lines.
+    :param timestamps: Write times as 'epoch' seconds or 'iso' strings.
+    :param backend: JSON encoder, 'json' or 'orjson'. Defaults to orjson when it is installed.
+    :param flush: Flush the stream after each record.
+    """
+
+    def __init__(
+            self,
+            out: TextIO,
+            array: bool = False,
+            timestamps: str = serialization.EPOCH,
+            backend: Optional[str] = None,
+            flush: bool = True,
+    ):
+        self.out = out
+        self.array = array
+        self.timestamps = timestamps
+        self.backend = backend
+        self.flush = flush
+        self.count = 0
+
+    def __enter__(self) -> "JSONWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, record: Any):
+        data = serialization.dumps(record, self.timestamps, self.backend)
+        if self.array:
+            self.out.write(',\n' if self.count else '[\n')
+            self.out.write(data)
+        else:
+            self.out.write(data)
+            self.out.write('\n')
+        self.count += 1
+        if self.flush:
+            self.out.flush()
+
+    def close(self):
+        """
+        Finish the output. For arrays this writes the closing bracket.
+        """
+        if self.array:
+            self.out.write('\n]\n' if self.count else '[]\n')
+            self.out.flush()
+
+
+def write_records(
+        records: Iterable[Any],
+        out: TextIO,
+        array: bool = False,
+        timestamps: str = serialization.EPOCH,
+        backend: Optional[str] = None,
+) -> int:
+    """
+    Stream records to a text stream.
+
+    :param records: Models, or lists and dictionaries of them.
+    :param out: Output stream.
+    :param array: Write a JSON array instead of JSON Lines.
+    :param timestamps: Write times as 'epoch' seconds or 'iso' strings.
+    :param backend: JSON encoder, 'json' or 'orjson'. Defaults to orjson when it is installed.
+    :return: The number of records written.
+    """
+    with JSONWriter(out, array, timestamps, backend) as writer:
+        for record in records:
+            writer.write(record)
+    return writer.count
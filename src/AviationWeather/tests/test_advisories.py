@@ -0,0 +1,85 @@
+import datetime
+
+import numpy as np
+from pygeodesy.sphericalNvector import LatLon
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm.session import Session
+
+from AviationWeather.advisories import AdvisorySnapshot, load_snapshot
+from AviationWeather.sql_classes import AirSigmet, Points
+
+DEPARTURE = 1514808000  # 2018-1-1T12:00:00
+ROUTE = [(LatLon(0, 0), LatLon(0, 2))]
+
+
+def airsigmet(valid_from: float, valid_to: float, lon: float = 1.0) -> AirSigmet:
+    return AirSigmet(
+        valid_time_from=datetime.datetime.utcfromtimestamp(valid_from),
+        valid_time_to=datetime.datetime.utcfromtimestamp(valid_to),
+        area=[Points(latitude=lat, longitude=lon + dlon) for lat, dlon in ((1, 0), (1, 1), (-1, 1), (-1, 0))],
+    )
+
+
+def test_find_intersecting_in_window():
+    current = airsigmet(DEPARTURE - 600, DEPARTURE + 600)
+    later = airsigmet(DEPARTURE + 7200, DEPARTURE + 9000)
+    elsewhere = airsigmet(DEPARTURE - 600, DEPARTURE + 600, lon=40.0)
+    snapshot = AdvisorySnapshot([current, later, elsewhere], generation=3)
+    assert snapshot.find_intersecting(ROUTE) == [current, later]
+    assert snapshot.find_intersecting(ROUTE, DEPARTURE, DEPARTURE + 3600) == [current]
+    assert snapshot.between(DEPARTURE, DEPARTURE + 3600) == [current, elsewhere]
+
+
+def test_empty_and_pointless_airsigmets():
+    assert AdvisorySnapshot([]).find_intersecting(ROUTE) == []
+    assert AdvisorySnapshot([AirSigmet(area=[])]).find_intersecting(ROUTE) == []
+
+
+def test_load_snapshot(dbsession: Session):
+    dbsession.add_all([airsigmet(DEPARTURE - 7200, DEPARTURE - 3600), airsigmet(DEPARTURE, DEPARTURE + 3600)])
+    dbsession.flush()
+    session = sessionmaker(bind=dbsession.bind)()
+    snapshot = load_snapshot(session, DEPARTURE - 600, generation=5)
+    session.close()
+    assert len(snapshot) == 1
+    assert snapshot.generation == 5
+    assert snapshot.covers(DEPARTURE) and not snapshot.covers(DEPARTURE - 3600)
+    assert len(snapshot.airsigs[0].area) == 4
+    assert snapshot.find_intersecting(ROUTE) == snapshot.airsigs
+
+
+def test_segments_checked_while_flown():
+    route = [(LatLon(0, 0), LatLon(0, 2)), (LatLon(0, 2), LatLon(0, 4))]
+    arrival = DEPARTURE + 3600
+    first_half = airsigmet(DEPARTURE, DEPARTURE + 1200, lon=2.5)
+    second_half = airsigmet(DEPARTURE + 2400, arrival, lon=2.5)
+    snapshot = AdvisorySnapshot([first_half, second_half])
+    assert snapshot.find_intersecting(route) == [first_half, second_half]
+    assert snapshot.find_intersecting(route, DEPARTURE, arrival) == [second_half]
+
+
+def test_altitude_pruning():
+    route = [(LatLon(0, 0), LatLon(0, 4)), (LatLon(0, 4), LatLon(0, 8)), (LatLon(0, 8), LatLon(0, 12))]
+    low_level = airsigmet(DEPARTURE, DEPARTURE + 3600, lon=5.5)
+    low_level.altitude__max_ft_msl = 12000
+    high_level = airsigmet(DEPARTURE, DEPARTURE + 3600, lon=5.5)
+    high_level.altitude__min_ft_msl = 25000
+    near_airport = airsigmet(DEPARTURE, DEPARTURE + 3600, lon=0.5)
+    near_airport.altitude__max_ft_msl = 3000
+    snapshot = AdvisorySnapshot([low_level, high_level, near_airport])
+    assert snapshot.find_intersecting(route) == [low_level, high_level, near_airport]
+    assert snapshot.find_intersecting(route, altitude=37000) == [high_level, near_airport]
+    bands = (np.full(3, 30000.0), np.full(3, 30000.0))
+    assert snapshot.find_intersecting(route, altitude=bands) == [high_level]
+
+
+def test_corridor():
+    # A box 30nm to 90nm north of the route, whose bounding cap doesn't reach it.
+    nearby = AirSigmet(
+        area=[Points(latitude=lat, longitude=lon) for lat, lon in ((0.5, 0.5), (0.5, 1.5), (1.5, 1.5), (1.5, 0.5))],
+    )
+    snapshot = AdvisorySnapshot([nearby])
+    assert snapshot.find_intersecting(ROUTE) == []
+    assert snapshot.find_intersecting(ROUTE, corridor_nm=20) == []
+    assert snapshot.find_intersecting(ROUTE, corridor_nm=40) == [nearby]
+    assert snapshot.find_intersecting(ROUTE, corridor_nm=-40) == []
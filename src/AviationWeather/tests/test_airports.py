@@ -0,0 +1,46 @@
+from AviationWeather import airports
+
+
+def test_lookup_icao():
+    result = airports.lookup("KORD")
+    assert abs(result.latitude - 41.97859955) < 1e-5
+    assert abs(result.longitude - -87.90480042) < 1e-5
+    assert result.elevation_ft == 672
+
+
+def test_lookup_iata():
+    assert airports.lookup("ORD") == airports.lookup("KORD")
+
+
+def test_lookup_unknown():
+    assert airports.lookup("ZZZZ") is None
+    assert airports.lookup("") is None
+
+
+def test_read_global_airport_database(tmp_path):
+    pth = tmp_path / "global.csv"
+    pth.write_text(
+        "AYGA:GKA:GOROKA:GOROKA:PAPUA NEW GUINEA:06:04:54:S:145:23:30:E:5282\n"
+        "AYLA:LAE::LAE:PAPUA NEW GUINEA:00:00:00:U:00:00:00:U:0000\n"
+    )
+    result = list(airports.read_global_airport_database(str(pth)))
+    assert len(result) == 1
+    icao, iata, lat, lon, elevation = result[0]
+    assert (icao, iata, elevation) == ("AYGA", "GKA", 5282)
+    assert abs(lat - -6.0816667) < 1e-6
+    assert abs(lon - 145.3916667) < 1e-6
+
+
+def test_compile_index_precedence(tmp_path):
+    primary = tmp_path / "airports.csv"
+    primary.write_text('1,"Test","Test","Test","TST","KTST",10.5,-20.25,100,0,"U","","airport","x"\n')
+    secondary = tmp_path / "global.csv"
+    secondary.write_text(
+        "KTST:TST:TEST:TEST:TEST:01:00:00:N:001:00:00:E:0001\n"
+        "KOTH:OTH:OTHER:OTHER:TEST:01:30:00:N:001:00:00:W:0050\n"
+    )
+    index = airports.AirportIndex(airports.compile_index((str(primary), str(secondary))))
+    assert len(index) == 2
+    assert index.get("KTST") == airports.Airport(10.5, -20.25, 100)
+    assert index.get("OTH") == airports.Airport(1.5, -1.0, 50)
+    assert index.icao_codes() == ["KOTH", "KTST"]
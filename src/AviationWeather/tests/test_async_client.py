@@ -0,0 +1,101 @@
+import asyncio
+import configparser
+import threading
+import time
+
+from AviationWeather import async_client
+
+
+class Service:
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def FlightInfoStatus(self, ident):
+        with self.lock:
+            self.calls.append(ident)
+        time.sleep(0.05)
+        if ident == 'BAD1':
+            raise ValueError('Unknown flight')
+        return {'flights': [{'ident': ident}]}
+
+    def DecodeFlightRoute(self, faflightid):
+        with self.lock:
+            self.calls.append(faflightid)
+        return {'data': [{'latitude': 0, 'longitude': 0}, {'latitude': 1, 'longitude': 1}]}
+
+
+class Client:
+    def __init__(self):
+        self.service = Service()
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_token_bucket_limits_rate():
+    async def take(count):
+        bucket = async_client.TokenBucket(rate=100, capacity=1)
+        started = time.monotonic()
+        for _ in range(count):
+            await bucket.acquire()
+        return time.monotonic() - started
+    assert run(take(6)) >= 0.045
+
+
+def test_concurrent_calls_are_coalesced():
+    client = Client()
+
+    async def query():
+        flightaware = async_client.AsyncFlightAware(client, concurrency=4, rate=100)
+        results = await asyncio.gather(*(flightaware.flight_info_status('DAL1') for _ in range(5)))
+        flightaware.close()
+        return flightaware, results
+
+    flightaware, results = run(query())
+    assert client.service.calls == ['DAL1']
+    assert flightaware.upstream_calls == 1
+    assert all(x == results[0] for x in results)
+
+
+def test_errors_reach_every_caller():
+    async def query():
+        flightaware = async_client.AsyncFlightAware(Client(), rate=100)
+        results = await asyncio.gather(
+            flightaware.flight_info_status('BAD1'),
+            flightaware.flight_info_status('BAD1'),
+            return_exceptions=True,
+        )
+        flightaware.close()
+        return results
+
+    assert [type(x) for x in run(query())] == [ValueError, ValueError]
+
+
+def test_flight_routes():
+    config = configparser.ConfigParser()
+    config.read_dict({'flightaware.com': {'requests_per_second': '100'}})
+    client = Client()
+    result = async_client.flight_routes(config, ['A-1', 'B-2', 'A-1'], client)
+    assert sorted(result) == ['A-1', 'B-2']
+    assert len(result['A-1']) == 1
+    assert sorted(client.service.calls) == ['A-1', 'B-2']
+
+
+def test_cached_routes_are_not_upstream_calls():
+    client = Client()
+
+    async def query():
+        flightaware = async_client.AsyncFlightAware(client, rate=100)
+        await flightaware.flight_route('C-3')
+        await flightaware.flight_route('C-3')
+        flightaware.close()
+        return flightaware
+
+    assert run(query()).upstream_calls == 1
+    assert client.service.calls == ['C-3']
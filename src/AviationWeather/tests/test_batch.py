@@ -0,0 +1,120 @@
+import datetime
+import io
+import json
+import time
+
+from sqlalchemy.orm.session import Session
+
+from AviationWeather import batch
+from AviationWeather.sql_classes import AirSigmet, Points, Metar
+
+DEPARTURE = 1514808000  # 2018-1-1T12:00:00
+ARRIVAL = DEPARTURE + 3600
+
+
+class Service:
+    def __init__(self):
+        self.calls = []
+
+    def FlightInfoStatus(self, ident):
+        self.calls.append(ident)
+        return {"flights": [{
+            "faFlightID": f"{ident}-1",
+            "ident": ident,
+            "filed_departure_time": {"epoch": DEPARTURE},
+            "filed_arrival_time": {"epoch": ARRIVAL},
+            "origin": {"code": "KJFK", "alternate_ident": "JFK"},
+            "destination": {"code": "KLAX", "alternate_ident": "LAX"},
+        }]}
+
+    def DecodeFlightRoute(self, faflightid):
+        return {'data': [{'latitude': 0, 'longitude': 0}, {'latitude': 0, 'longitude': 2}]}
+
+
+class MockClient:
+    def __init__(self):
+        self.service = Service()
+
+
+def test_parse_request():
+    expected = batch.FlightRequest('taf', 'DAL6404', 'JFK', 'LAX', 1551650700.0)
+    assert batch.parse_request('taf DAL6404 JFK LAX 1551650700') == expected
+    assert batch.parse_request('taf,DAL6404,JFK,LAX,1551650700') == expected
+    assert batch.parse_request('["taf", "DAL6404", "JFK", "LAX", 1551650700]') == expected
+    assert batch.parse_request(
+        '{"wx_type": "taf", "flight": "DAL6404", "dep": "JFK", "arr": "LAX", "epoch": 1551650700}'
+    ) == expected
+
+
+def test_read_requests_skips_bad_lines():
+    lines = ['# comment', '', 'metar DAL6404 JFK LAX', 'rain DAL6404 JFK LAX']
+    result = list(batch.read_requests(lines))
+    assert result == [batch.FlightRequest('metar', 'DAL6404', 'JFK', 'LAX', 0.0)]
+
+
+def test_evaluate_batch(dbsession: Session):
+    airsig = AirSigmet(
+        valid_time_from=datetime.datetime.utcfromtimestamp(DEPARTURE),
+        valid_time_to=datetime.datetime.utcfromtimestamp(ARRIVAL),
+        area=[Points(latitude=1, longitude=1), Points(latitude=-1, longitude=1)],
+    )
+    dbsession.add_all([airsig, Metar(station_id='KJFK')])
+    dbsession.flush()
+    client = MockClient()
+    requests = [
+        batch.FlightRequest('metar', 'DAL1', 'JFK', 'LAX'),
+        batch.FlightRequest('airsigmet', 'DAL1', 'JFK', 'LAX'),
+        batch.FlightRequest('taf', 'DAL1', 'JFK', 'LAX'),
+    ]
+    out = io.StringIO()
+    assert batch.write_results(batch.evaluate_batch(requests, client, dbsession), out) == 3
+    results = [json.loads(x) for x in out.getvalue().splitlines()]
+    assert client.service.calls == ['DAL1']
+    assert results[0]['result']['departure'][0]['station_id'] == 'KJFK'
+    assert len(results[1]['result']) == 1
+    assert results[2]['error'] == 'No taf found within time range.'
+
+
+def test_airsigmet_set_reuses_loaded_window(dbsession: Session, monkeypatch):
+    queries = []
+    monkeypatch.setattr(batch.calculations, 'airsigmets', lambda *args, **kwargs: queries.append(kwargs) or [])
+    airsig_set = batch.AirSigmetSet(dbsession)
+    airsig_set.between(DEPARTURE, ARRIVAL)
+    airsig_set.between(DEPARTURE + 60, ARRIVAL - 60)
+    airsig_set.between(DEPARTURE, ARRIVAL + 60)
+    assert queries == [
+        {'arrival': ARRIVAL, 'departure': DEPARTURE},
+        {'arrival': ARRIVAL + 60, 'departure': DEPARTURE},
+    ]
+
+
+def test_evaluate_batch_workers(dbsession: Session):
+    dbsession.add(AirSigmet(
+        valid_time_from=datetime.datetime.utcfromtimestamp(DEPARTURE),
+        valid_time_to=datetime.datetime.utcfromtimestamp(ARRIVAL),
+        area=[Points(latitude=1, longitude=1), Points(latitude=-1, longitude=1)],
+    ))
+    dbsession.flush()
+    requests = [batch.FlightRequest('airsigmet', f'DAL{i}', 'JFK', 'LAX') for i in range(3)]
+    requests.append(batch.FlightRequest('taf', 'DAL1', 'JFK', 'LAX'))
+    records = list(batch.evaluate_batch(requests, MockClient(), dbsession, workers=2))
+    assert [len(x['result']) for x in records[:3]] == [1, 1, 1]
+    assert records[3]['error'] == 'No taf found within time range.'
+
+
+class SlowService(Service):
+    def FlightInfoStatus(self, ident):
+        time.sleep(0.1)
+        return super().FlightInfoStatus(ident)
+
+
+def test_evaluate_batch_prefetches_flights(dbsession: Session):
+    client = MockClient()
+    client.service = SlowService()
+    requests = [batch.FlightRequest('metar', f'DAL{x}', 'JFK', 'LAX') for x in range(4)]
+    requests += [batch.FlightRequest('taf', 'DAL0', 'JFK', 'LAX')]
+    started = time.monotonic()
+    results = list(batch.evaluate_batch(requests, client, dbsession, flightaware_limits={'rate': 100}))
+    assert time.monotonic() - started < 0.35
+    assert sorted(client.service.calls) == ['DAL0', 'DAL1', 'DAL2', 'DAL3']
+    assert [x['faFlightID'] for x in results] == ['DAL0-1', 'DAL1-1', 'DAL2-1', 'DAL3-1', 'DAL0-1']
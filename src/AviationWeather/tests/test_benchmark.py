@@ -0,0 +1,39 @@
+import json
+
+from AviationWeather import benchmark
+from AviationWeather.routes import Route
+
+
+def test_run(tmpdir, monkeypatch):
+    monkeypatch.setattr(benchmark, 'LEGACY_PAIRS', 5)
+    recorded = tmpdir.join('routes.json')
+    recorded.write(json.dumps({'test': {'data': [
+        {'latitude': 40.6, 'longitude': -73.8},
+        {'latitude': 41.0, 'longitude': -80.0},
+        {'latitude': 38.0, 'longitude': -90.0},
+    ]}}))
+    routes = benchmark.load_routes(str(recorded))
+    assert isinstance(routes['recorded:test'], Route)
+
+    report = benchmark.run(routes, polygon_counts=(10,), vertex_counts=(4,), repeat=2)
+    results = report['results']
+    assert {x['route'] for x in results} == set(benchmark.SYNTHETIC_ROUTES) | {'recorded:test'}
+    assert {x['engine'] for x in results} == {'find_intersection', 'find_intersecting_airsigs', 'snapshot'}
+    assert all(x['pairs_per_sec'] > 0 and x['p99_ms'] >= x['p50_ms'] for x in results)
+    # Both engines see the same AirSigmets.
+    hits = {(x['route'], x['engine']): x['hits'] for x in results}
+    for name in routes:
+        assert hits[name, 'find_intersecting_airsigs'] == hits[name, 'snapshot']
+
+    # A run is reproducible apart from its timings.
+    again = benchmark.run(routes, polygon_counts=(10,), vertex_counts=(4,), engines=('snapshot',), repeat=1)
+    assert [x['hits'] for x in again['results']] == [x['hits'] for x in results if x['engine'] == 'snapshot']
+
+    lines = benchmark.compare(report, report)
+    assert len(lines) == len(results) and all('(1.00x)' in x for x in lines)
+
+
+def test_antimeridian_route():
+    route = benchmark.synthetic_route('KSFO', 'RJAA', benchmark.np.random.RandomState(0))
+    assert abs(route.lats[0] - 37.6213) < 1e-9 and abs(route.lons[-1] - 140.3929) < 1e-9
+    assert (route.bboxes[:, 3] - route.bboxes[:, 2] == 360).any()
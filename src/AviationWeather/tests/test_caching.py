@@ -0,0 +1,107 @@
+import time
+
+from AviationWeather import caching
+
+
+class Service:
+    def __init__(self, departure):
+        self.departure = departure
+        self.calls = []
+
+    def FlightInfoStatus(self, ident):
+        self.calls.append(('FlightInfoStatus', ident))
+        return {'flights': [{
+            'faFlightID': f'{ident}-1',
+            'ident': ident,
+            'filed_departure_time': {'epoch': self.departure},
+        }]}
+
+    def DecodeFlightRoute(self, faflightid):
+        self.calls.append(('DecodeFlightRoute', faflightid))
+        return {'data': [
+            {'name': 'KJFK', 'latitude': 40.64, 'longitude': -73.78},
+            {'name': 'KLAX', 'latitude': 33.94, 'longitude': -118.41},
+        ]}
+
+
+class Client:
+    def __init__(self, departure):
+        self.service = Service(departure)
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = caching.LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+
+
+def test_lru_cache_expires():
+    cache = caching.LRUCache()
+    cache.set('a', 1, ttl=-1)
+    assert cache.get('a') is None
+
+
+def test_ttl_cache_reads_through_to_disk(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    caching.TTLCache(path=path).set('key', 'value', 60, str.encode)
+    assert caching.TTLCache(path=path).get('key', bytes.decode) == 'value'
+    assert caching.TTLCache(path=path).get('missing', bytes.decode) is None
+
+
+def test_ttl_cache_disk_hits_keep_their_expiry(tmp_path, monkeypatch):
+    path = str(tmp_path / 'cache.sqlite')
+    caching.TTLCache(path=path).set('key', 'value', 60, str.encode)
+    cache = caching.TTLCache(path=path)
+    assert cache.get('key', bytes.decode) == 'value'
+    assert len(cache.memory) == 1
+    now = time.time()
+    monkeypatch.setattr(caching.time, 'time', lambda: now + 61)
+    assert cache.get('key', bytes.decode) is None
+
+
+def test_departure_ttl():
+    now = 1000000.0
+    assert caching.departure_ttl(now - 7200, now) == 120
+    assert caching.departure_ttl(now + 7200, now) == 600
+    assert caching.departure_ttl(now + 2 * 24 * 3600, now) == 3600
+
+
+def test_route_round_trip():
+    route = {'data': [{'latitude': 1.5, 'longitude': -2.25}, {'latitude': 3.0, 'longitude': 4.0}]}
+    assert caching.decode_route(caching.encode_route(route)) == route
+
+
+def test_caching_client(tmp_path):
+    wrapped = Client(time.time() + 3 * 24 * 3600)
+    client = caching.CachingClient(wrapped, caching.TTLCache(path=str(tmp_path / 'cache.sqlite')))
+    first = client.service.FlightInfoStatus('DAL1')
+    assert client.service.FlightInfoStatus('DAL1') == first
+    route = client.service.DecodeFlightRoute('DAL1-1')
+    assert client.service.DecodeFlightRoute('DAL1-1') == route
+    assert route['data'][1] == {'latitude': 33.94, 'longitude': -118.41}
+    assert wrapped.service.calls == [('FlightInfoStatus', 'DAL1'), ('DecodeFlightRoute', 'DAL1-1')]
+
+
+def test_route_ttl_after_cached_flight_info(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    departure = time.time() + 3 * 24 * 3600
+    caching.CachingClient(Client(departure), caching.TTLCache(path=path)).service.FlightInfoStatus('DAL1')
+    # A later run finds FlightInfoStatus on disk, and still knows the departure time.
+    wrapped = Client(departure)
+    cache = caching.TTLCache(path=path)
+    client = caching.CachingClient(wrapped, cache)
+    ttls = {}
+    set_value = cache.set
+
+    def record_ttl(key, value, ttl, encode):
+        ttls[key] = ttl
+        set_value(key, value, ttl, encode)
+
+    cache.set = record_ttl
+    client.service.FlightInfoStatus('DAL1')
+    client.service.DecodeFlightRoute('DAL1-1')
+    assert wrapped.service.calls == [('DecodeFlightRoute', 'DAL1-1')]
+    assert ttls == {'DecodeFlightRoute:DAL1-1': 3600}
@@ -1,15 +1,19 @@
+import configparser
 import datetime
 from collections import OrderedDict
 import json
 import os
 
+import pytest
+from sqlalchemy.event import listen, remove
 from sqlalchemy.orm.session import Session
 from pygeodesy.sphericalNvector import LatLon
 from lxml import etree
 from dateutil import parser
 
-from AviationWeather import calculations
-from AviationWeather.sql_classes import AirSigmet, Points, Metar, Taf
+from AviationWeather import calculations, converter, metrics
+from AviationWeather.caching import LRUCache
+from AviationWeather.sql_classes import AirSigmet, Forecast, Points, Metar, SkyCondition, Taf
 
 
 TESTS_PATH = os.path.dirname(os.path.abspath(__file__))
@@ -26,7 +30,7 @@ def test_airport_latlon():
     kord = (41.97859955, -87.90480042)
     kord_latlon = LatLon(*kord)
     result = calculations.airport_latlon("KORD")
-    assert kord_latlon == result
+    assert kord_latlon.isequalTo(result, eps=1e-5)
 
 
 def test_get_db_session():
@@ -58,6 +62,36 @@ def test_airsigmets(dbsession: Session):
     assert [airsig] == result
 
 
+def test_airsigmets_overlap(dbsession: Session):
+    departure = 1514808000  # 2018-1-1T12:00:00
+    arrival = departure + 4 * 3600
+    hour = datetime.timedelta(hours=1)
+    start = datetime.datetime.utcfromtimestamp(departure)
+
+    def airsigmet(begins, ends, **kwargs):
+        return AirSigmet(valid_time_from=start + begins * hour, valid_time_to=start + ends * hour, **kwargs)
+
+    before = airsigmet(-6, -1)
+    starts_before = airsigmet(-2, 1, hazard__type='TURB', hazard__severity='MOD')
+    during = airsigmet(1, 2, hazard__type='ICE', hazard__severity='SEV',
+                       altitude__min_ft_msl=8000, altitude__max_ft_msl=18000)
+    ends_after = airsigmet(3, 8, hazard__type='CONVECTIVE', altitude__max_ft_msl=45000)
+    after = airsigmet(5, 9)
+    dbsession.add_all([before, starts_before, during, ends_after, after])
+    dbsession.flush()
+
+    def ids(**kwargs):
+        return {x.id for x in calculations.airsigmets(dbsession, arrival, departure, **kwargs)}
+
+    assert ids() == {starts_before.id, during.id, ends_after.id}
+    assert ids(hazards=['TURB', 'ICE']) == {starts_before.id, during.id}
+    assert ids(severities=['SEV']) == {during.id}
+    assert ids(min_altitude_ft=30000, max_altitude_ft=40000) == {starts_before.id, ends_after.id}
+    assert ids(max_altitude_ft=5000) == {starts_before.id, ends_after.id}
+    assert calculations.airsigmet_in_window(starts_before, arrival, departure)
+    assert not calculations.airsigmet_in_window(after, arrival, departure)
+
+
 def test_airsigmet_points():
     airsig = AirSigmet()
     p1 = OrderedDict(latitude=0, longitude=0)
@@ -77,14 +111,14 @@ def test_find_intersection():
     assert [LatLon(0, 1), LatLon(0, 1)] == result
 
 
-def test_find_intersecting_airsigs(monkeypatch):
-    def mockreturn(s1, s2, airsig):
-        return airsig
-    monkeypatch.setattr(calculations, 'find_intersection', mockreturn)
-    airsigs = [AirSigmet()]
-    route = [(LatLon(0, 0), LatLon(1, 1))]
-    result = calculations.find_intersecting_airsigs(airsigs, route)
-    assert airsigs == result
+def test_find_intersecting_airsigs():
+    square = [(1, 1), (1, 3), (-1, 3), (-1, 1)]
+    crossed = AirSigmet(area=[Points(latitude=lat, longitude=lon) for lat, lon in square])
+    enclosing = AirSigmet(area=[Points(latitude=lat * 10, longitude=lon * 10 - 15) for lat, lon in square])
+    missed = AirSigmet(area=[Points(latitude=lat + 20, longitude=lon) for lat, lon in square])
+    route = [(LatLon(0, 0), LatLon(0, 2)), (LatLon(0, 2), LatLon(0, 5))]
+    result = calculations.find_intersecting_airsigs([crossed, enclosing, missed], route)
+    assert result == [crossed, enclosing]
 
 
 class Service:
@@ -168,6 +202,15 @@ def test_get_flight_route_data():
     assert segments == result
 
 
+def test_get_flight_route():
+    client = MockClient('abc123', 'abc123', 0)
+    cache = LRUCache()
+    route = calculations.get_flight_route(client, 'abc123', cache)
+    assert route.segments() == [(LatLon(0, 0), LatLon(1, 1))]
+    client.service.faflightid = 'other'
+    assert calculations.get_flight_route(client, 'abc123', cache) is route
+
+
 def test_get_metar_data(dbsession: Session):
     metar = Metar(station_id='KJFK')
     dbsession.add(metar)
@@ -176,6 +219,42 @@ def test_get_metar_data(dbsession: Session):
     assert [metar] == result[0]
 
 
+def test_metars_history(dbsession: Session):
+    start = datetime.datetime(2018, 11, 20, 0, 0)
+    observations = [
+        Metar(station_id=station, observation_time=start + datetime.timedelta(minutes=20 * i))
+        for station in ('KPVD', 'KBDL') for i in range(5)
+    ]
+    dbsession.add_all(observations)
+    dbsession.commit()
+
+    departure, arrival = calculations.metars(dbsession, 'KPVD', 'KBDL', limit=1)
+    assert departure == [observations[4]]
+    assert arrival == [observations[9]]
+
+    departure, arrival = calculations.metars(dbsession, 'KPVD', 'KBDL', limit=3)
+    assert departure == observations[4:1:-1]
+    assert arrival == observations[9:6:-1]
+
+    since = (start + datetime.timedelta(minutes=60)).replace(tzinfo=datetime.timezone.utc).timestamp()
+    departure, _ = calculations.metars(dbsession, 'KPVD', 'KBDL', since=since)
+    assert departure == [observations[4], observations[3]]
+    departure, _ = calculations.metars(dbsession, 'KPVD', 'KBDL', limit=1, since=since)
+    assert departure == [observations[4]]
+
+
+def test_metar_options():
+    args = ['calculations', 'metar', '--last', '3', 'DAL124', 'JFK', 'LAX', '--since', '1551600000']
+    assert calculations.metar_options(args) == (
+        ['calculations', 'metar', 'DAL124', 'JFK', 'LAX'], 3, 1551600000.0
+    )
+    assert calculations.metar_options(['calculations', '--latest'])[1] == 1
+    with pytest.raises(ValueError):
+        calculations.metar_options(['calculations', '--last'])
+    with pytest.raises(ValueError):
+        calculations.metar_options(['calculations', '--last', '0'])
+
+
 def test_output():
 
     data = etree.parse(os.path.join(TESTS_PATH, 'test_data/airsigmet.xml'))
@@ -185,7 +264,7 @@ def test_output():
         airsigmet_type=m_data.find('airsigmet_type').text,
         valid_time_from=parser.parse(m_data.find('valid_time_from').text)
     )
-    check = [{"valid_time_from": 1539506700.0, "airsigmet_type": "AIRMET"}]
+    check = [{"valid_time_from": 1539506700.0, "airsigmet_type": "AIRMET", "area": []}]
     result = calculations.output([airsig])
     assert check == json.loads(result)
 
@@ -256,6 +335,87 @@ def test_tafs2(dbsession: Session):
     assert result[0].station_id == 'KRDR'
 
 
+def test_tafs_latest_issue(dbsession: Session):
+    epoch = 1542697200.0  # 2018-11-20 02:00:00
+    valid = dict(
+        valid_time_from=datetime.datetime(2018, 11, 20, 0, 0),
+        valid_time_to=datetime.datetime(2018, 11, 21, 0, 0),
+    )
+    old_taf = Taf(station_id='KBDL', issue_time=datetime.datetime(2018, 11, 19, 20, 0), **valid)
+    new_taf = Taf(station_id='KBDL', issue_time=datetime.datetime(2018, 11, 20, 1, 0), **valid)
+    arrival_taf = Taf(station_id='KBOS', issue_time=datetime.datetime(2018, 11, 19, 20, 0), **valid)
+    new_taf.forecast = [Forecast(
+        time_from=valid['valid_time_from'],
+        sky_condition=[SkyCondition(sky_cover='BKN', cloud_base_ft_agl=3000)],
+    )]
+    dbsession.add_all([old_taf, new_taf, arrival_taf])
+    dbsession.commit()
+    new_id, arrival_id = new_taf.id, arrival_taf.id
+    dbsession.expunge_all()
+
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    listen(dbsession.bind, 'before_cursor_execute', count)
+    departure, arrival = calculations.tafs(dbsession, 'KBDL', epoch, 'KBOS', epoch + 7200)
+    remove(dbsession.bind, 'before_cursor_execute', count)
+    assert departure.id == new_id
+    assert arrival.id == arrival_id
+    assert departure.forecast[0].sky_condition[0].sky_cover == 'BKN'
+    # Tafs with their forecasts, then sky, turbulence and icing conditions.
+    assert len(statements) == 4
+
+
+def test_tafs_missing(dbsession: Session):
+    with pytest.raises(ValueError):
+        calculations.tafs(dbsession, 'KXXX', 1542697200.0, 'KYYY', 1542697200.0)
+
+
+def test_flight_weather_cache(dbsession: Session):
+    epoch = 1542697200.0  # 2018-11-20 02:00:00
+    valid = dict(
+        valid_time_from=datetime.datetime(2018, 11, 20, 0, 0),
+        valid_time_to=datetime.datetime(2018, 11, 21, 0, 0),
+    )
+    dbsession.add_all([Taf(station_id='KACK', **valid), Taf(station_id='KMVY', **valid)])
+    dbsession.flush()
+    flight_data = {
+        'origin': {'code': 'KACK'},
+        'destination': {'code': 'KMVY'},
+        'filed_departure_time': {'epoch': epoch},
+        'filed_arrival_time': {'epoch': epoch + 1800},
+    }
+    cache = LRUCache()
+    first = calculations.flight_weather('taf', 'ABC1-0', flight_data, None, dbsession, cache=cache)
+    assert calculations.flight_weather('taf', 'ABC1-0', flight_data, None, dbsession, cache=cache) is first
+    assert len(cache) == 1
+
+    generation = calculations.data_generation(dbsession, 'taf')
+    assert converter.bump_generation('taf', dbsession) == generation + 1
+    assert calculations.flight_weather('taf', 'ABC1-0', flight_data, None, dbsession, cache=cache) is not first
+    assert len(cache) == 2
+
+
+def test_flight_window():
+    flight_data = {
+        'filed_departure_time': {'epoch': 1000},
+        'filed_arrival_time': {'epoch': 2000},
+    }
+    assert calculations.flight_window(flight_data) == (1000, 2000)
+    flight_data['estimated_arrival_time'] = {'epoch': 2600}
+    assert calculations.flight_window(flight_data) == (1000, 2600)
+    flight_data['estimated_arrival_time'] = {'epoch': 0}
+    assert calculations.flight_window(flight_data) == (1000, 2000)
+
+
+def test_flight_altitude():
+    assert calculations.flight_altitude({'filed_altitude': 350}) == 35000
+    assert calculations.flight_altitude({'filed_altitude': 0}) is None
+    assert calculations.flight_altitude({}) is None
+
+
 def test_get_faflightid():
 
     class Client:
@@ -287,3 +447,26 @@ def test_clean_args():
     args = ['calculations', 'metar', 'DAL6404', 'JFK', 'LAX', 1551650700.0]
     result = calculations.clean_args(args)
     assert result == tuple(args[1:])
+
+
+def test_get_flightaware_client_is_reused(monkeypatch, tmp_path):
+    created = []
+
+    class Client:
+        service = None
+
+        def __init__(self, wsdl, transport):
+            created.append((wsdl, transport.cache._db_path))
+
+    monkeypatch.setattr(calculations, 'Client', Client)
+    monkeypatch.setattr(calculations, '_CLIENT', None)
+    config = configparser.ConfigParser()
+    config.read_dict({
+        'flightaware.com': {'username': 'user', 'api_key': 'key', 'wsdl': 'http://localhost/wsdl'},
+        'cache': {'path': str(tmp_path)},
+    })
+    client = calculations.get_flightaware_client(config)
+    assert calculations.get_flightaware_client(config) is client
+    assert created == [('http://localhost/wsdl', str(tmp_path / 'wsdl.sqlite'))]
+    assert 'flightaware.wsdl_load' in metrics.snapshot()
+    assert calculations.refresh_wsdl_cache(config) is not client
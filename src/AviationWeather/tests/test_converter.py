@@ -2,11 +2,12 @@ import os.path
 import gzip
 import datetime
 
+from sqlalchemy import MetaData, create_engine, inspect
 from sqlalchemy.orm.session import Session
 from lxml import etree
 
 from AviationWeather import converter
-from AviationWeather.sql_classes import AirSigmet, Metar, MetarSkyCondition
+from AviationWeather.sql_classes import AirSigmet, Base, Metar, MetarSkyCondition, Taf
 from AviationWeather.xml_classes import SkyConditionXML, TurbulenceConditionXML
 
 
@@ -39,6 +40,23 @@ def test_to_db(dbsession: Session):
     assert [airsig] == dbsession.query(AirSigmet).all()
 
 
+def test_create_indexes():
+    engine = create_engine('sqlite://')
+    metadata = MetaData()
+    old_table = Taf.__table__.tometadata(metadata)
+    old_table.indexes.clear()
+    metadata.create_all(engine)
+    converter.create_indexes(engine, Base.metadata)
+    names = {index['name'] for index in inspect(engine).get_indexes('Taf')}
+    assert names == {index.name for index in Taf.__table__.indexes}
+
+
+def test_bump_generation(dbsession: Session):
+    assert converter.bump_generation('test', dbsession) == 1
+    assert converter.bump_generation('test', dbsession) == 2
+    assert converter.bump_generation('other', dbsession) == 1
+
+
 def test_process_sky_condition():
     data = etree.XML('<sky_condition sky_cover="FEW" cloud_base_ft_agl="4000" />')
     result = converter.process_attrib(data)
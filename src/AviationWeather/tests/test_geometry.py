@@ -0,0 +1,53 @@
+import numpy as np
+
+from AviationWeather import geometry
+
+
+def test_unit_vector_round_trip():
+    lats = np.array([0.0, 45.0, -33.5])
+    lons = np.array([0.0, -120.0, 179.5])
+    result = geometry.to_latlons(geometry.to_unit_vectors(lats, lons))
+    np.testing.assert_allclose(result, (lats, lons))
+
+
+def test_angular_distance():
+    a = geometry.to_unit_vectors([0.0], [0.0])
+    b = geometry.to_unit_vectors([0.0], [1.0])
+    result = geometry.radians_to_nm(geometry.angular_distance(a, b))
+    np.testing.assert_allclose(result, [60.04], atol=0.01)
+
+
+def test_arc_distance():
+    starts = geometry.to_unit_vectors([0.0], [0.0])
+    ends = geometry.to_unit_vectors([0.0], [10.0])
+    points = geometry.to_unit_vectors([1.0, 0.0, 0.0], [5.0, 11.0, -2.0])
+    result = np.degrees(geometry.arc_distance(points, starts, ends))
+    np.testing.assert_allclose(result[:, 0], [1.0, 1.0, 2.0], atol=1e-9)
+
+
+def test_arcs_cross():
+    starts = geometry.to_unit_vectors([0.0, 5.0, 0.0], [0.0, 0.0, 180.0])
+    ends = geometry.to_unit_vectors([0.0, 5.0, 0.0], [2.0, 2.0, 182.0])
+    edge_starts = geometry.to_unit_vectors([1.0], [1.0])
+    edge_ends = geometry.to_unit_vectors([-1.0], [1.0])
+    result = geometry.arcs_cross(starts, ends, edge_starts, edge_ends)
+    assert result[:, 0].tolist() == [True, False, False]
+
+
+def test_arcs_distance():
+    starts = geometry.to_unit_vectors([0.0], [0.0])
+    ends = geometry.to_unit_vectors([0.0], [2.0])
+    edge_starts = geometry.to_unit_vectors([1.0, 2.0, 0.0], [1.0, 1.0, 4.0])
+    edge_ends = geometry.to_unit_vectors([-1.0, 3.0, 0.0], [1.0, 1.0, 6.0])
+    result = np.degrees(geometry.arcs_distance(starts, ends, edge_starts, edge_ends))
+    np.testing.assert_allclose(result[0], [0.0, 2.0, 2.0], atol=1e-9)
+
+
+def test_points_in_polygon():
+    center = geometry.to_unit_vectors([40.0], [-70.0])[0]
+    polygon = geometry.to_unit_vectors([39.0, 39.0, 41.0, 41.0], [-71.0, -69.0, -69.0, -71.0])
+    points = geometry.to_unit_vectors([40.0, 42.0, -40.0], [-70.0, -70.0, 110.0])
+    polygon2d, _ = geometry.gnomonic(polygon, center)
+    points2d, valid = geometry.gnomonic(points, center)
+    assert valid.tolist() == [True, True, False]
+    assert geometry.points_in_polygon(points2d[valid], polygon2d).tolist() == [True, False]
@@ -0,0 +1,96 @@
+import configparser
+import datetime
+import os
+
+import numpy as np
+from sqlalchemy.orm.session import Session
+
+from AviationWeather import hazards
+from AviationWeather.advisories import AdvisorySnapshot
+from AviationWeather.hazards import HazardGrid
+from AviationWeather.routes import Route
+from AviationWeather.sql_classes import AirSigmet, Points
+
+ROUTE = Route([0.0, 0.0, 10.0], [0.0, 3.0, 3.0])
+
+
+def box(lat: float, lon: float, hazard: str = 'TURB', low=None, high=None) -> AirSigmet:
+    return AirSigmet(
+        hazard__type=hazard,
+        altitude__min_ft_msl=low,
+        altitude__max_ft_msl=high,
+        valid_time_to=datetime.datetime.utcnow() + datetime.timedelta(hours=2),
+        area=[
+            Points(latitude=lat + dlat, longitude=lon + dlon)
+            for dlat, dlon in ((-1, 0), (-1, 1), (1, 1), (1, 0))
+        ],
+    )
+
+
+def test_positive_segments():
+    grid = HazardGrid.build(AdvisorySnapshot([box(0, 1, low=0, high=12000), box(5, 20, hazard='ICE')]))
+    assert grid.hazards == ['ICE', 'TURB']
+    assert grid.positive_segments(ROUTE).tolist() == [True, False]
+    low, high = np.full(2, 30000.0), np.full(2, 35000.0)
+    assert grid.positive_segments(ROUTE, low, high).tolist() == [False, False]
+    assert grid.positive_segments(ROUTE, hazards={'ICE'}).tolist() == [False, False]
+    assert grid.hazards_along(ROUTE) == ['TURB']
+
+
+def test_band_edge():
+    # Level segments flown exactly on a band edge, such as FL300.
+    airsig = box(40, -90, low=25000, high=35000)
+    route = Route([40.0, 40.0, 40.0, 40.0], [-110.0, -105.0, -75.0, -70.0])
+    exact = AdvisorySnapshot([airsig])
+    fast = AdvisorySnapshot([airsig])
+    fast.grid = HazardGrid.build(exact)
+    for altitude in (30000.0, 31000.0, 35000.0):
+        assert exact.find_indexes(route, altitude=altitude).tolist() == [0]
+        assert fast.find_indexes(route, altitude=altitude).tolist() == [0]
+    grid = HazardGrid.build(AdvisorySnapshot([box(0, 1, low=0, high=18000)]))
+    level = np.full(2, 18000.0)
+    assert grid.positive_segments(ROUTE, level, level).tolist() == [True, False]
+
+
+def test_antimeridian():
+    grid = HazardGrid.build(AdvisorySnapshot([box(0, 179.5)]))
+    assert grid.positive_segments(Route([0.0, 0.0], [178.0, -178.0])).tolist() == [True]
+    assert grid.positive_segments(Route([5.0, 5.0], [178.0, -178.0])).tolist() == [False]
+
+
+def test_grid_matches_exact():
+    rng = np.random.RandomState(0)
+    airsigs = [box(lat, lon) for lat, lon in zip(rng.uniform(-10, 10, 20), rng.uniform(-10, 10, 20))]
+    exact = AdvisorySnapshot(airsigs)
+    fast = AdvisorySnapshot(airsigs)
+    fast.grid = HazardGrid.build(exact)
+    for _ in range(20):
+        route = Route(rng.uniform(-12, 12, 4), rng.uniform(-12, 12, 4))
+        assert fast.find_indexes(route).tolist() == exact.find_indexes(route).tolist()
+    assert fast.find_indexes(Route([40.0, 41.0], [0.0, 1.0])).tolist() == []
+
+
+def test_save_and_load(tmpdir):
+    grid = HazardGrid.build(AdvisorySnapshot([box(0, 1)], generation=4))
+    assert HazardGrid.load(str(tmpdir)) is None
+    grid.save(str(tmpdir))
+    loaded = HazardGrid.load(str(tmpdir))
+    assert isinstance(loaded.bits, np.memmap)
+    assert (loaded.generation, loaded.hazards, loaded.resolution) == (4, ['TURB'], hazards.DEFAULT_RESOLUTION)
+    assert loaded.positive_segments(ROUTE).tolist() == [True, False]
+
+
+def test_update_hazard_grid(dbsession: Session, tmpdir):
+    dbsession.add(box(0, 1))
+    dbsession.flush()
+    config = configparser.ConfigParser()
+    config.read_dict({
+        'cache': {'path': str(tmpdir)},
+        'hazard_grid': {'resolution': '0.5', 'altitude_bands': '18000'},
+    })
+    assert hazards.load_hazard_grid(config) is None
+    grid = hazards.update_hazard_grid(config, dbsession, 7)
+    assert grid.bits.shape == (2, 360, 90)
+    assert os.path.exists(os.path.join(str(tmpdir), hazards.GRID_FILE))
+    config['hazard_grid']['enabled'] = 'true'
+    assert hazards.load_hazard_grid(config).generation == 7
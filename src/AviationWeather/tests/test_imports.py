@@ -0,0 +1,59 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import AviationWeather
+
+# Cumulative import time budgets in milliseconds, from python -X importtime, with plenty
+# of headroom. The package and the console script module import nothing heavy, and the
+# converter doesn't need the FlightAware client or the route geometry.
+IMPORT_BUDGETS_MS = {
+    'AviationWeather': 50,
+    'AviationWeather.__main__': 50,
+    'AviationWeather.converter': 500,
+    'AviationWeather.calculations': 1200,
+}
+NOT_IMPORTED = {
+    'AviationWeather': {'sqlalchemy', 'zeep', 'pygeodesy', 'numpy', 'lxml', 'requests'},
+    'AviationWeather.__main__': {'sqlalchemy', 'zeep', 'pygeodesy', 'numpy', 'lxml', 'requests'},
+    'AviationWeather.converter': {'zeep', 'pygeodesy', 'numpy', 'requests', 'AviationWeather.calculations'},
+}
+RUNS = 3
+
+
+def import_time(module: str):
+    """
+    Import a module in a fresh interpreter.
+
+    :return: Its cumulative import time in milliseconds, and the modules imported.
+    """
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(AviationWeather.__file__)))
+    code = f'import sys, {module}; print(" ".join(sys.modules))'
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, universal_newlines=True, check=True,
+    )
+    cumulative = 0
+    for line in result.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == module:
+            cumulative = int(fields[1])
+    return cumulative / 1000, set(result.stdout.split())
+
+
+@pytest.mark.parametrize('module', sorted(IMPORT_BUDGETS_MS))
+def test_import_budget(module):
+    timings = []
+    for _ in range(RUNS):
+        milliseconds, modules = import_time(module)
+        timings.append(milliseconds)
+        assert not NOT_IMPORTED.get(module, set()) & modules
+    assert min(timings) < IMPORT_BUDGETS_MS[module]
+
+
+def test_lazy_submodules():
+    assert AviationWeather.calculations.__name__ == 'AviationWeather.calculations'
+    with pytest.raises(AttributeError):
+        AviationWeather.missing
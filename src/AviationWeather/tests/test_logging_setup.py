@@ -0,0 +1,66 @@
+import configparser
+import io
+import logging
+import os
+
+import pytest
+
+from AviationWeather import logging_setup
+
+
+@pytest.fixture
+def restore_logging():
+    yield
+    logging_setup.shutdown()
+    logging.getLogger('AviationWeather.tests').setLevel(logging.NOTSET)
+
+
+def queue_handlers():
+    return [x for x in logging.getLogger().handlers if isinstance(x, logging_setup.QueueHandler)]
+
+
+def test_parse_levels():
+    assert logging_setup.parse_levels('') == {}
+    assert logging_setup.parse_levels('AviationWeather.calculations:debug, zeep:WARNING') == {
+        'AviationWeather.calculations': logging.DEBUG,
+        'zeep': logging.WARNING,
+    }
+    with pytest.raises(ValueError):
+        logging_setup.parse_levels('zeep:LOUD')
+
+
+def test_setup_once(restore_logging):
+    config = configparser.ConfigParser()
+    config.read_dict({'logging': {'environment': 'development', 'levels': 'AviationWeather.tests:INFO'}})
+    listener = logging_setup.setup(config)
+    assert logging_setup.setup(config) is listener
+    assert len(queue_handlers()) == 1
+    assert logging.getLogger('AviationWeather.tests').level == logging.INFO
+
+
+def test_configure_logging(restore_logging):
+    stream = io.StringIO()
+    logging_setup.configure_logging(logging.StreamHandler(io.StringIO()))
+    logging_setup.configure_logging(logging.StreamHandler(stream), levels={'AviationWeather.tests': logging.INFO})
+    assert len(queue_handlers()) == 1
+
+    logger = logging.getLogger('AviationWeather.tests')
+    logger.debug('hidden')
+    logger.info('shown %s', 1)
+    logging_setup.shutdown()
+    assert not queue_handlers()
+    lines = stream.getvalue().splitlines()
+    assert len([x for x in lines if 'shown 1' in x]) == 1
+    assert not any('hidden' in x for x in lines)
+
+
+def test_file_logging(tmpdir, restore_logging):
+    config = configparser.ConfigParser()
+    config.read_dict({'logging': {'environment': 'production', 'logpath': str(tmpdir.join('logs'))}})
+    logging_setup.setup(config)
+    logging.getLogger('AviationWeather.tests').warning('not an error')
+    logging.getLogger('AviationWeather.tests').error('an error')
+    logging_setup.shutdown()
+    with open(os.path.join(str(tmpdir), 'logs', 'errors.log')) as file:
+        text = file.read()
+    assert 'an error' in text and 'not an error' not in text
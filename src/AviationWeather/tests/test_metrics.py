@@ -0,0 +1,37 @@
+from AviationWeather import metrics
+
+
+def test_record():
+    metrics.reset()
+    metrics.record('query', 2.0)
+    metrics.record('query', 1.0)
+    timing = metrics.snapshot()['query']
+    assert {x: timing[x] for x in ('count', 'total', 'last', 'max')} == {
+        'count': 2, 'total': 3.0, 'last': 1.0, 'max': 2.0
+    }
+    assert timing['buckets']['1.0'] == 1
+    assert timing['buckets']['2.5'] == 1
+    assert sum(timing['buckets'].values()) == 2
+
+
+def test_percentiles():
+    metrics.reset()
+    for _ in range(98):
+        metrics.record('query', 0.004)
+    metrics.record('query', 0.02)
+    metrics.record('query', 30.0)
+    timing = metrics.snapshot()['query']
+    assert timing['p50'] == 0.005
+    assert timing['p90'] == 0.005
+    assert timing['p99'] == 0.025
+    assert timing['buckets']['+Inf'] == 1
+    metrics.reset()
+    metrics.record('query', 0.003)
+    assert metrics.snapshot()['query']['p99'] == 0.003
+
+
+def test_timer():
+    metrics.reset()
+    with metrics.timer('block'):
+        pass
+    assert metrics.snapshot()['block']['count'] == 1
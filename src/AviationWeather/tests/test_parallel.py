@@ -0,0 +1,47 @@
+import datetime
+import os
+
+from AviationWeather.advisories import AdvisorySnapshot
+from AviationWeather.parallel import FlightRoute, IntersectionPool, find_intersecting_many
+from AviationWeather.routes import Route
+from AviationWeather.sql_classes import AirSigmet, Points
+
+DEPARTURE = 1514808000  # 2018-1-1T12:00:00
+
+
+def square(lat: float, lon: float) -> AirSigmet:
+    return AirSigmet(
+        valid_time_from=datetime.datetime.utcfromtimestamp(DEPARTURE),
+        valid_time_to=datetime.datetime.utcfromtimestamp(DEPARTURE + 3600),
+        area=[Points(latitude=lat + a, longitude=lon + b) for a, b in ((0, 0), (0, 1), (1, 1), (1, 0))],
+    )
+
+
+def test_find_intersecting_many():
+    airsigs = [square(lat, lon) for lat in range(-10, 10, 3) for lon in range(-10, 10, 3)]
+    # Every other flight departs after the AirSigmets have expired.
+    flights = [
+        FlightRoute(Route([lat, -lat], [-12, 12]), DEPARTURE + lat % 2 * 7200, DEPARTURE + lat % 2 * 7200 + 3600)
+        for lat in range(-9, 10)
+    ]
+    expected = find_intersecting_many(airsigs, flights, workers=1)
+    assert any(expected) and not all(expected)
+    assert find_intersecting_many(airsigs, flights, workers=2, chunk_size=3) == expected
+
+
+def test_pool_without_workers():
+    airsig = square(-0.5, 0.5)
+    with IntersectionPool(AdvisorySnapshot([airsig]), workers=1) as pool:
+        assert pool.find_intersecting([FlightRoute(Route([0, 0], [0, 2]))]) == [[airsig]]
+
+
+def test_pool_update_keeps_workers():
+    first, second = square(-0.5, 0.5), square(-0.5, 5.5)
+    route = [FlightRoute(Route([0, 0], [0, 2])), FlightRoute(Route([0, 0], [5, 7]))]
+    with IntersectionPool(AdvisorySnapshot([first]), workers=2, chunk_size=1) as pool:
+        assert pool.find_intersecting(route) == [[first], []]
+        workers = pool._pool._pool
+        pool.update(AdvisorySnapshot([second, first]))
+        assert pool.find_intersecting(route) == [[first], [second]]
+        assert pool._pool._pool == workers
+        assert len(os.listdir(pool._root)) == 1
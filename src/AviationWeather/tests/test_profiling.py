@@ -0,0 +1,54 @@
+import json
+import os
+import pstats
+
+import pytest
+
+from AviationWeather import profiling
+
+
+def test_span_disabled():
+    assert not profiling.enabled()
+    assert profiling.span('anything') is profiling.span('else')
+    with profiling.profiled('test', frozenset()) as recorder:
+        assert recorder is None
+        assert not profiling.enabled()
+
+
+def test_profile_option(monkeypatch):
+    monkeypatch.delenv(profiling.PROFILE_ENV, raising=False)
+    assert profiling.profile_option(['calculations', 'taf']) == (['calculations', 'taf'], frozenset())
+    assert profiling.profile_option(['calculations', '--profile', 'taf']) == (
+        ['calculations', 'taf'], frozenset({'spans'})
+    )
+    assert profiling.profile_option(['calculations', '--profile=trace,cprofile'])[1] == {'trace', 'cprofile'}
+    monkeypatch.setenv(profiling.PROFILE_ENV, 'trace')
+    assert profiling.profile_option(['calculations'])[1] == {'trace'}
+    monkeypatch.setenv(profiling.PROFILE_ENV, '0')
+    assert profiling.profile_option(['calculations'])[1] == set()
+    with pytest.raises(ValueError):
+        profiling.parse_modes('flamegraph')
+
+
+def test_profiled(tmpdir, monkeypatch, capsys):
+    monkeypatch.setenv(profiling.PROFILE_DIR_ENV, str(tmpdir))
+    with profiling.profiled('test', frozenset(profiling.MODES)) as recorder:
+        with profiling.span('outer'):
+            for _ in range(3):
+                with profiling.span('inner'):
+                    pass
+    assert not profiling.enabled()
+
+    summary = recorder.summary()
+    assert list(summary) == ['test', 'outer', 'inner']
+    assert summary['inner']['count'] == 3
+    assert 'inner' in capsys.readouterr().err
+
+    files = {os.path.splitext(x)[1]: os.path.join(str(tmpdir), x) for x in os.listdir(str(tmpdir))}
+    assert set(files) == {'.pstats', '.json'}
+    pstats.Stats(files['.pstats'])
+    with open(files['.json']) as file:
+        events = json.load(file)['traceEvents']
+    assert [x['name'] for x in events].count('inner') == 3
+    outer = next(x for x in events if x['name'] == 'outer')
+    assert all(outer['ts'] <= x['ts'] <= outer['ts'] + outer['dur'] for x in events if x['name'] == 'inner')
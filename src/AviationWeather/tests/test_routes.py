@@ -0,0 +1,59 @@
+import pickle
+
+import numpy as np
+from pygeodesy.sphericalNvector import LatLon
+
+from AviationWeather.routes import Route, as_route
+
+
+def test_from_segments():
+    segments = [(LatLon(0, 0), LatLon(0, 1)), (LatLon(0, 1), LatLon(0, 4))]
+    route = Route.from_segments(segments)
+    assert len(route) == 2
+    assert route.lats.tolist() == [0, 0, 0]
+    assert route.lons.tolist() == [0, 1, 4]
+    assert route.segments() == segments
+    assert as_route(segments) == route
+    assert as_route(route) is route
+    np.testing.assert_allclose(route.distance_nm, 240.2, atol=0.1)
+    np.testing.assert_allclose(route.normals, [[0, 0, 1], [0, 0, 1]], atol=1e-12)
+
+
+def test_serialization():
+    route = Route.from_waypoints([{'latitude': 40.6, 'longitude': -73.8}, {'latitude': 33.9, 'longitude': -118.4}])
+    assert Route.from_bytes(route.to_bytes()) == route
+    assert pickle.loads(pickle.dumps(route)) == route
+
+
+def test_empty_route():
+    route = Route.from_waypoints([{'latitude': 40.6, 'longitude': -73.8}])
+    assert not route
+    assert route.distance_nm == 0
+    assert Route.from_segments([]).segments() == []
+
+
+def test_bboxes():
+    # A great circle from New York to Tokyo passes far north of both.
+    route = Route([40.6, 35.8], [-73.8, 140.4])
+    lat_min, lat_max, lon_min, lon_max = route.bboxes[0]
+    assert lat_min == 35.8
+    assert 69 < lat_max < 70
+    assert (lon_min, lon_max) == (-180, 180)
+    route = Route([0, 0], [10, 20])
+    np.testing.assert_allclose(route.bboxes[0], [0, 0, 10, 20], atol=1e-9)
+
+
+def test_segment_windows():
+    route = Route([0, 0, 0], [0, 1, 4])
+    enter, leave = route.segment_windows(1000, 2000)
+    np.testing.assert_allclose(enter, [1000, 1250])
+    np.testing.assert_allclose(leave, [1250, 2000])
+
+
+def test_altitude_bands():
+    route = Route([0, 0, 0, 0], [0, 1, 9, 10])
+    low, high = route.altitude_bands(30000)
+    # 60nm per degree, so the aircraft is at 20000ft after the first segment and reaches
+    # 30000ft after 90nm.
+    np.testing.assert_allclose(low, [0, 20000, 0], atol=50)
+    np.testing.assert_allclose(high, [20000, 30000, 20000], atol=50)
@@ -0,0 +1,79 @@
+import configparser
+import datetime
+import json
+
+import pytest
+
+from AviationWeather import serialization
+from AviationWeather.sql_classes import AirSigmet, Forecast, IcingCondition, Points, SkyCondition, Taf
+
+
+def make_taf() -> Taf:
+    taf = Taf(
+        id=7,
+        station_id='KBOS',
+        issue_time=datetime.datetime(2019, 3, 3, 12, 0),
+        valid_time_from=datetime.datetime(2019, 3, 3, 12, 0, tzinfo=datetime.timezone.utc),
+    )
+    taf.forecast = [Forecast(
+        id=3,
+        parent_id=7,
+        wind_speed_kt=12,
+        sky_condition=[SkyCondition(sky_cover='OVC', cloud_base_ft_agl=800)],
+        icing_condition=[IcingCondition(icing_intensity='5')],
+    )]
+    return taf
+
+
+def test_nested_children():
+    result = serialization.serialize(make_taf())
+    assert result == {
+        'station_id': 'KBOS',
+        'issue_time': 1551614400.0,
+        'valid_time_from': 1551614400.0,
+        'forecast': [{
+            'wind_speed_kt': 12,
+            'sky_condition': [{'sky_cover': 'OVC', 'cloud_base_ft_agl': 800}],
+            'turbulence_condition': [],
+            'icing_condition': [{'icing_intensity': '5'}],
+        }],
+    }
+    assert Taf.__dict__.get('__json_exclude__') is None
+    assert Forecast.__json_exclude__ == {'taf'}
+
+
+def test_airsigmet_area():
+    airsig = AirSigmet(hazard__type='TURB', area=[Points(latitude=1.0, longitude=2.0)])
+    assert serialization.serialize([airsig]) == [
+        {'hazard__type': 'TURB', 'area': [{'latitude': 1.0, 'longitude': 2.0}]}
+    ]
+
+
+def test_iso_timestamps():
+    result = serialization.serialize({'taf': make_taf()}, serialization.ISO)
+    assert result['taf']['issue_time'] == '2019-03-03T12:00:00+00:00'
+    assert result['taf']['valid_time_from'] == '2019-03-03T12:00:00+00:00'
+
+
+@pytest.mark.parametrize('backend', ['json', 'orjson'])
+def test_dumps(backend):
+    if backend == 'orjson':
+        pytest.importorskip('orjson')
+    data = {'departure': [make_taf()], 'arrival': []}
+    result = serialization.dumps(data, backend=backend)
+    assert json.loads(result) == serialization.serialize(data)
+    assert result == serialization.dumps(data, backend='json')
+
+
+def test_dumps_invalid_options():
+    with pytest.raises(ValueError):
+        serialization.dumps([], timestamps='unix')
+    with pytest.raises(ValueError):
+        serialization.dumps([], backend='yaml')
+
+
+def test_output_options():
+    config = configparser.ConfigParser()
+    assert serialization.output_options(config) == {'timestamps': 'epoch', 'backend': None}
+    config.read_dict({'output': {'timestamps': 'iso', 'json_backend': 'json'}})
+    assert serialization.output_options(config) == {'timestamps': 'iso', 'backend': 'json'}
@@ -0,0 +1,147 @@
+import configparser
+import datetime
+import json
+
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.orm.session import Session
+
+from AviationWeather import service
+from AviationWeather.hazards import HazardGrid
+from AviationWeather.sql_classes import AirSigmet, Generation, Metar
+from AviationWeather.tests.test_batch import MockClient
+
+
+def request(app, path, query=''):
+    response = {}
+
+    def start_response(status, headers):
+        response['status'] = status
+
+    body = b''.join(app({'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query}, start_response))
+    return response['status'], json.loads(body)
+
+
+def make_app(dbsession: Session) -> service.QueryService:
+    return service.QueryService(
+        configparser.ConfigParser(),
+        client=MockClient(),
+        session_factory=scoped_session(sessionmaker(bind=dbsession.bind)),
+    )
+
+
+def test_health(dbsession: Session):
+    assert request(make_app(dbsession), '/health') == ('200 OK', {'status': 'ok'})
+
+
+def test_bad_requests(dbsession: Session):
+    app = make_app(dbsession)
+    assert request(app, '/metar', 'flight=DAL1')[0] == '400 Bad Request'
+    assert request(app, '/airsigmet', 'flight=DAL1&dep=JFK&arr=LAX&corridor=wide')[0] == '400 Bad Request'
+    assert request(app, '/rain', 'flight=DAL1&dep=JFK&arr=LAX')[0] == '404 Not Found'
+
+
+def test_metar_query(dbsession: Session):
+    dbsession.add(Metar(station_id='KJFK'))
+    dbsession.flush()
+    status, body = request(make_app(dbsession), '/metar', 'flight=DAL1&dep=JFK&arr=LAX')
+    assert status == '200 OK'
+    assert body['departure'][0]['station_id'] == 'KJFK'
+    assert body['arrival'] == []
+
+
+
+def test_cached_results_are_json(dbsession: Session):
+    dbsession.add_all([Metar(station_id='KJFK'), Generation(wx_type='metar', generation=1)])
+    dbsession.flush()
+    app = make_app(dbsession)
+    first = request(app, '/metar', 'flight=DAL1&dep=JFK&arr=LAX')
+    assert len(app.results) == 1
+    assert all(isinstance(body, str) for body, _ in app.results._data.values())
+    # A cached body is served without touching the ORM objects it was made from.
+    dbsession.query(Metar).delete()
+    dbsession.flush()
+    assert request(app, '/metar', 'flight=DAL1&dep=JFK&arr=LAX') == first
+
+def test_metar_latest(dbsession: Session):
+    dbsession.add_all([
+        Metar(station_id='KJFK', observation_time=datetime.datetime(2019, 3, 3, hour))
+        for hour in range(3)
+    ])
+    dbsession.flush()
+    app = make_app(dbsession)
+    status, body = request(app, '/metar', 'flight=DAL1&dep=JFK&arr=LAX&latest=1')
+    assert status == '200 OK'
+    assert len(body['departure']) == 1
+    status, body = request(app, '/metar', 'flight=DAL1&dep=JFK&arr=LAX&last=2')
+    assert len(body['departure']) == 2
+    assert request(app, '/metar', 'flight=DAL1&dep=JFK&arr=LAX&last=two')[0] == '400 Bad Request'
+    for last in ('0', '-1', '1.5'):
+        assert request(app, '/metar', f'flight=DAL1&dep=JFK&arr=LAX&last={last}')[0] == '400 Bad Request'
+
+
+def test_taf_not_found(dbsession: Session):
+    status, body = request(make_app(dbsession), '/taf', 'flight=DAL1&dep=JFK&arr=LAX')
+    assert status == '404 Not Found'
+    assert body == {'error': 'No taf found within time range.'}
+
+
+def test_parse_address():
+    config = configparser.ConfigParser()
+    config.read_dict({'service': {'port': '9000'}})
+    assert service.parse_address(['calculations-service'], config) == ('localhost', 9000)
+    assert service.parse_address(['calculations-service', '0.0.0.0', '80'], config) == ('0.0.0.0', 80)
+
+
+def test_airsigmet_snapshot_reloads_on_new_generation(dbsession: Session):
+    generation = Generation(wx_type='airsigmet', generation=1)
+    dbsession.add_all([generation, AirSigmet(valid_time_to=datetime.datetime.utcnow())])
+    dbsession.flush()
+    airsigmets = service.WarmAirSigmets(sessionmaker(bind=dbsession.bind), refresh=0)
+    snapshot = airsigmets.snapshot()
+    assert (len(snapshot), snapshot.generation) == (1, 1)
+    assert not airsigmets.poll()
+    dbsession.add(AirSigmet(valid_time_to=datetime.datetime.utcnow()))
+    generation.generation = 2
+    dbsession.flush()
+    assert airsigmets.snapshot() is not snapshot
+    assert (len(airsigmets.snapshot()), airsigmets.snapshot().generation) == (2, 2)
+
+
+def test_airsigmet_snapshot_hazard_grid(dbsession: Session):
+    generation = Generation(wx_type='airsigmet', generation=1)
+    dbsession.add(generation)
+    dbsession.flush()
+    grids = [HazardGrid.empty(generation=1)]
+    airsigmets = service.WarmAirSigmets(sessionmaker(bind=dbsession.bind), refresh=0, grid_loader=lambda: grids[0])
+    assert airsigmets.snapshot().grid is grids[0]
+    generation.generation = 2
+    dbsession.flush()
+    assert airsigmets.snapshot().grid is None
+    # The converter rasterizes the new AirSigmets after storing them.
+    grids[0] = HazardGrid.empty(generation=2)
+    assert airsigmets.snapshot().grid is grids[0]
+
+
+def test_stations(dbsession: Session, tmp_path):
+    dbsession.add_all([
+        Metar(station_id='KJFK', latitude=40.6398, longitude=-73.7789),
+        Metar(station_id='KLGA', latitude=40.7772, longitude=-73.8726),
+        Metar(station_id='KAAA', latitude=0.5, longitude=1.0),
+    ])
+    dbsession.flush()
+    config = configparser.ConfigParser()
+    config.read_dict({'cache': {'path': str(tmp_path)}})
+    app = service.QueryService(
+        config, client=MockClient(), session_factory=scoped_session(sessionmaker(bind=dbsession.bind)),
+    )
+    status, body = request(app, '/stations', 'lat=40.7&lon=-73.8&radius=10')
+    assert status == '200 OK'
+    assert [x['station_id'] for x in body] == ['KJFK', 'KLGA']
+    status, body = request(app, '/stations', 'lat=40.7&lon=-73.8&nearest=1')
+    assert [x['station_id'] for x in body] == ['KJFK']
+    # MockClient's route runs along the equator from 0E to 2E.
+    status, body = request(app, '/stations', 'flight=DAL1&dep=JFK&arr=LAX&radius=40')
+    assert [x['station_id'] for x in body] == ['KAAA']
+    assert 0 < body[0]['distance_nm'] < 40
+    for query in ('lat=40.7', 'lat=91&lon=0', 'lat=0&lon=0&radius=-1', 'lat=0&lon=0&nearest=0', 'flight=DAL1'):
+        assert request(app, '/stations', query)[0] == '400 Bad Request'
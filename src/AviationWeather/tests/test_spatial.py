@@ -0,0 +1,116 @@
+import configparser
+import threading
+
+import numpy as np
+from sqlalchemy.orm.session import Session
+
+from AviationWeather import spatial
+from AviationWeather.sql_classes import Metar, Taf
+
+
+def sample_index() -> spatial.SpatialIndex:
+    return spatial.SpatialIndex(
+        ['KJFK', 'KLGA', 'KORD', 'KLAX'],
+        [40.6398, 40.7772, 41.9786, 33.9425],
+        [-73.7789, -73.8726, -87.9048, -118.4081],
+    )
+
+
+def test_nearest():
+    codes, distances = sample_index().nearest([40.7, 33.9], [-73.8, -118.4], k=2)
+    assert codes.tolist() == [['KJFK', 'KLGA'], ['KLAX', 'KORD']]
+    assert distances[0, 0] < distances[0, 1]
+
+
+def test_nearest_matches_brute_force():
+    rng = np.random.RandomState(0)
+    # Dense stations over land, a few over the ocean, as in the reporting station index.
+    lats = np.concatenate((rng.uniform(25, 50, 5000), rng.uniform(-80, 80, 200)))
+    lons = np.concatenate((rng.uniform(-125, -65, 5000), rng.uniform(-180, 180, 200)))
+    index = spatial.SpatialIndex([f'S{i}' for i in range(len(lats))], lats, lons)
+    query_lats = np.concatenate((rng.uniform(25, 50, 600), rng.uniform(-89, 89, 300)))
+    query_lons = np.concatenate((rng.uniform(-125, -65, 600), rng.uniform(-180, 180, 300)))
+    codes, distances = index.nearest(query_lats, query_lons, k=3)
+    queries = spatial.geometry.to_unit_vectors(query_lats, query_lons)
+    dots = queries @ index.vectors.T
+    expected = spatial.geometry.radians_to_nm(np.arccos(np.clip(-np.sort(-dots, axis=1)[:, :3], -1, 1)))
+    assert np.allclose(distances, expected, atol=1e-3)
+    assert np.all(index.codes[np.argmax(dots, axis=1)] == codes[:, 0])
+
+
+def test_within():
+    result = sample_index().within([40.7, 0.0], [-73.8, 0.0], 10)
+    assert [code for code, _ in result[0]] == ['KJFK', 'KLGA']
+    assert result[1] == []
+
+
+def test_near_route():
+    result = spatial.SpatialIndex(['A', 'B', 'C'], [0.5, 3.0, 0.0], [5.0, 5.0, 12.0]).near_route(
+        [0.0, 0.0], [0.0, 10.0], 60
+    )
+    assert [code for code, _ in result] == ['A']
+
+
+def test_add_is_incremental():
+    index = sample_index()
+    assert index.add(['KJFK', 'KBOS'], [40.6398, 42.3643], [-73.7789, -71.0052]) == 1
+    assert 'KBOS' in index
+    assert len(index) == 5
+    assert np.all(np.diff(index.lats) >= 0)
+
+
+def test_save_and_load(tmp_path):
+    pth = str(tmp_path / 'stations.npz')
+    index = sample_index()
+    index.save(pth)
+    result = spatial.SpatialIndex.load(pth)
+    assert result.codes.tolist() == index.codes.tolist()
+    index.add(['KBOS'], [42.3643], [-71.0052])
+    index.save(pth)
+    assert len(spatial.SpatialIndex.load(pth)) == 5
+    assert [x.name for x in tmp_path.iterdir()] == ['stations.npz']
+
+
+def test_update_station_index(tmp_path):
+    config = configparser.ConfigParser()
+    config.read_dict({'cache': {'path': str(tmp_path)}})
+    reports = [Metar(station_id='KJFK', latitude=40.6398, longitude=-73.7789)]
+    assert spatial.update_station_index(config, reports) == 1
+    assert spatial.update_station_index(config, reports) == 0
+    assert 'KJFK' in spatial.station_index(config)
+
+
+def test_update_station_index_seeds_from_db(dbsession: Session, tmp_path):
+    config = configparser.ConfigParser()
+    config.read_dict({'cache': {'path': str(tmp_path)}})
+    dbsession.add(Taf(station_id='KRDR', latitude=47.97, longitude=-97.4))
+    dbsession.flush()
+    reports = [Metar(station_id='KJFK', latitude=40.6398, longitude=-73.7789)]
+    assert spatial.update_station_index(config, reports, dbsession) >= 2
+    assert {'KJFK', 'KRDR'} <= set(spatial.station_index(config).codes)
+
+
+def test_concurrent_station_index_updates(tmp_path):
+    config = configparser.ConfigParser()
+    config.read_dict({'cache': {'path': str(tmp_path)}})
+
+    def update(number: int):
+        for i in range(5):
+            spatial.update_station_index(config, [Metar(station_id=f'S{number}-{i}', latitude=i, longitude=number)])
+
+    threads = [threading.Thread(target=update, args=(x,)) for x in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(spatial.station_index(config)) == 20
+
+
+def test_stations_from_db(dbsession: Session):
+    dbsession.add_all([
+        Metar(station_id='KSTK', latitude=40.62, longitude=-103.27),
+        Taf(station_id='KRDR', latitude=47.97, longitude=-97.4),
+    ])
+    dbsession.flush()
+    index = spatial.stations_from_db(dbsession)
+    assert {'KSTK', 'KRDR'} <= set(index.codes)
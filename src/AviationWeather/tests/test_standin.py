@@ -0,0 +1,78 @@
+import configparser
+
+import pytest
+from zeep import Client
+from zeep.exceptions import Fault
+
+from AviationWeather import calculations, standin
+
+
+@pytest.fixture(scope='module')
+def server():
+    server = standin.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(scope='module')
+def client(server):
+    return Client(server.wsdl_url)
+
+
+def test_flights_are_deterministic():
+    generator = standin.FlightGenerator(now=1551650700)
+    flights = generator.flights('DAL124')
+    assert flights == standin.FlightGenerator(now=1551650700).flights('DAL124')
+    assert len(flights) == 3
+    for flight in flights:
+        assert flight['filed_arrival_time']['epoch'] - flight['filed_departure_time']['epoch'] == flight['filed_ete']
+        assert flight['origin']['code'] != flight['destination']['code']
+
+
+def test_invalid_ident():
+    with pytest.raises(standin.Fault):
+        standin.FlightGenerator().flights('not a flight')
+
+
+def test_route_follows_great_circle():
+    generator = standin.FlightGenerator(now=1551650700)
+    flight = generator.flights('UAL1')[0]
+    route = generator.route(flight['faFlightID'])
+    assert route[0]['name'] == flight['origin']['code']
+    assert route[-1]['name'] == flight['destination']['code']
+    assert len(route) >= flight['distance_filed'] / standin.WAYPOINT_SPACING_NM
+
+
+def test_zeep_client(client):
+    flight_info = client.service.FlightInfoStatus('DAL124')
+    assert len(flight_info['flights']) == 3
+    flight = flight_info['flights'][1]
+    route = client.service.DecodeFlightRoute(flight['faFlightID'])
+    assert route['data'][0]['name'] == flight['origin']['code']
+    with pytest.raises(Fault):
+        client.service.DecodeFlightRoute('DAL124-0-standin-0000')
+
+
+def test_calculations_functions(client, server):
+    flight = server.generator.flights('AAL100')[0]
+    faflightid, flight_data = calculations.get_faflightid(
+        client,
+        'AAL100',
+        flight['origin']['alternate_ident'],
+        flight['destination']['alternate_ident'],
+        flight['filed_departure_time']['epoch'],
+    )
+    assert faflightid == flight['faFlightID']
+    segments = calculations.get_flight_route_data(client, faflightid)
+    assert len(segments) == len(server.generator.route(faflightid)) - 1
+
+
+def test_client_from_config(server, tmp_path):
+    config = configparser.ConfigParser()
+    config.read_dict({
+        'flightaware.com': {'wsdl': server.wsdl_url, 'username': 'user', 'api_key': 'key'},
+        'cache': {'path': str(tmp_path)},
+    })
+    client = calculations.create_flightaware_client(config)
+    assert client.service.FlightInfoStatus('SWA5')['flights'][0]['ident'] == 'SWA5'
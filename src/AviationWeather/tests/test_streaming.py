@@ -0,0 +1,142 @@
+import datetime
+import io
+import json
+
+from sqlalchemy.event import listen, remove
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.session import Session
+
+from AviationWeather import calculations, streaming
+from AviationWeather.sql_classes import AirSigmet, Metar, MetarSkyCondition, Points
+from AviationWeather.tests.test_batch import MockClient
+
+
+def add_metars(dbsession: Session, count: int):
+    start = datetime.datetime(2019, 3, 3)
+    dbsession.add_all([
+        Metar(
+            station_id='KORH',
+            observation_time=start + datetime.timedelta(minutes=i),
+            sky_condition=[MetarSkyCondition(sky_cover='FEW', cloud_base_ft_agl=i)],
+        )
+        for i in range(count)
+    ])
+    dbsession.flush()
+    dbsession.expunge_all()
+
+
+def test_json_lines():
+    out = io.StringIO()
+    assert streaming.write_records([{'a': 1}, [2]], out) == 2
+    assert out.getvalue() == '{"a":1}\n[2]\n'
+
+
+def test_json_array():
+    out = io.StringIO()
+    streaming.write_records(iter([{'a': 1}, {'b': 2}]), out, array=True)
+    assert json.loads(out.getvalue()) == [{'a': 1}, {'b': 2}]
+    out = io.StringIO()
+    streaming.write_records([], out, array=True)
+    assert json.loads(out.getvalue()) == []
+
+
+def test_iter_query_chunks(dbsession: Session):
+    add_metars(dbsession, 25)
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    query = dbsession.query(Metar).filter(Metar.station_id == 'KORH').\
+        options(selectinload(Metar.sky_condition)).order_by(Metar.observation_time)
+    listen(dbsession.bind, 'before_cursor_execute', count)
+    out = io.StringIO()
+    written = streaming.write_records(streaming.iter_query(query, chunk_size=10), out)
+    remove(dbsession.bind, 'before_cursor_execute', count)
+    assert written == 25
+    # A Metar query and a sky condition query per chunk.
+    assert len(statements) == 2 * 3
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [x['sky_condition'][0]['cloud_base_ft_agl'] for x in records] == list(range(25))
+
+
+
+def test_iter_chunks_by_key(dbsession: Session):
+    add_metars(dbsession, 25)
+    query = dbsession.query(Metar).filter(Metar.station_id == 'KORH').order_by(Metar.observation_time.desc())
+    chunks = list(streaming.iter_chunks(query, chunk_size=10, key=Metar.id))
+    assert [len(x) for x in chunks] == [10, 10, 5]
+    ids = [x.id for chunk in chunks for x in chunk]
+    assert ids == sorted(ids) and len(set(ids)) == 25
+    assert list(streaming.iter_chunks(query.filter(Metar.id < 0), key=Metar.id)) == []
+
+
+def test_iter_flight_weather_airsigmets(dbsession: Session, monkeypatch):
+    departure = 1514808000
+    window = dict(
+        valid_time_from=datetime.datetime.utcfromtimestamp(departure),
+        valid_time_to=datetime.datetime.utcfromtimestamp(departure + 3600),
+    )
+    dbsession.add_all([
+        AirSigmet(area=[Points(latitude=lat, longitude=lon) for lat, lon in area], **window)
+        for area in (
+            [(1, 1), (-1, 1), (-1, 1.5)],
+            [(10, 10), (11, 10), (11, 11)],
+            [(1, 0.5), (-1, 0.5), (-1, 0.8)],
+        )
+    ])
+    dbsession.flush()
+    checked = []
+    find_intersecting_airsigs = calculations.find_intersecting_airsigs
+
+    def check(airsigs, *args):
+        checked.append(len(airsigs))
+        return find_intersecting_airsigs(airsigs, *args)
+
+    monkeypatch.setattr(calculations, 'find_intersecting_airsigs', check)
+    flight_data = {
+        'origin': {'code': 'KJFK'},
+        'destination': {'code': 'KLAX'},
+        'filed_departure_time': {'epoch': departure},
+        'filed_arrival_time': {'epoch': departure + 3600},
+    }
+    records = calculations.iter_flight_weather(
+        'airsigmet', 'STREAM1-0', flight_data, MockClient(), dbsession, chunk_size=2
+    )
+    assert [x.area[0].longitude for x in records] == [1, 0.5]
+    # One snapshot per chunk of AirSigmets.
+    assert checked == [2, 1]
+
+
+def test_iter_query_by_compound_key(dbsession: Session):
+    add_metars(dbsession, 7)
+    dbsession.add_all([Metar(station_id='KORH') for _ in range(3)])
+    dbsession.flush()
+    query = dbsession.query(Metar).filter(Metar.station_id == 'KORH')
+    key = (Metar.observation_time, Metar.id)
+    expected = [x.id for x in query.order_by(Metar.observation_time.desc(), Metar.id.desc())]
+    records = streaming.iter_query(query, chunk_size=2, key=key, descending=True)
+    assert [x.id for x in records] == expected
+    assert [x.id for x in streaming.iter_query(query, chunk_size=2, key=key)] == expected[::-1]
+    # Rows added while streaming don't shift the rest of the stream.
+    records = streaming.iter_query(query, chunk_size=2, key=key, descending=True)
+    first = next(records)
+    dbsession.add(Metar(station_id='KORH', observation_time=datetime.datetime(2020, 1, 1)))
+    dbsession.flush()
+    assert [first.id] + [x.id for x in records] == expected
+
+def test_iter_flight_weather_metars(dbsession: Session):
+    add_metars(dbsession, 5)
+    flight_data = {'origin': {'code': 'KORH'}, 'destination': {'code': 'KBOS'}}
+    records = calculations.iter_flight_weather(
+        'metar', 'ABC1-0', flight_data, None, dbsession, limit=2, chunk_size=1
+    )
+    assert [x.sky_condition[0].cloud_base_ft_agl for x in records] == [4, 3]
+
+
+def test_stream_option():
+    assert calculations.stream_option(['calculations', 'metar', '--stream']) == (
+        ['calculations', 'metar'], streaming.LINES
+    )
+    assert calculations.stream_option(['calculations', '--stream-array'])[1] == streaming.ARRAY
+    assert calculations.stream_option(['calculations'])[1] is None